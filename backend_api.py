@@ -1,27 +1,40 @@
 # backend_api.py
-from flask import Flask, request, jsonify
 from ortools.sat.python import cp_model
 import collections
+import contextlib
+import copy
+import functools
+import hashlib
+import io
+import json
 import math # 用於向上取整
+import re
+import time
+import threading
+
+import numpy as np
+
+from heuristic import build_heuristic_schedule, check_hard_rules
+from presolve import analyze as analyze_instance, unfilled_units
+import solver_policy
 
 # --- 輔助函數 (time_to_slot, slot_to_time_str, parse_time_range) ---
 # (假設這些函數已存在且功能正確，特別是 parse_time_range 支持 HH:MM-HH:MM 或 HH:MM–HH:MM)
-def time_to_slot(time_str):
+def time_to_slot(time_str, slot_minutes=30):
     try:
         h, m = map(int, time_str.split(':'))
-        # 允許小時 >= 24
-        return h * 2 + m // 30
+        # 允許小時 >= 24；不在時隙邊界上的時間向下取整
+        return (h * 60 + m) // slot_minutes
     except ValueError:
         # 在 API 層面不直接調用 st.error，而是返回錯誤或記錄日誌
         print(f"時間格式錯誤: '{time_str}'")
         return None
 
-def slot_to_time_str(slot_index):
-    h = slot_index // 2
-    m = (slot_index % 2) * 30
+def slot_to_time_str(slot_index, slot_minutes=30):
+    h, m = divmod(slot_index * slot_minutes, 60)
     return f"{h:02d}:{m:02d}"
 
-def parse_time_range(range_str, context_for_error="時段"):
+def parse_time_range(range_str, context_for_error="時段", slot_minutes=30):
     try:
         separator = None
         if '–' in range_str: # EN DASH
@@ -33,8 +46,8 @@ def parse_time_range(range_str, context_for_error="時段"):
             raise ValueError("範圍中未找到有效的分隔符 ('–' 或 '-')。")
 
         start_str, end_str = range_str.split(separator)
-        start_slot = time_to_slot(start_str.strip())
-        end_slot = time_to_slot(end_str.strip())
+        start_slot = time_to_slot(start_str.strip(), slot_minutes)
+        end_slot = time_to_slot(end_str.strip(), slot_minutes)
 
         if start_slot is None or end_slot is None:
              # time_to_slot 返回 None 時已打印錯誤
@@ -49,6 +62,100 @@ def parse_time_range(range_str, context_for_error="時段"):
 # --- 常量 ---
 REST_R_CODE = 0
 FIRST_JOB_CODE = 1
+# 崗位代碼的後綴 "*N" 表示該崗位每個時隙需要 N 人 (例如 "收銀*2 09:00-12:00")，省略時為 1 人
+JOB_COUNT_SUFFIX = re.compile(r"^(.+)\*(\d+)$")
+# 可選的時隙長度 (分鐘)；必須整除 60，時間字符串才能與時隙一一對應
+SLOT_DURATIONS = (30, 15, 10, 5)
+# 可選建模方式："integer" 為原有的整數 task 變量模型，"boolean" 為 one-hot 布爾變量模型
+MODEL_BUILDERS = ("integer", "boolean")
+
+# 對稱性破除："auto" 在員工可互換時自動啟用字典序約束，"lex" 強制啟用，"none" 關閉
+SYMMETRY_BREAKING_MODES = ("auto", "lex", "none")
+# 基準測試 (python -m benchmarks.symmetry) 顯示人數少時 CP-SAT 自帶的對稱檢測已足夠，額外的字典序約束反而拖慢求解
+SYMMETRY_BREAKING_AUTO_MIN_EMPLOYEES = 10
+
+# CP-SAT 默認時間上限 (秒)，須小於 gunicorn 的請求超時
+DEFAULT_TIME_LIMIT_SECONDS = 115.0
+
+# 求解引擎："exact" 為 CP-SAT (以啟發式解作為初始提示)，"fast" 只運行毫秒級構造式啟發式，
+# "interval" 為以可選工作段 (IntervalVar) 建模的 CP-SAT，規模隨工作段數而非時隙數增長，適合 15/10/5 分鐘時隙
+ENGINES = ("exact", "fast", "interval")
+
+# 可被守衛文字單獨關閉的硬性規則族 (診斷不可行原因及自動放寬時使用)
+RULE_FAMILIES = {
+    "rule1_max_consecutive": "硬性規則 1: 最大連續工作時間",
+    "rule1_rest_after": "硬性規則 1: 連續工作達上限後的強制休息",
+    "rule2_same_job": "硬性規則 2: 連續工作必須同一崗位",
+    "rule3_mandatory_break": "硬性規則 3: 強制落場",
+    "rule5_balance": "規則 5: 工作量平衡 (+-1)",
+    "fixed_assignments": "固定安排",
+}
+
+# 建模結果：CP-SAT 模型、(員工, 時隙) 的工作文字 (區間引擎為 None)、讀取整張排班 task_values[e][s] 的函數 task_values(solver)、
+# 把 task_values[e][s] 形式的排班寫成求解提示的函數 add_hint(task_values)，
+# 以及返回「該格不等於給定值」的文字或常數的函數 cell_differs(e, s, value) (最小改動目標用，區間引擎為 None)
+_BuiltModel = collections.namedtuple("_BuiltModel", ["model", "is_work", "task_values", "add_hint", "cell_differs"])
+
+def _stints_from_row(row):
+    # 把一位員工的 task 值序列切成工作段 [(start, end, job_int), ...]，end 不含
+    stints = []
+    for s, value in enumerate(row):
+        if value == REST_R_CODE: continue
+        if stints and stints[-1][1] == s and stints[-1][2] == value: stints[-1][1] = s + 1
+        else: stints.append([s, s + 1, value])
+    return [tuple(stint) for stint in stints]
+
+class _ProgressCallback(cp_model.CpSolverSolutionCallback):
+    # CP-SAT 每找到一個更好的解就回調一次；task_values 同樣適用於回調對象 (兩者都提供 Value/BooleanValue)
+    def __init__(self, scheduler, built, lower_bound):
+        super().__init__()
+        self.scheduler, self.built, self.lower_bound = scheduler, built, lower_bound
+
+    def on_solution_callback(self):
+        sch = self.scheduler
+        task_values = self.built.task_values(self)
+        sch._emit_progress(task_values, self.ObjectiveValue(), max(self.lower_bound, self.BestObjectiveBound()))
+
+def _merge_ranges(ranges):
+    # 合併重疊或相接的 [開始, 結束) 區間，返回按開始排序的列表
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]: merged[-1][1] = max(merged[-1][1], end)
+        else: merged.append([start, end])
+    return merged
+
+@functools.lru_cache(maxsize=128)
+def parse_job_requirements(job_requirements_raw, schedule_start_slot, schedule_end_slot, slot_minutes=30):
+    """解析崗位需求文本，返回 (崗位代碼元組, 需求矩陣)。需求矩陣為只讀的 NumPy 整數數組，形狀為 (崗位數, 時隙數)，
+    第 i 行對應崗位整數編碼 FIRST_JOB_CODE + i，值為該時隙需要的人數；同一崗位重疊的時段取較大的人數。結果可安全共用。"""
+    num_slots = schedule_end_slot - schedule_start_slot
+    job_code_to_int = {}; ranges_by_count = collections.defaultdict(list) # (崗位整數編碼, 人數) -> [(開始, 結束)] 相對時隙
+    for req_line_idx, req_line in enumerate(job_requirements_raw):
+        req_line_stripped = req_line.strip()
+        if not req_line_stripped: continue
+        parts = req_line_stripped.split(" ", 1)
+        if len(parts) < 2: raise ValueError(f"崗位需求第 {req_line_idx+1} 行 '{req_line_stripped}' 格式錯誤: 應為 '代碼 時段1,...'")
+        job_code_str = parts[0]; time_ranges_str = parts[1]; count = 1
+        count_match = JOB_COUNT_SUFFIX.match(job_code_str)
+        if count_match:
+            job_code_str, count = count_match.group(1), int(count_match.group(2))
+            if count < 1: raise ValueError(f"崗位需求第 {req_line_idx+1} 行 '{parts[0]}' 的需求人數必須至少為 1。")
+        if job_code_str not in job_code_to_int: job_code_to_int[job_code_str] = FIRST_JOB_CODE + len(job_code_to_int)
+        ranges = ranges_by_count[job_code_to_int[job_code_str], count]
+        for time_range_idx, time_range in enumerate(time_ranges_str.split(',')):
+            time_range_stripped = time_range.strip()
+            if not time_range_stripped: continue
+            context = f"崗位 '{job_code_str}' 的第 {time_range_idx+1} 個時段"
+            start_abs, end_abs = parse_time_range(time_range_stripped, context, slot_minutes)
+            if end_abs <= start_abs: raise ValueError(f"{context} '{time_range_stripped}'：結束時間必須晚於開始時間。")
+            start_rel, end_rel = max(start_abs, schedule_start_slot) - schedule_start_slot, min(end_abs, schedule_end_slot) - schedule_start_slot
+            if start_rel < end_rel: ranges.append((start_rel, end_rel))
+    # 每個合併後的區間只做一次切片賦值；人數從小到大寫入，重疊處留下較大的人數
+    demand = np.zeros((len(job_code_to_int), num_slots), dtype=np.int32)
+    for (job_int, count), ranges in sorted(ranges_by_count.items(), key=lambda item: item[0][1]):
+        for start, end in _merge_ranges(ranges): demand[job_int - FIRST_JOB_CODE, start:end] = count
+    demand.setflags(write=False)
+    return tuple(job_code_to_int), demand
 
 # --- 排班核心邏輯類 (ShiftSchedulerWithConstraints) ---
 # (將之前的 ShiftSchedulerGlobalBreak 類的邏輯放在這裡，並進行修改)
@@ -63,36 +170,40 @@ class ShiftSchedulerWithConstraints:
                  rest_duration_minutes_after_work, # <--- 新增參數
                  enable_mandatory_break,
                  designated_global_break_period_str,
-                 min_mandatory_break_minutes
+                 min_mandatory_break_minutes,
+                 slot_duration_minutes=30,
+                 fixed_assignments=None, # {"K1": {"HH:MM": 崗位代碼或 "R"}}：固定某些格子的安排 (例如已確認的排班)
+                 prior_work_counts=None # 每位員工在此之前已工作的格數，規則 5 按累計值平衡 (多日排班)
                 ):
+        parse_started = time.perf_counter()
         self.num_employees = K_employees
+        if slot_duration_minutes not in SLOT_DURATIONS:
+            raise ValueError(f"時隙長度 {slot_duration_minutes} 分鐘無效，可選: {', '.join(map(str, SLOT_DURATIONS))}。")
+        self.slot_duration_minutes = slot_duration_minutes
 
         # 1. 解析排班總時段 (這部分不變)
         # ... (你已有的代碼) ...
-        parsed_schedule_start_slot, parsed_schedule_end_slot = parse_time_range(schedule_period_str, "排班總時段")
+        parsed_schedule_start_slot, parsed_schedule_end_slot = parse_time_range(schedule_period_str, "排班總時段", self.slot_duration_minutes)
         self.schedule_start_slot, self.schedule_end_slot = parsed_schedule_start_slot, parsed_schedule_end_slot
         self.num_slots = self.schedule_end_slot - self.schedule_start_slot
         if self.num_slots <= 0:
             raise ValueError(f"排班時段 '{schedule_period_str}' 無效。結束時間的小時數在跨天時應 >=24。")
 
-        # 2. 處理排班約束條件轉換 (這部分不變，除了新增的)
-        self.slot_duration_minutes = 30
+        # 2. 處理排班約束條件轉換 (時隙長度見 slot_duration_minutes)
         self.max_consecutive_work_slots = math.ceil(max_consecutive_work_minutes / self.slot_duration_minutes)
         if self.max_consecutive_work_slots <= 0:
              raise ValueError("最大連續工作時間必須大於0分鐘。")
 
         # --- 新增：計算連續工作達到上限後的強制休息格數 ---
-        if rest_duration_minutes_after_work == 30:
-            self.rest_slots_after_consecutive_work = 1
-        elif rest_duration_minutes_after_work == 60:
-            self.rest_slots_after_consecutive_work = 2
+        if rest_duration_minutes_after_work in (30, 60):
+            self.rest_slots_after_consecutive_work = math.ceil(rest_duration_minutes_after_work / self.slot_duration_minutes)
         else:
             # API 層面應該已經驗證了，但作為備份，可以設置一個默認值或再次拋出錯誤
             # 根據題目要求，值只會是 30 或 60
             # 假設如果傳入無效值，默認為30分鐘/1格 (或者更嚴格地拋出ValueError)
             print(f"警告: 無效的 rest_duration_minutes_after_work ({rest_duration_minutes_after_work})，"
-                  f"將默認為1格 (30分鐘)。API應確保此值有效。")
-            self.rest_slots_after_consecutive_work = 1
+                  f"將默認為30分鐘。API應確保此值有效。")
+            self.rest_slots_after_consecutive_work = math.ceil(30 / self.slot_duration_minutes)
         
         print(f"調試信息: max_consecutive_work_slots = {self.max_consecutive_work_slots}, "
               f"rest_slots_after_consecutive_work = {self.rest_slots_after_consecutive_work}")
@@ -113,7 +224,7 @@ class ShiftSchedulerWithConstraints:
             if not designated_global_break_period_str or not designated_global_break_period_str.strip():
                  raise ValueError("啟用強制落場時，必須指定全局落場時段。")
 
-            abs_break_start, abs_break_end = parse_time_range(designated_global_break_period_str, "全局落場時段")
+            abs_break_start, abs_break_end = parse_time_range(designated_global_break_period_str, "全局落場時段", self.slot_duration_minutes)
             # if abs_break_start is None or abs_break_end is None:
             #      raise ValueError(f"必要參數錯誤：全局落場時段 '{designated_global_break_period_str}'。")
 
@@ -126,38 +237,93 @@ class ShiftSchedulerWithConstraints:
                                           f"(排班表內相對時段 {self.global_consecutive_break_start_rel} 至 "
                                           f"{self.global_consecutive_break_end_rel-1}) "
                                           f"有效長度不足以安排 {self.min_consecutive_rest_slots} 格連續休息 ({min_mandatory_break_minutes}分鐘)。")
+        # 規則 3 的落場窗口列表 [(開始, 結束)]：排班時段超過一天時 (多日排班)，全局落場時段每天重複一次，
+        # 之後各天被排班時段截短到容納不下連續休息的窗口不計入
+        self.break_windows = []
+        if self.enable_mandatory_break:
+            self.break_windows.append((self.global_consecutive_break_start_rel, self.global_consecutive_break_end_rel))
+            slots_per_day = 24 * 60 // self.slot_duration_minutes
+            # 不超過 24 小時的排班時段 (包括跨午夜的) 只有一個落場窗口，與單日排班的行為一致
+            for day in range(1, math.ceil(self.num_slots / slots_per_day) + 1 if self.num_slots > slots_per_day else 1):
+                start_rel = max(0, abs_break_start + day * slots_per_day - self.schedule_start_slot)
+                end_rel = min(self.num_slots, abs_break_end + day * slots_per_day - self.schedule_start_slot)
+                if end_rel - start_rel >= self.min_consecutive_rest_slots: self.break_windows.append((start_rel, end_rel))
 
-        # 4. 處理崗位需求 (與之前相同)
-        self.job_code_to_int = {}
-        self.int_to_job_code = {}
-        current_job_int = FIRST_JOB_CODE
-        self.job_demands = collections.defaultdict(lambda: [False] * self.num_slots)
-        self.all_demanded_job_slots = []
-        # ... (崗位解析邏輯，與上一個版本相同) ...
-        for req_line_idx, req_line in enumerate(job_requirements_raw):
-            req_line_stripped = req_line.strip()
-            if not req_line_stripped: continue
-            parts = req_line_stripped.split(" ", 1)
-            if len(parts) < 2: raise ValueError(f"崗位需求第 {req_line_idx+1} 行 '{req_line_stripped}' 格式錯誤: 應為 '代碼 時段1,...'")
-            job_code_str = parts[0]; time_ranges_str = parts[1]
-            if job_code_str not in self.job_code_to_int:
-                self.job_code_to_int[job_code_str] = current_job_int; self.int_to_job_code[current_job_int] = job_code_str; current_job_int += 1
-            job_int_val = self.job_code_to_int[job_code_str]
-            for time_range_idx, time_range in enumerate(time_ranges_str.split(',')):
-                time_range_stripped = time_range.strip(); 
-                if not time_range_stripped: continue
-                context = f"崗位 '{job_code_str}' 的第 {time_range_idx+1} 個時段"
-                start_abs, end_abs = parse_time_range(time_range_stripped, context)
-                # if start_abs is None or end_abs is None: raise ValueError(f"必要參數錯誤：{context} '{time_range_stripped}'。")
-                if end_abs <= start_abs: raise ValueError(f"{context} '{time_range_stripped}'：結束時間必須晚於開始時間。")
-                for s_abs in range(start_abs, end_abs):
-                    if self.schedule_start_slot <= s_abs < self.schedule_end_slot:
-                        s_relative = s_abs - self.schedule_start_slot
-                        if not self.job_demands[job_int_val][s_relative]:
-                            self.job_demands[job_int_val][s_relative] = True; self.all_demanded_job_slots.append((job_int_val, s_relative))
+        # 4. 處理崗位需求：解析結果按 (需求文本, 排班時段) 緩存，批量場景共用同一份解析
+        #    demand[job_int - FIRST_JOB_CODE, s] 為該時隙需要的人數 (只讀，與緩存共用；NumPy 數組可被 pickle 傳入求解子進程)
+        job_codes, self.demand = parse_job_requirements(tuple(job_requirements_raw), self.schedule_start_slot, self.schedule_end_slot, self.slot_duration_minutes)
+        self.job_code_to_int = {code: FIRST_JOB_CODE + i for i, code in enumerate(job_codes)}
+        self.int_to_job_code = {job_int: code for code, job_int in self.job_code_to_int.items()}
         self.all_job_ints = sorted(list(self.job_code_to_int.values()))
 
-    def solve(self):
+        # 5. 員工個人狀態：固定安排、之前已工作的格數；history_slots / lookahead_slots 由 horizon.py 的滾動窗口設置：
+        #    開頭 history_slots 格是已確定的前一窗口結尾 (全部固定，不計需求和工作量)，結尾 lookahead_slots 格只用於前瞻 (不計工作量)
+        self.fixed_assignments = {}
+        for emp_name, cells in (fixed_assignments or {}).items():
+            e = int(emp_name[1:]) - 1 if isinstance(emp_name, str) and emp_name[:1] == "K" and emp_name[1:].isdigit() else -1
+            if not 0 <= e < self.num_employees: raise ValueError(f"固定安排中的員工 '{emp_name}' 不存在 (應為 K1 至 K{self.num_employees})。")
+            for time_str, value in cells.items():
+                s_rel = time_to_slot(time_str, self.slot_duration_minutes) if isinstance(time_str, str) else None
+                if s_rel is None or not 0 <= s_rel - self.schedule_start_slot < self.num_slots: raise ValueError(f"員工 {emp_name} 的固定安排時間 '{time_str}' 不在排班時段內。")
+                if value != "R" and value not in self.job_code_to_int: raise ValueError(f"員工 {emp_name} 的固定安排 '{value}' 不是已定義的崗位代碼或 'R'。")
+                self.fixed_assignments[e, s_rel - self.schedule_start_slot] = REST_R_CODE if value == "R" else self.job_code_to_int[value]
+        if prior_work_counts is not None and len(prior_work_counts) != self.num_employees:
+            raise ValueError(f"prior_work_counts 的長度 ({len(prior_work_counts)}) 必須等於員工人數 ({self.num_employees})。")
+        self.prior_work_counts = [int(count) for count in prior_work_counts] if prior_work_counts is not None else [0] * self.num_employees
+        self.history_slots = 0; self.lookahead_slots = 0
+        self.parse_ms = round((time.perf_counter() - parse_started) * 1000, 2)
+        self._reset_solve_stats()
+        self._on_solution = self._stop_event = None; self._time_limit_seconds = DEFAULT_TIME_LIMIT_SECONDS
+        self._num_workers = self._deadline = self._relative_gap_limit = None
+        self._previous_values = None; self._minimal_change = False
+
+    # --- 求解統計：各階段耗時 (毫秒)、模型規模、CP-SAT 響應統計，寫入報告的 "stats" 字段 ---
+    def _reset_solve_stats(self):
+        self.solve_stats = {"timings_ms": {"parse": self.parse_ms}, "model": None, "solver": None}
+
+    def _add_timing(self, phase, started):
+        timings = self.solve_stats["timings_ms"]
+        timings[phase] = round(timings.get(phase, 0) + (time.perf_counter() - started) * 1000, 2)
+
+    def _record_model_size(self, model):
+        proto = model.Proto()
+        self.solve_stats["model"] = {"variables": len(proto.variables), "constraints": len(proto.constraints)}
+
+    def _record_solver_stats(self, solver, status):
+        stats = {"status": solver.StatusName(status), "conflicts": solver.NumConflicts(), "branches": solver.NumBranches(),
+                 "wall_time_s": round(solver.WallTime(), 3), "num_workers": solver.parameters.num_workers}
+        if status in (cp_model.OPTIMAL, cp_model.FEASIBLE):
+            objective, bound = solver.ObjectiveValue(), solver.BestObjectiveBound()
+            stats.update(objective=objective, best_bound=bound, gap=round(abs(objective - bound) / max(1.0, abs(objective)), 4))
+        self.solve_stats["solver"] = stats
+
+    def canonical_key(self, variant=None):
+        # 以解析後的實例 (而非原始 JSON) 計算規範化鍵：
+        # 分隔符、空白、崗位行順序不同但語義相同的請求會得到相同的鍵
+        demands = sorted(
+            (self.int_to_job_code[job_int], self.demand[job_int - FIRST_JOB_CODE].tolist())
+            for job_int in self.all_job_ints if self.demand[job_int - FIRST_JOB_CODE].any()
+        )
+        canonical = {
+            "employees": self.num_employees,
+            "slot_duration_minutes": self.slot_duration_minutes,
+            "start_slot": self.schedule_start_slot, # 報告中的時間字符串依賴起始時隙
+            "num_slots": self.num_slots,
+            "max_consecutive_work_slots": self.max_consecutive_work_slots,
+            "rest_slots_after_consecutive_work": self.rest_slots_after_consecutive_work,
+            "break": [self.global_consecutive_break_start_rel, self.global_consecutive_break_end_rel,
+                      self.min_consecutive_rest_slots] if self.enable_mandatory_break else None,
+            "demands": demands,
+            "fixed_assignments": sorted([e, s, self.int_to_job_code.get(v, "R")] for (e, s), v in self.fixed_assignments.items()),
+            "prior_work_counts": self.prior_work_counts if any(self.prior_work_counts) else None,
+            "counted_range": [self.history_slots, self.lookahead_slots],
+            "break_windows": self.break_windows if self.enable_mandatory_break else None,
+            "variant": variant,
+        }
+        return hashlib.sha256(json.dumps(canonical, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+    def _build_integer_model(self):
+        # 原有建模方式：每個 (員工, 時隙) 一個整數 task 變量 + 反射的 is_work
         # ... (變量定義 tasks = {}, is_work = {} 等，這些不變) ...
         model = cp_model.CpModel()
         tasks = {}
@@ -171,11 +337,14 @@ class ShiftSchedulerWithConstraints:
                 model.Add(tasks[e, s] == REST_R_CODE).OnlyEnforceIf(is_work[e, s].Not())
 
         # ... (防止超額分配的規則，這部分不變) ...
+        demanded = (self.demand > 0).tolist()
         for e in range(self.num_employees):
             for s in range(self.num_slots):
                 for job_int_val in self.all_job_ints:
-                    if not self.job_demands[job_int_val][s]:
+                    if not demanded[job_int_val - FIRST_JOB_CODE][s] and self.fixed_assignments.get((e, s)) != job_int_val:
                         model.Add(tasks[e,s] != job_int_val)
+        # 固定安排 (包括多日排班窗口開頭的歷史時隙)
+        for (e, s), value in self.fixed_assignments.items(): model.Add(tasks[e, s] == value)
 
 
         # --- 硬性規則 1: 連續工作限制 與 強制後續休息 ---
@@ -234,69 +403,693 @@ class ShiftSchedulerWithConstraints:
                  self.model_definitely_infeasible = True # 再次確保標記
                  if not self.infeasible_reason: self.infeasible_reason = "全局落場時段長度不足。"
             else:
-                # --- (強制連續休息的邏輯，同上一個版本，使用 self.min_consecutive_rest_slots) ---
-                for e in range(self.num_employees):
-                    possible_consecutive_rest_starts = []
-                    search_len = self.global_consecutive_break_end_rel - self.global_consecutive_break_start_rel
-                    for offset in range(search_len - self.min_consecutive_rest_slots + 1):
-                        start_rel = self.global_consecutive_break_start_rel + offset
-                        b_rest = model.NewBoolVar(f'emp{e}_consec_R_at_s{start_rel}')
-                        literals = []
-                        for i in range(self.min_consecutive_rest_slots):
-                            s_is_rest = model.NewBoolVar(f'emp{e}_s{start_rel+i}_isR_for_b{b_rest.Name()}_{i}')
-                            model.Add(tasks[e, start_rel + i] == REST_R_CODE).OnlyEnforceIf(s_is_rest)
-                            model.Add(tasks[e, start_rel + i] != REST_R_CODE).OnlyEnforceIf(s_is_rest.Not())
-                            literals.append(s_is_rest)
-                        model.AddMinEquality(b_rest, literals)
-                        possible_consecutive_rest_starts.append(b_rest)
-                    if possible_consecutive_rest_starts: model.AddBoolOr(possible_consecutive_rest_starts)
-                    else: self.model_definitely_infeasible = True; self.infeasible_reason = f"員工 {e+1} 在落場時段內無有效休息起始點。"; break
-
-        # --- 硬性規則 4: 崗位需求覆蓋 (需求人數始終為1) ---
-        unfilled_demands_penalties = []; self.demand_met_vars = {} 
+                # --- (強制連續休息的邏輯，同上一個版本，使用 self.min_consecutive_rest_slots；每個落場窗口各需一段) ---
+                for break_start, break_end in self.break_windows:
+                    for e in range(self.num_employees):
+                        possible_consecutive_rest_starts = []
+                        for start_rel in range(break_start, break_end - self.min_consecutive_rest_slots + 1):
+                            b_rest = model.NewBoolVar(f'emp{e}_consec_R_at_s{start_rel}')
+                            literals = []
+                            for i in range(self.min_consecutive_rest_slots):
+                                s_is_rest = model.NewBoolVar(f'emp{e}_s{start_rel+i}_isR_for_b{b_rest.Name()}_{i}')
+                                model.Add(tasks[e, start_rel + i] == REST_R_CODE).OnlyEnforceIf(s_is_rest)
+                                model.Add(tasks[e, start_rel + i] != REST_R_CODE).OnlyEnforceIf(s_is_rest.Not())
+                                literals.append(s_is_rest)
+                            model.AddMinEquality(b_rest, literals)
+                            possible_consecutive_rest_starts.append(b_rest)
+                        if possible_consecutive_rest_starts: model.AddBoolOr(possible_consecutive_rest_starts)
+                        else: self.model_definitely_infeasible = True; self.infeasible_reason = f"員工 {e+1} 在落場時段內無有效休息起始點。"; break
+
+        # --- 硬性規則 4: 崗位需求覆蓋 (需求 1 人的格子恰好一人在崗才算滿足；需求多人的格子見 _add_shortfall) ---
+        unfilled_demands_penalties = []; self.demand_met_vars = {}; self.demand_shortfall_vars = {}
         if not self.model_definitely_infeasible: # (同前)
-             for job_int, s_rel in self.all_demanded_job_slots:
+             for job_int, s_rel, required in self.demanded_cells():
                 assigned_employees = []; 
                 for e_idx in range(self.num_employees): b_is_assigned = model.NewBoolVar(f'emp{e_idx}_j{job_int}_s{s_rel}'); model.Add(tasks[e_idx,s_rel] == job_int).OnlyEnforceIf(b_is_assigned); model.Add(tasks[e_idx,s_rel] != job_int).OnlyEnforceIf(b_is_assigned.Not()); assigned_employees.append(b_is_assigned)
+                if required > 1: unfilled_demands_penalties.append(self._add_shortfall(model, job_int, s_rel, required, assigned_employees)); continue
                 current_demand_met = model.NewBoolVar(f'demand_met_j{job_int}_s{s_rel}'); model.Add(sum(assigned_employees) == 1).OnlyEnforceIf(current_demand_met); model.Add(sum(assigned_employees) != 1).OnlyEnforceIf(current_demand_met.Not()); unfilled_demands_penalties.append(current_demand_met.Not()); self.demand_met_vars[(job_int, s_rel)] = current_demand_met
 
         # --- 軟性規則 5: 工作量平衡 (+-1) ---
         if not self.model_definitely_infeasible and self.num_employees > 0: # (同前)
-            work_slots = [model.NewIntVar(0, self.num_slots, f'ws_e{e}') for e in range(self.num_employees)]
-            for e in range(self.num_employees): model.Add(work_slots[e] == sum(is_work[e, s] for s in range(self.num_slots)))
-            min_w = model.NewIntVar(0, self.num_slots, 'min_w'); max_w = model.NewIntVar(0, self.num_slots, 'max_w'); model.AddMinEquality(min_w, work_slots); model.AddMaxEquality(max_w, work_slots); diff_w = model.NewIntVar(0, self.num_slots, 'diff_w'); model.Add(diff_w == max_w - min_w); model.Add(diff_w <= 1) 
+            max_count = self.num_slots + max(self.prior_work_counts) # 按累計工作格數平衡 (見 counted_slots)
+            work_slots = [model.NewIntVar(0, max_count, f'ws_e{e}') for e in range(self.num_employees)]
+            for e in range(self.num_employees): model.Add(work_slots[e] == self.prior_work_counts[e] + sum(is_work[e, s] for s in self.counted_slots()))
+            min_w = model.NewIntVar(0, max_count, 'min_w'); max_w = model.NewIntVar(0, max_count, 'max_w'); model.AddMinEquality(min_w, work_slots); model.AddMaxEquality(max_w, work_slots); diff_w = model.NewIntVar(0, self.num_slots, 'diff_w'); model.Add(diff_w == max_w - min_w); model.Add(diff_w <= 1) 
 
         # --- 目標函數 ---
+        self.unfilled_penalties = unfilled_demands_penalties
         if unfilled_demands_penalties: # (同前)
             model.Minimize(sum(unfilled_demands_penalties))
 
-        # --- 提前檢查是否無解 ---
-        if self.model_definitely_infeasible: # (同前)
-            report = {"status": "INFEASIBLE_PRE_SOLVE", "employee_stats": [], "unfilled_job_slots": [], "job_assignments_count": collections.defaultdict(int), "infeasible_reason": self.infeasible_reason}
-            for job_int_val, s_rel_val in self.all_demanded_job_slots: job_name_val = self.int_to_job_code.get(job_int_val, f"JOB_{job_int_val}"); slot_time_str_val = slot_to_time_str(s_rel_val + self.schedule_start_slot); report["unfilled_job_slots"].append({"job_code": job_name_val, "time_slot": slot_time_str_val, "reason": "模型因先決條件不滿足而無解"})
+        def add_hint(task_values):
+            for e in range(self.num_employees):
+                for s in range(self.num_slots):
+                    model.AddHint(tasks[e, s], task_values[e][s]); model.AddHint(is_work[e, s], task_values[e][s] != REST_R_CODE)
+            self._hint_demand_met(model, task_values)
+        task_values = lambda solver: [[solver.Value(tasks[e, s]) for s in range(self.num_slots)] for e in range(self.num_employees)]
+        def cell_differs(e, s, value):
+            differs = model.NewBoolVar(f'differs_e{e}_s{s}')
+            model.Add(tasks[e, s] != value).OnlyEnforceIf(differs); model.Add(tasks[e, s] == value).OnlyEnforceIf(differs.Not())
+            return differs
+        return _BuiltModel(model, is_work, task_values, add_hint, cell_differs)
+
+    def _build_boolean_model(self, rule_guards=None):
+        # 精簡建模方式：每個 (員工, 時隙, 該時隙有需求的崗位) 一個布爾變量，配合 AddExactlyOne；
+        # 規則 1-4 直接複用這些文字 (literal)，不再為每條規則重複建立反射變量。
+        # 沒有任何崗位需求的時隙必然休息，不建立變量 (以 None 表示)。
+        # rule_guards 為 dict 時 (診斷不可行原因用)，每個 (規則族, 員工) 的硬性約束都加上一個守衛文字，
+        # 守衛為 False 時該組約束失效；守衛文字按需創建並寫入 rule_guards[(規則族, 員工編號或 None)]。
+        model = cp_model.CpModel()
+        def unless_relaxed(family, e):
+            # 返回要附加到子句上的 [guard.Not()]，不診斷時返回空列表
+            if rule_guards is None: return []
+            if (family, e) not in rule_guards: rule_guards[family, e] = model.NewBoolVar(f'guard_{family}_e{e}')
+            return [rule_guards[family, e].Not()]
+        jobs_at_slot = self.jobs_at_slot()
+        assign = {} # (e, s, job_int) -> BoolVar
+        is_work = {} # (e, s) -> 工作文字，或 None (必然休息)
+        jobs_of = {} # (e, s) -> 可安排的崗位：該時隙有需求的崗位，加上固定安排在無需求時隙上的崗位
+        for e in range(self.num_employees):
+            for s in range(self.num_slots):
+                pinned = self.fixed_assignments.get((e, s), REST_R_CODE)
+                jobs_of[e, s] = jobs_at_slot[s] + ([pinned] if pinned != REST_R_CODE and pinned not in jobs_at_slot[s] else [])
+                if not jobs_of[e, s]:
+                    is_work[e, s] = None; continue
+                rest = model.NewBoolVar(f'rest_e{e}_s{s}')
+                slot_literals = [rest]
+                for job_int in jobs_of[e, s]:
+                    assign[e, s, job_int] = model.NewBoolVar(f'x_e{e}_s{s}_j{job_int}')
+                    slot_literals.append(assign[e, s, job_int])
+                model.AddExactlyOne(slot_literals)
+                is_work[e, s] = rest.Not()
+
+        def window_work_literals(e, start, length):
+            # 窗口內只要有一格必然休息，相關約束就自動滿足，返回 None
+            literals = [is_work[e, start + i] for i in range(length)]
+            return None if any(lit is None for lit in literals) else literals
+
+        # --- 固定安排 (包括多日排班窗口開頭的歷史時隙) ---
+        for (e, s), value in self.fixed_assignments.items():
+            if value != REST_R_CODE: model.AddBoolOr([assign[e, s, value]] + unless_relaxed("fixed_assignments", e))
+            elif is_work[e, s] is not None: model.AddBoolOr([is_work[e, s].Not()] + unless_relaxed("fixed_assignments", e))
+
+        for e in range(self.num_employees):
+            # --- 硬性規則 1A: 任何 (max+1) 長度窗口不能全部工作 ---
+            for s in range(self.num_slots - self.max_consecutive_work_slots):
+                literals = window_work_literals(e, s, self.max_consecutive_work_slots + 1)
+                if literals: model.AddBoolOr([lit.Not() for lit in literals] + unless_relaxed("rule1_max_consecutive", e))
+            # --- 硬性規則 1B: 連續工作 max 格後必須休息 rest_slots_after_consecutive_work 格 ---
+            limit = self.num_slots - self.max_consecutive_work_slots - self.rest_slots_after_consecutive_work + 1
+            for s in range(limit):
+                literals = window_work_literals(e, s, self.max_consecutive_work_slots)
+                if not literals: continue
+                for j in range(self.rest_slots_after_consecutive_work):
+                    next_work = is_work[e, s + self.max_consecutive_work_slots + j]
+                    if next_work is not None: model.AddBoolOr([lit.Not() for lit in literals] + [next_work.Not()] + unless_relaxed("rule1_rest_after", e))
+            # --- 硬性規則 2: 相鄰兩格都工作時必須是同一崗位 ---
+            for s in range(1, self.num_slots):
+                if is_work[e, s] is None: continue
+                for job_int in jobs_of[e, s - 1]:
+                    clause = [assign[e, s - 1, job_int].Not(), is_work[e, s].Not()]
+                    if (e, s, job_int) in assign: clause.append(assign[e, s, job_int])
+                    model.AddBoolOr(clause + unless_relaxed("rule2_same_job", e))
+
+        # --- 硬性規則 3: 強制落場 (如果啟用) ---
+        if self.enable_mandatory_break and not self.model_definitely_infeasible:
+            for (break_start, break_end), e in ((window, e) for window in self.break_windows for e in range(self.num_employees)):
+                possible_consecutive_rest_starts = []
+                for start_rel in range(break_start, break_end - self.min_consecutive_rest_slots + 1):
+                    work_literals = [is_work[e, start_rel + i] for i in range(self.min_consecutive_rest_slots)]
+                    work_literals = [lit for lit in work_literals if lit is not None]
+                    if not work_literals:
+                        possible_consecutive_rest_starts = None; break # 該窗口必然全部休息，規則自動滿足
+                    b_rest = model.NewBoolVar(f'emp{e}_consec_R_at_s{start_rel}')
+                    for lit in work_literals: model.AddImplication(b_rest, lit.Not())
+                    possible_consecutive_rest_starts.append(b_rest)
+                if possible_consecutive_rest_starts: model.AddBoolOr(possible_consecutive_rest_starts + unless_relaxed("rule3_mandatory_break", e))
+
+        # --- 硬性規則 4: 崗位需求覆蓋，直接使用 assign 文字 ---
+        # 需求 1 人的格子只需 demand_met => 恰好一人 的單向約束：最小化目標會自動把可滿足的需求設為 True，
+        # 報告中的未填補需求按實際排班結果統計；需求多人的格子見 _add_shortfall
+        unfilled_demands_penalties = []; self.demand_met_vars = {}; self.demand_shortfall_vars = {}
+        if not self.model_definitely_infeasible:
+            for job_int, s_rel, required in self.demanded_cells():
+                assigned_employees = [assign[e, s_rel, job_int] for e in range(self.num_employees)]
+                if required > 1: unfilled_demands_penalties.append(self._add_shortfall(model, job_int, s_rel, required, assigned_employees)); continue
+                current_demand_met = model.NewBoolVar(f'demand_met_j{job_int}_s{s_rel}')
+                model.Add(sum(assigned_employees) == 1).OnlyEnforceIf(current_demand_met)
+                unfilled_demands_penalties.append(current_demand_met.Not()); self.demand_met_vars[(job_int, s_rel)] = current_demand_met
+
+        # --- 軟性規則 5: 工作量平衡 (+-1) ---
+        if not self.model_definitely_infeasible and self.num_employees > 0:
+            work_slots = [self.prior_work_counts[e] + sum(lit for lit in (is_work[e, s] for s in self.counted_slots()) if lit is not None) for e in range(self.num_employees)]
+            max_count = self.num_slots + max(self.prior_work_counts)
+            min_w = model.NewIntVar(0, max_count, 'min_w'); max_w = model.NewIntVar(0, max_count, 'max_w')
+            for e in range(self.num_employees):
+                model.Add(min_w <= work_slots[e]); model.Add(max_w >= work_slots[e])
+            balance = model.Add(max_w - min_w <= 1)
+            if rule_guards is not None: unless_relaxed("rule5_balance", None); balance.OnlyEnforceIf(rule_guards["rule5_balance", None])
+
+        # --- 目標函數 ---
+        self.unfilled_penalties = unfilled_demands_penalties
+        if unfilled_demands_penalties:
+            model.Minimize(sum(unfilled_demands_penalties))
+
+        def task_value(solver, e, s):
+            for job_int in jobs_of[e, s]:
+                if solver.BooleanValue(assign[e, s, job_int]): return job_int
+            return REST_R_CODE
+        def add_hint(task_values):
+            for (e, s, job_int), var in assign.items(): model.AddHint(var, task_values[e][s] == job_int)
+            for (e, s), lit in is_work.items():
+                if lit is not None: model.AddHint(lit.Not(), task_values[e][s] == REST_R_CODE)
+            self._hint_demand_met(model, task_values)
+        def cell_differs(e, s, value):
+            if value == REST_R_CODE: return 0 if is_work[e, s] is None else is_work[e, s]
+            return assign[e, s, value].Not() if (e, s, value) in assign else 1
+        return _BuiltModel(model, is_work, lambda solver: [[task_value(solver, e, s) for s in range(self.num_slots)] for e in range(self.num_employees)], add_hint, cell_differs)
+
+    def max_stints_per_employee(self, hint_values=None):
+        # 區間引擎每位員工的候選工作段數。相鄰兩段之間至少休息一格，因此不會超過 ceil(N/2)；
+        # 實際排班中每段通常接近連續工作上限，取 2*ceil(N/(M+1))+2，並保證能容納啟發式初始解的段數
+        limit = 2 * math.ceil(self.num_slots / (self.max_consecutive_work_slots + 1)) + 2
+        if hint_values: limit = max([limit] + [len(_stints_from_row(row)) for row in hint_values])
+        return max(1, min((self.num_slots + 1) // 2, limit))
+
+    def _build_interval_model(self, max_stints):
+        # 區間建模：每位員工 max_stints 個可選工作段 (OptionalIntervalVar)，每段恰好屬於一個崗位，段與段按時間排序。
+        # 規則 1A: 段長 <= M；規則 2: 相鄰兩段之間至少休息一格，因此每段就是一個連續工作塊，只做一個崗位；
+        # 規則 1B: 滿 M 格 (且休息窗口在排班表內) 的段之後接一個長度 R 的可選休息區間，與該員工的工作段 AddNoOverlap；
+        # 規則 3: 落場窗口內一個長度 B 的區間，與該員工的工作段 AddNoOverlap (可與 1B 的休息區間重疊)；
+        # 規則 4: 同一崗位的全部工作段連同該崗位的無需求時段 AddNoOverlap —— 每段都落在需求內且同一時刻至多一人在崗，
+        #         因此已覆蓋需求數等於總工作格數，目標值 (未填補數) = 總需求 - 總工作格數；
+        #         崗位需求多人時改用容量為最大需求人數的 AddCumulative，需求較少的時段以佔用 (容量 - 需求) 的固定區間填補；
+        # 規則 5: 各員工工作格數之和在 [lo, lo+1] 內。
+        # 與逐格模型的差別：不允許多於需求人數的員工同時做同一崗位 (需求 1 人的格子本來就算未填補)，且段數有上限，
+        # 所以 CP-SAT 的 OPTIMAL 只相對於本模型成立，_solve 只在達到解析下界時才報告 OPTIMAL。
+        model = cp_model.CpModel()
+        N, M, R = self.num_slots, self.max_consecutive_work_slots, self.rest_slots_after_consecutive_work
+        rest_rule_last_start = N - M - R
+        capacity = {job_int: int(self.demand[job_int - FIRST_JOB_CODE].max()) for job_int in self.all_job_ints if self.demand[job_int - FIRST_JOB_CODE].any()}
+        job_ints = list(capacity)
+        job_intervals = {job_int: [] for job_int in job_ints}; job_heights = {job_int: [] for job_int in job_ints}
+        for job_int in job_ints: # 無需求 (或需求少於容量) 的時段作為固定區間佔位
+            for start, end, blocked in _stints_from_row((capacity[job_int] - self.demand[job_int - FIRST_JOB_CODE]).tolist()):
+                job_intervals[job_int].append(model.NewFixedSizeIntervalVar(start, end - start, f'blocked_j{job_int}_s{start}')); job_heights[job_int].append(blocked)
+
+        stints = [] # stints[e][k] = dict(present, start, size, end, jobs, full, early, needs_rest)
+        work_slots = []; breaks = []
+        break_enabled = self.enable_mandatory_break and not self.model_definitely_infeasible
+        for e in range(self.num_employees):
+            employee_stints = []; work_intervals = []; rest_intervals = []
+            for k in range(max_stints):
+                present = model.NewBoolVar(f'stint_e{e}_k{k}')
+                start = model.NewIntVar(0, N - 1, f'stint_start_e{e}_k{k}')
+                size = model.NewIntVar(0, M, f'stint_size_e{e}_k{k}')
+                end = model.NewIntVar(0, N, f'stint_end_e{e}_k{k}')
+                model.Add(size >= 1).OnlyEnforceIf(present); model.Add(size == 0).OnlyEnforceIf(present.Not())
+                work_intervals.append(model.NewOptionalIntervalVar(start, size, end, present, f'stint_e{e}_k{k}_iv'))
+                jobs = {job_int: model.NewBoolVar(f'stint_e{e}_k{k}_j{job_int}') for job_int in job_ints}
+                for job_int, lit in jobs.items():
+                    job_intervals[job_int].append(model.NewOptionalIntervalVar(start, size, end, lit, f'stint_e{e}_k{k}_j{job_int}_iv')); job_heights[job_int].append(1)
+                model.Add(sum(jobs.values()) == present)
+                if employee_stints: # 段按時間排序，未使用的段排在最後
+                    prev = employee_stints[-1]
+                    model.AddImplication(present, prev["present"])
+                    model.Add(start >= prev["end"] + 1).OnlyEnforceIf(present)
+                stint = {"present": present, "start": start, "size": size, "end": end, "jobs": jobs}
+                if R > 0 and rest_rule_last_start >= 0:
+                    full = model.NewBoolVar(f'stint_full_e{e}_k{k}'); early = model.NewBoolVar(f'stint_early_e{e}_k{k}')
+                    model.Add(size == M).OnlyEnforceIf(full); model.Add(size < M).OnlyEnforceIf(full.Not())
+                    model.Add(start <= rest_rule_last_start).OnlyEnforceIf(early); model.Add(start > rest_rule_last_start).OnlyEnforceIf(early.Not())
+                    needs_rest = model.NewBoolVar(f'stint_rest_e{e}_k{k}')
+                    model.AddBoolAnd([present, full, early]).OnlyEnforceIf(needs_rest)
+                    model.AddBoolOr([present.Not(), full.Not(), early.Not()]).OnlyEnforceIf(needs_rest.Not())
+                    rest_intervals.append(model.NewOptionalFixedSizeIntervalVar(end, R, needs_rest, f'rest_after_e{e}_k{k}'))
+                    stint.update(full=full, early=early, needs_rest=needs_rest)
+                employee_stints.append(stint)
+            if rest_intervals: model.AddNoOverlap(work_intervals + rest_intervals)
+            if break_enabled:
+                break_starts = [model.NewIntVar(window_start, window_end - self.min_consecutive_rest_slots, f'break_start_e{e}_s{window_start}') for window_start, window_end in self.break_windows]
+                model.AddNoOverlap(work_intervals + [model.NewFixedSizeIntervalVar(start, self.min_consecutive_rest_slots, f'break_e{e}_{i}') for i, start in enumerate(break_starts)])
+                breaks.append(break_starts)
+            work = model.NewIntVar(0, N, f'ws_e{e}')
+            model.Add(work == sum(stint["size"] for stint in employee_stints))
+            stints.append(employee_stints); work_slots.append(work)
+        for job_int, intervals in job_intervals.items():
+            if capacity[job_int] == 1: model.AddNoOverlap(intervals)
+            else: model.AddCumulative(intervals, job_heights[job_int], capacity[job_int])
+
+        lo = model.NewIntVar(0, N, 'min_w')
+        for work in work_slots: model.Add(work >= lo); model.Add(work <= lo + 1)
+        total_demand = self.total_demand()
+        unfilled = model.NewIntVar(0, total_demand, 'unfilled')
+        model.Add(unfilled == total_demand - sum(work_slots))
+        self.unfilled_penalties = [unfilled]; self.demand_met_vars = {}; self.demand_shortfall_vars = {}
+        model.Minimize(unfilled)
+
+        def task_values(solver):
+            rows = [[REST_R_CODE] * N for _ in range(self.num_employees)]
+            for e, employee_stints in enumerate(stints):
+                for stint in employee_stints:
+                    if not solver.BooleanValue(stint["present"]): continue
+                    job_int = next(job_int for job_int, lit in stint["jobs"].items() if solver.BooleanValue(lit))
+                    start = solver.Value(stint["start"])
+                    for s in range(start, start + solver.Value(stint["size"])): rows[e][s] = job_int
+            return rows
+        def add_hint(values):
+            for e, row in enumerate(values):
+                hinted = _stints_from_row(row)
+                for k, stint in enumerate(stints[e]):
+                    start, end, job_int = hinted[k] if k < len(hinted) else (0, 0, None)
+                    size = end - start; present = job_int is not None
+                    model.AddHint(stint["present"], present); model.AddHint(stint["start"], start)
+                    model.AddHint(stint["size"], size); model.AddHint(stint["end"], end)
+                    for j, lit in stint["jobs"].items(): model.AddHint(lit, j == job_int)
+                    if "needs_rest" in stint:
+                        full, early = size == M, start <= rest_rule_last_start
+                        model.AddHint(stint["full"], full); model.AddHint(stint["early"], early); model.AddHint(stint["needs_rest"], present and full and early)
+                B = self.min_consecutive_rest_slots
+                for break_start, (window_start, window_end) in zip(breaks[e] if breaks else [], self.break_windows):
+                    window = range(window_start, window_end - B + 1)
+                    model.AddHint(break_start, next((t for t in window if all(v == REST_R_CODE for v in row[t:t + B])), window[0]))
+            model.AddHint(lo, min(sum(1 for v in row if v != REST_R_CODE) for row in values))
+        return _BuiltModel(model, None, task_values, add_hint, None)
+
+    def _add_shortfall(self, model, job_int, s_rel, required, assigned_employees):
+        # 需求多人的格子：在崗人數不超過需求 (固定安排多於需求時以固定人數為上限)，缺少的人數作為懲罰項
+        pinned = sum(1 for e in range(self.num_employees) if self.fixed_assignments.get((e, s_rel)) == job_int)
+        model.Add(sum(assigned_employees) <= max(required, pinned))
+        shortfall = model.NewIntVar(0, required, f'shortfall_j{job_int}_s{s_rel}')
+        model.Add(shortfall >= required - sum(assigned_employees))
+        self.demand_shortfall_vars[(job_int, s_rel)] = shortfall
+        return shortfall
+
+    def _hint_demand_met(self, model, task_values):
+        for (job_int, s_rel), met in self.demand_met_vars.items():
+            model.AddHint(met, sum(1 for row in task_values if row[s_rel] == job_int) == 1)
+        for (job_int, s_rel), shortfall in self.demand_shortfall_vars.items():
+            model.AddHint(shortfall, max(0, int(self.demand[job_int - FIRST_JOB_CODE, s_rel]) - sum(1 for row in task_values if row[s_rel] == job_int)))
+
+    def _build_solution_report(self, status_name, task_values):
+        # task_values[e][s] 為 REST_R_CODE 或崗位整數編碼；未填補需求直接按排班結果統計 (見 presolve.unfilled_units)
+        started = time.perf_counter()
+        solution_grid = {}; report = {"status": status_name, "employee_stats": [], "unfilled_job_slots": [], "job_assignments_count": collections.defaultdict(int)}
+        for e in range(self.num_employees):
+            emp_name = f'K{e+1}'; solution_grid[emp_name] = [""] * self.num_slots; work_count = 0; rest_count = 0; current_schedule_display = []
+            for s_idx in range(self.num_slots):
+                task_val = task_values[e][s_idx]; actual_slot_abs = s_idx + self.schedule_start_slot; slot_time_str_display = slot_to_time_str(actual_slot_abs, self.slot_duration_minutes)
+                if task_val == REST_R_CODE: solution_grid[emp_name][s_idx] = "R"; current_schedule_display.append((slot_time_str_display, "R")); rest_count += 1
+                else: job_name = self.int_to_job_code.get(task_val, f"JOB_{task_val}"); solution_grid[emp_name][s_idx] = job_name; current_schedule_display.append((slot_time_str_display, job_name)); work_count += 1; report["job_assignments_count"][job_name] += 1
+            report["employee_stats"].append({"employee": emp_name, "W_count": work_count, "R_count": rest_count, "schedule_details": current_schedule_display})
+        report["unfilled_job_slots"] = self._unfilled_entries("未能為此崗位時段找到合適員工", self.unfilled_matrix(task_values))
+        self._add_timing("report", started)
+        return solution_grid, report
+
+    def employees_are_homogeneous(self):
+        # 員工 K1..Kn 沒有固定安排且之前的工作格數相同時，所有約束對每位員工完全相同，可任意互換
+        return not self.fixed_assignments and len(set(self.prior_work_counts)) <= 1
+
+    def counted_slots(self):
+        # 計入規則 5 工作量的時隙：多日排班窗口開頭的歷史時隙和結尾的前瞻時隙不計 (見 horizon.py)
+        return range(self.history_slots, self.num_slots - self.lookahead_slots)
+
+    def pinned_rows(self):
+        # 只含固定安排、其餘全部休息的排班
+        rows = [[REST_R_CODE] * self.num_slots for _ in range(self.num_employees)]
+        for (e, s), value in self.fixed_assignments.items(): rows[e][s] = value
+        return rows
+
+    # --- 需求矩陣的常用視圖 ---
+    def demanded_cells(self):
+        # [(崗位整數編碼, 時隙, 需求人數)]，按崗位、時隙排序
+        jobs, slots = np.nonzero(self.demand)
+        return list(zip((jobs + FIRST_JOB_CODE).tolist(), slots.tolist(), self.demand[jobs, slots].tolist()))
+
+    def jobs_at_slot(self):
+        # 每個時隙有需求的崗位整數編碼 (升序)
+        jobs_at = [[] for _ in range(self.num_slots)]
+        for job_int, s, _ in self.demanded_cells(): jobs_at[s].append(job_int)
+        return jobs_at
+
+    def total_demand(self):
+        return int(self.demand.sum())
+
+    def unfilled_matrix(self, task_values):
+        # 每個 (崗位, 時隙) 未填補的需求人數 (見 presolve.unfilled_units)；task_values[e][s] 為 REST_R_CODE 或崗位整數編碼
+        assigned = np.zeros(self.demand.shape, dtype=np.int32)
+        values = np.asarray(task_values, dtype=np.int64).reshape(self.num_employees, self.num_slots)
+        working = values != REST_R_CODE
+        np.add.at(assigned, (values[working] - FIRST_JOB_CODE, np.nonzero(working)[1]), 1)
+        return unfilled_units(self.demand, assigned)
+
+    def _unfilled_entries(self, reason, units=None):
+        # 逐格的 unfilled_job_slots 條目；units 為每格未填補人數 (默認全部需求)，每缺一人一條，需求多人的格子附帶 required
+        units = self.demand if units is None else units
+        entries = []
+        for job_index, s_rel in zip(*np.nonzero(units)):
+            entry = {"job_code": self.int_to_job_code.get(int(job_index) + FIRST_JOB_CODE, f"JOB_{int(job_index) + FIRST_JOB_CODE}"),
+                     "time_slot": slot_to_time_str(int(s_rel) + self.schedule_start_slot, self.slot_duration_minutes), "reason": reason}
+            required = int(self.demand[job_index, s_rel])
+            if required > 1: entry["required"] = required
+            entries.extend(dict(entry) for _ in range(int(units[job_index, s_rel])))
+        return entries
+
+    def window(self, start, end, history_slots=0, lookahead_slots=0, history_rows=None, prior_work_counts=None):
+        """返回排班表 [start, end) 一段的子實例 (多日排班的滾動窗口)。開頭 history_slots 格固定為 history_rows
+        (已確定的前一窗口結尾)，不計需求；只保留完整落在窗口內的落場窗口；prior_work_counts 為窗口之前的累計工作格數。"""
+        sub = copy.copy(self)
+        sub.schedule_start_slot = self.schedule_start_slot + start; sub.schedule_end_slot = self.schedule_start_slot + end
+        sub.num_slots = end - start
+        sub.demand = self.demand[:, start:end].copy(); sub.demand[:, :history_slots] = 0
+        sub.break_windows = [(window_start - start, window_end - start) for window_start, window_end in self.break_windows if start <= window_start and window_end <= end]
+        sub.enable_mandatory_break = self.enable_mandatory_break and bool(sub.break_windows)
+        sub.global_consecutive_break_start_rel, sub.global_consecutive_break_end_rel = sub.break_windows[0] if sub.break_windows else (-1, -1)
+        sub.fixed_assignments = {(e, s_rel - start): value for (e, s_rel), value in self.fixed_assignments.items() if start <= s_rel < end}
+        for e, row in enumerate(history_rows or []):
+            for s in range(history_slots): sub.fixed_assignments[e, s] = row[s]
+        sub.prior_work_counts = list(prior_work_counts) if prior_work_counts is not None else list(self.prior_work_counts)
+        sub.history_slots, sub.lookahead_slots = history_slots, lookahead_slots
+        sub._reset_solve_stats()
+        return sub
+
+    def _add_symmetry_breaking(self, model, is_work):
+        # 員工可互換時，任何排班把員工重新排列後仍是等價解。要求相鄰員工的工作向量按字典序
+        # 非遞增 (K1 >= K2 >= ...)：每組等價解中恰好保留排序後的那一個，求解器不必再搜索 n! 個副本。
+        # eq 表示「到目前位置為止兩個向量完全相同」，只有相同前綴時才要求 a >= b。
+        positions = [s for s in range(self.num_slots) if is_work[0, s] is not None]
+        for e in range(self.num_employees - 1):
+            eq_prev = None
+            for s in positions:
+                a, b = is_work[e, s], is_work[e + 1, s]
+                prefix = [] if eq_prev is None else [eq_prev.Not()]
+                model.AddBoolOr(prefix + [a, b.Not()])
+                eq_next = model.NewBoolVar(f'lex_eq_e{e}_s{s}')
+                model.AddBoolOr(prefix + [a.Not(), b.Not(), eq_next])
+                model.AddBoolOr(prefix + [a, b, eq_next])
+                if eq_prev is not None: model.AddImplication(eq_next, eq_prev)
+                model.AddBoolOr([eq_next.Not(), a, b.Not()]); model.AddBoolOr([eq_next.Not(), a.Not(), b])
+                eq_prev = eq_next
+
+    def _run_solver(self, solver, model, built, lower_bound):
+        # 需要推送中間解或支持提前停止時，附加解回調並由監視線程在 stop_event 被設置時調用 StopSearch
+        if self._on_solution is None and self._stop_event is None:
+            return solver.Solve(model)
+        callback = _ProgressCallback(self, built, lower_bound) if self._on_solution is not None else None
+        finished = threading.Event()
+        def watch_stop_event():
+            while not finished.is_set():
+                if self._stop_event.wait(0.1): solver.StopSearch(); return
+        watcher = threading.Thread(target=watch_stop_event, daemon=True) if self._stop_event is not None else None
+        if watcher: watcher.start()
+        try:
+            return solver.Solve(model, callback)
+        finally:
+            finished.set()
+            if watcher: watcher.join()
+
+    def _pre_solve_infeasible_report(self):
+        report = {"status": "INFEASIBLE_PRE_SOLVE", "employee_stats": [], "unfilled_job_slots": self._unfilled_entries("模型因先決條件不滿足而無解"), "job_assignments_count": collections.defaultdict(int), "infeasible_reason": self.infeasible_reason,
+                  "conflicting_rules": [self._describe_rule("rule3_mandatory_break", None)]} # 目前唯一的預檢失敗原因是落場時段容納不下連續休息
+        return {}, report
+
+    def run_heuristic(self):
+        # 返回 (task_values, 啟發式摘要)；摘要會放進報告的 "heuristic" 字段
+        start = time.perf_counter()
+        task_values, unfilled, _ = build_heuristic_schedule(self)
+        violations = check_hard_rules(self, task_values)
+        summary = {"unfilled": unfilled, "valid": not violations, "elapsed_ms": round((time.perf_counter() - start) * 1000, 2)}
+        self._add_timing("heuristic", start)
+        if violations: summary["violations"] = violations[:5]
+        return task_values, summary
+
+    def run_presolve(self):
+        # 解析下界分析 (見 presolve.py)；結果放進報告的 "presolve" 字段
+        start = time.perf_counter()
+        analysis = analyze_instance(self)
+        analysis["elapsed_ms"] = round((time.perf_counter() - start) * 1000, 2)
+        self._add_timing("presolve", start)
+        return analysis
+
+    def solve_fast(self):
+        # 快速模式：只用啟發式，不建 CP-SAT 模型。未填補數達到解析下界時已是最優
+        if self.model_definitely_infeasible:
+            return self._pre_solve_infeasible_report()
+        analysis = self.run_presolve()
+        task_values, summary = self.run_heuristic()
+        if not summary["valid"]:
+            report = {"status": "UNKNOWN", "employee_stats": [], "unfilled_job_slots": [], "job_assignments_count": collections.defaultdict(int),
+                      "infeasible_reason": "快速模式的啟發式未能找到滿足全部硬性規則的排班，請改用 exact 引擎。", "heuristic": summary, "presolve": analysis}
             return {}, report
+        solution_grid, report = self._build_solution_report("OPTIMAL" if summary["unfilled"] <= analysis["lower_bound"] else "FEASIBLE", task_values)
+        report["heuristic"] = summary; report["presolve"] = analysis
+        return solution_grid, report
+
+    def _describe_rule(self, family, e):
+        return {"rule": family, "employee": None if e is None else f"K{e+1}", "description": RULE_FAMILIES[family]}
+
+    def explain_infeasibility(self, time_limit=10.0, deadline=None):
+        # 用守衛文字作為假設 (assumptions) 求解，取 CP-SAT 給出的充分假設集，再逐個刪除得到極小衝突集。
+        # 返回 [(規則族, 員工編號或 None), ...]；求解器未能證明不可行時返回 None。
+        # 每次求解最多 time_limit 秒，且全部求解共用 deadline 之前的時間；時間用完時返回目前的衝突集 (仍然充分，但未必極小)
+        started = time.perf_counter()
+        guards = {}
+        model = self._build_boolean_model(rule_guards=guards).model
+        model.ClearObjective()
+        key_by_index = {lit.Index(): key for key, lit in guards.items()}
+        solver = cp_model.CpSolver()
+        solver.parameters.num_workers = 1 # 充分假設集只在單線程搜索時可靠
+        def infeasible_with(keys):
+            remaining = solver_policy.remaining_seconds(deadline)
+            if remaining is not None and remaining <= 0: return None
+            solver.parameters.max_time_in_seconds = time_limit if remaining is None else min(time_limit, remaining)
+            model.ClearAssumptions(); model.AddAssumptions([guards[key] for key in keys])
+            return solver.Solve(model) == cp_model.INFEASIBLE
+        if not infeasible_with(list(guards)):
+            self._add_timing("explain", started)
+            return None
+        core = [key_by_index[index] for index in solver.SufficientAssumptionsForInfeasibility() if index in key_by_index]
+        solver.parameters.num_workers = self._num_workers or 1 # 刪除步驟只需判斷可行性，可按策略使用多線程
+        for key in list(core):
+            trial = [k for k in core if k != key]
+            infeasible = infeasible_with(trial)
+            if infeasible is None: break # 時間用完
+            if infeasible: core = trial
+        self._add_timing("explain", started)
+        return core
+
+    def _solve_relaxed(self, conflict_keys, deadline=None):
+        # 把衝突集中的規則改為高權重懲罰後重新求解：優先少違反規則，其次才是少未填補需求
+        # 與 explain_infeasibility 共用 deadline 之前的時間，線程數按求解策略
+        remaining = solver_policy.remaining_seconds(deadline)
+        if remaining is not None and remaining <= 0: return None
+        started = time.perf_counter()
+        guards = {}
+        built = self._build_boolean_model(rule_guards=guards)
+        model = built.model
+        for key, lit in guards.items():
+            if key not in conflict_keys: model.Add(lit == 1)
+        rule_weight = self.total_demand() + 1
+        model.Minimize(sum(self.unfilled_penalties) + rule_weight * sum(guards[key].Not() for key in conflict_keys if key in guards))
+        solver = cp_model.CpSolver()
+        self.solve_stats["relax_policy"] = solver_policy.configure(solver, self._time_limit_seconds, self._num_workers, deadline)
+        status = solver.Solve(model)
+        self._add_timing("relax", started)
+        if status not in (cp_model.OPTIMAL, cp_model.FEASIBLE):
+            return None
+        solution_grid, report = self._build_solution_report(solver.StatusName(status), built.task_values(solver))
+        report["relaxed_rules"] = [self._describe_rule(*key) for key in conflict_keys if key in guards and not solver.BooleanValue(guards[key])]
+        return solution_grid, report
+
+    def _solve_without_mandatory_break(self, solve_options):
+        # 落場時段容納不下連續休息時，放寬即取消規則 3，其他規則不變
+        relaxed = copy.copy(self)
+        relaxed.enable_mandatory_break = False; relaxed.model_definitely_infeasible = False; relaxed.infeasible_reason = ""
+        solution_grid, report = relaxed._solve(**solve_options)
+        report["relaxed_rules"] = [self._describe_rule("rule3_mandatory_break", None)]
+        report["relaxed"] = True; report["original_infeasible_reason"] = self.infeasible_reason
+        return solution_grid, report
+
+    def solve(self, model_builder="integer", symmetry_breaking="auto", engine="exact", relax=False, on_solution=None, stop_event=None, time_limit_seconds=None,
+              previous_values=None, minimal_change=False, num_workers=None, deadline=None, relative_gap_limit=None):
+        # on_solution(event): 每找到更好的解時調用 (見 _emit_progress)；stop_event: 被設置後停止搜索並返回目前最佳解
+        # time_limit_seconds: CP-SAT 時間上限，默認 DEFAULT_TIME_LIMIT_SECONDS；deadline 更早時按其收緊 (見 solver_policy.py)
+        # num_workers: CP-SAT 搜索線程數 (由求解任務管理器按並發數分配)；deadline: 請求的絕對截止時間 (time.time())；
+        # relative_gap_limit: 目標值與最佳下界的相對差距達到此值即停止
+        # previous_values: 上一次的排班 (task_values 形式，見 session.py)，作為初始解/提示；
+        # minimal_change: 在未填補數最少的前提下，再最小化與 previous_values 不同的格子數
+        if minimal_change and previous_values is None: raise ValueError("最小改動目標 (minimal_change) 需要上一次的排班。")
+        if minimal_change and engine == "interval": raise ValueError("區間引擎 (engine=\"interval\") 不支持最小改動目標，請改用 exact 引擎。")
+        self._reset_solve_stats()
+        self._previous_values, self._minimal_change = previous_values, minimal_change
+        self._on_solution, self._stop_event = on_solution, stop_event
+        self._time_limit_seconds = time_limit_seconds or DEFAULT_TIME_LIMIT_SECONDS
+        self._num_workers, self._deadline, self._relative_gap_limit = num_workers, deadline, relative_gap_limit
+        self._solve_started = time.perf_counter(); self._progress_grid = self._progress_objective = None
+        solution_grid, report = self._solve(model_builder, symmetry_breaking, engine, relax)
+        report["stats"] = self.solve_stats
+        report.setdefault("schedule_start_slot", self.schedule_start_slot) # 供 intervals 響應格式把相對時隙換算為時間
+        report.setdefault("slot_duration_minutes", self.slot_duration_minutes)
+        return solution_grid, report
+
+    def _count_unfilled(self, task_values):
+        return int(self.unfilled_matrix(task_values).sum())
+
+    def _count_changes(self, previous_values, task_values):
+        return sum(1 for old_row, new_row in zip(previous_values, task_values) for old, new in zip(old_row, new_row) if old != new)
+
+    def _emit_progress(self, task_values, objective, best_bound):
+        # 推送中間解：首次推送完整 solution_grid，之後只推送變化的格子 changes = [[員工, 時隙索引, 新值], ...]
+        if self._on_solution is None: return
+        if self._progress_objective is not None and objective >= self._progress_objective: return # 只推送嚴格更好的解
+        self._progress_objective = objective
+        grid = {f'K{e+1}': ["R" if v == REST_R_CODE else self.int_to_job_code.get(v, f"JOB_{v}") for v in row] for e, row in enumerate(task_values)}
+        unfilled = self._count_unfilled(task_values)
+        event = {"objective": objective, "best_bound": best_bound, "unfilled": unfilled, "elapsed_s": round(time.perf_counter() - self._solve_started, 3)}
+        if self._progress_grid is None: event["solution_grid"] = grid
+        else: event["changes"] = [[emp, s_idx, value] for emp, row in grid.items() for s_idx, value in enumerate(row) if self._progress_grid[emp][s_idx] != value]
+        self._progress_grid = grid
+        try:
+            self._on_solution(event)
+        except Exception as e: # 推送失敗 (例如客戶端已斷開) 不影響求解
+            print(f"推送中間解失敗: {e}")
+
+    def _solve(self, model_builder="integer", symmetry_breaking="auto", engine="exact", relax=False):
+        if model_builder not in MODEL_BUILDERS:
+            raise ValueError(f"未知的建模方式 '{model_builder}'，可選: {', '.join(MODEL_BUILDERS)}")
+        if symmetry_breaking not in SYMMETRY_BREAKING_MODES:
+            raise ValueError(f"未知的對稱性破除選項 '{symmetry_breaking}'，可選: {', '.join(SYMMETRY_BREAKING_MODES)}")
+        if engine not in ENGINES:
+            raise ValueError(f"未知的求解引擎 '{engine}'，可選: {', '.join(ENGINES)}")
+        if relax and self.model_definitely_infeasible:
+            return self._solve_without_mandatory_break({"model_builder": model_builder, "symmetry_breaking": symmetry_breaking, "engine": engine})
+        if engine == "interval" and (self.fixed_assignments or self.history_slots or any(self.prior_work_counts)):
+            raise ValueError("區間引擎 (engine=\"interval\") 不支持固定安排和多日排班的累計狀態，請改用 exact 引擎。")
+        if engine == "fast":
+            solution_grid, report = self.solve_fast(); report["engine"] = engine
+            return solution_grid, report
+
+        # --- 提前檢查是否無解 ---
+        if self.model_definitely_infeasible:
+            solution_grid, report = self._pre_solve_infeasible_report(); report["engine"] = engine
+            return solution_grid, report
+
+        # --- 解析下界：沒有任何需求可被覆蓋時，全員休息即為最優解 ---
+        extras = {"engine": engine, "presolve": self.run_presolve()}
+        lower_bound = extras["presolve"]["lower_bound"]
+        # --- 上一次的排班 (增量求解)：仍然合法且未填補數已達下界時直接沿用，一格都不用改 ---
+        previous = self._previous_values
+        if previous is not None:
+            extras["previous"] = {"unfilled": self._count_unfilled(previous), "valid": not check_hard_rules(self, previous)}
+            if extras["previous"]["valid"] and extras["previous"]["unfilled"] <= lower_bound:
+                solution_grid, report = self._build_solution_report("OPTIMAL", previous)
+                report.update(extras); report["solved_by"] = "previous"; report["changed_cells"] = 0
+                return solution_grid, report
+        if lower_bound == extras["presolve"]["total_demand"] and not self._minimal_change and not check_hard_rules(self, self.pinned_rows()):
+            solution_grid, report = self._build_solution_report("OPTIMAL", self.pinned_rows())
+            report.update(extras); report["solved_by"] = "presolve"
+            return solution_grid, report
+
+        # --- 啟發式初始解：未填補數已達下界時不必再建模求解 (最小改動模式下啟發式解與上一次的排班無關，仍需求解) ---
+        hint_values, heuristic_summary = self.run_heuristic()
+        extras["heuristic"] = heuristic_summary
+        if heuristic_summary["valid"] and heuristic_summary["unfilled"] <= lower_bound and not self._minimal_change:
+            solution_grid, report = self._build_solution_report("OPTIMAL", hint_values)
+            report.update(extras); report["solved_by"] = "heuristic"
+            return solution_grid, report
+        # 提示來源：上一次的排班在最小改動模式下、或合法且比啟發式解更好時優先
+        hint_valid, hint_unfilled, hint_source = heuristic_summary["valid"], heuristic_summary["unfilled"], "heuristic"
+        if previous is not None and (self._minimal_change or (extras["previous"]["valid"] and (not hint_valid or extras["previous"]["unfilled"] < hint_unfilled))):
+            hint_values, hint_valid, hint_unfilled, hint_source = previous, extras["previous"]["valid"], extras["previous"]["unfilled"], "previous"
+
+        build_started = time.perf_counter()
+        if engine == "interval": # 工作段已按時間排序，員工間的對稱性由 CP-SAT 自行處理
+            extras["max_stints_per_employee"] = self.max_stints_per_employee(hint_values if hint_valid else None)
+            built = self._build_interval_model(extras["max_stints_per_employee"])
+        else:
+            built = self._build_boolean_model() if model_builder == "boolean" else self._build_integer_model()
+        model = built.model
+        # 最小改動模式下員工不可互換 (每人都要盡量保持原來的安排)，不做對稱性破除
+        if engine != "interval" and not self._minimal_change and self.employees_are_homogeneous() and (symmetry_breaking == "lex" or (symmetry_breaking == "auto" and self.num_employees >= SYMMETRY_BREAKING_AUTO_MIN_EMPLOYEES)):
+            self._add_symmetry_breaking(model, built.is_work)
+            # 提示必須符合字典序約束：員工可互換，把各行按工作向量降序重排即可
+            hint_values = sorted(hint_values, key=lambda row: [v != REST_R_CODE for v in row], reverse=True)
+        if hint_valid or hint_source == "previous": # 不合法的上一次排班同樣是有用的提示，CP-SAT 會修復衝突的部分
+            built.add_hint(hint_values)
+        if lower_bound > 0: # 告訴求解器目標值的下界，找到達到下界的解後即可證明最優並停止
+            model.Add(sum(self.unfilled_penalties) >= lower_bound)
+        initial_objective = hint_unfilled
+        if self._minimal_change: # 字典序目標：未填補數的權重大於所有格子都改動的總數
+            unfilled_weight = self.num_employees * self.num_slots + 1
+            model.Minimize(sum(self.unfilled_penalties) * unfilled_weight + sum(built.cell_differs(e, s, previous[e][s]) for e in range(self.num_employees) for s in range(self.num_slots)))
+            initial_objective = hint_unfilled * unfilled_weight + self._count_changes(previous, hint_values)
+        self._add_timing("build", build_started); self._record_model_size(model)
 
         # --- 求解 ---
         solver = cp_model.CpSolver() # (同前)
-        solver.parameters.max_time_in_seconds = 115.0
-        status = solver.Solve(model)
+        self.solve_stats["policy"] = solver_policy.configure(solver, self._time_limit_seconds,
+                                                             self._num_workers, self._deadline, self._relative_gap_limit)
+        if hint_valid or hint_source == "previous": solver.parameters.hint_conflict_limit = 100 # 默認 10 次衝突常常不足以補全提示中未覆蓋的輔助變量
+        if hint_valid: self._emit_progress(hint_values, initial_objective, lower_bound)
+        stopped_early = self._stop_event is not None and self._stop_event.is_set()
+        if stopped_early and hint_valid: # 客戶端已接受初始解，無需再搜索
+            solution_grid, report = self._build_solution_report("FEASIBLE", hint_values)
+            report.update(extras); report["solved_by"] = hint_source; report["stopped_early"] = True
+            return solution_grid, report
+        solve_started = time.perf_counter()
+        status = self._run_solver(solver, model, built, lower_bound)
+        self._add_timing("solve", solve_started); self._record_solver_stats(solver, status)
+        if self._stop_event is not None and self._stop_event.is_set() and status != cp_model.OPTIMAL: extras["stopped_early"] = True
 
         # --- 報告生成 ---
-        solution_grid = {}; report = {"status": solver.StatusName(status), "employee_stats": [], "unfilled_job_slots": [], "job_assignments_count": collections.defaultdict(int)} # (同前)
-        if status == cp_model.OPTIMAL or status == cp_model.FEASIBLE: # (報告生成邏輯同前)
-            for e in range(self.num_employees):
-                emp_name = f'K{e+1}'; solution_grid[emp_name] = [""] * self.num_slots; work_count = 0; rest_count = 0; current_schedule_display = []
-                for s_idx in range(self.num_slots): 
-                    task_val = solver.Value(tasks[e, s_idx]); actual_slot_abs = s_idx + self.schedule_start_slot; slot_time_str_display = slot_to_time_str(actual_slot_abs)
-                    if task_val == REST_R_CODE: solution_grid[emp_name][s_idx] = "R"; current_schedule_display.append((slot_time_str_display, "R")); rest_count += 1
-                    else: job_name = self.int_to_job_code.get(task_val, f"JOB_{task_val}"); solution_grid[emp_name][s_idx] = job_name; current_schedule_display.append((slot_time_str_display, job_name)); work_count += 1; report["job_assignments_count"][job_name] += 1
-                report["employee_stats"].append({"employee": emp_name, "W_count": work_count, "R_count": rest_count, "schedule_details": current_schedule_display})
-            if hasattr(self, 'demand_met_vars') and self.demand_met_vars : 
-                for (job_int, s_rel), met_var in self.demand_met_vars.items():
-                    if not solver.Value(met_var): job_name = self.int_to_job_code.get(job_int, f"JOB_{job_int}"); slot_time_str_display = slot_to_time_str(s_rel + self.schedule_start_slot); report["unfilled_job_slots"].append({"job_code": job_name, "time_slot": slot_time_str_display, "reason": "未能為此崗位時段找到合適員工"})
-        elif status == cp_model.INFEASIBLE: report["infeasible_reason"] = "求解器判定模型不可行。" # (同前)
-        else: report["infeasible_reason"] = f"求解失敗，狀態: {solver.StatusName(status)}" # (同前)
+        if status == cp_model.UNKNOWN and hint_valid: # 時限內未找到解時退回初始解
+            solution_grid, report = self._build_solution_report("FEASIBLE", hint_values)
+            report.update(extras); report["solved_by"] = hint_source
+            if previous is not None: report["changed_cells"] = self._count_changes(previous, hint_values)
+            return solution_grid, report
+        if status == cp_model.OPTIMAL or status == cp_model.FEASIBLE:
+            status_name = solver.StatusName(status)
+            if engine == "interval" and status == cp_model.OPTIMAL and solver.ObjectiveValue() > lower_bound: status_name = "FEASIBLE" # 只相對於區間模型最優 (見 _build_interval_model)
+            if self._relative_gap_limit and status == cp_model.OPTIMAL and solver.ObjectiveValue() > solver.BestObjectiveBound(): status_name = "FEASIBLE" # 因達到差距目標而停止，未證明最優
+            task_values = built.task_values(solver)
+            solution_grid, report = self._build_solution_report(status_name, task_values)
+            if previous is not None: report["changed_cells"] = self._count_changes(previous, task_values)
+        else:
+            solution_grid = {}; report = {"status": solver.StatusName(status), "employee_stats": [], "unfilled_job_slots": [], "job_assignments_count": collections.defaultdict(int)}
+        if status == cp_model.INFEASIBLE: # (同前)
+            report["infeasible_reason"] = "求解器判定模型不可行。"
+            # 解釋與放寬求解共用一個時間預算：不超過請求的 deadline，也不超過本次求解的時間上限
+            diagnose_deadline = time.time() + self._time_limit_seconds + solver_policy.DEADLINE_MARGIN_SECONDS
+            if self._deadline is not None: diagnose_deadline = min(diagnose_deadline, self._deadline)
+            conflict_keys = self.explain_infeasibility(deadline=diagnose_deadline)
+            if conflict_keys is not None:
+                report["conflicting_rules"] = [self._describe_rule(*key) for key in conflict_keys]
+                if conflict_keys: report["infeasible_reason"] += " 互相衝突的規則: " + "、".join(RULE_FAMILIES[family] + ("" if e is None else f" (K{e+1})") for family, e in conflict_keys)
+                relaxed = self._solve_relaxed(conflict_keys, diagnose_deadline) if relax and conflict_keys else None
+                if relaxed is not None:
+                    solution_grid, relaxed_report = relaxed
+                    relaxed_report.update(extras); relaxed_report["relaxed"] = True; relaxed_report["conflicting_rules"] = report["conflicting_rules"]
+                    relaxed_report["original_infeasible_reason"] = report["infeasible_reason"]
+                    return solution_grid, relaxed_report
+        elif status != cp_model.OPTIMAL and status != cp_model.FEASIBLE: report["infeasible_reason"] = f"求解失敗，狀態: {solver.StatusName(status)}" # (同前)
         if status == cp_model.INFEASIBLE or status == cp_model.UNKNOWN or status == cp_model.MODEL_INVALID: # Populate unfilled jobs for failure cases
-            for job_int_val, s_rel_val in self.all_demanded_job_slots: job_name_val = self.int_to_job_code.get(job_int_val, f"JOB_{job_int_val}"); slot_time_str_val = slot_to_time_str(s_rel_val + self.schedule_start_slot); report["unfilled_job_slots"].append({"job_code": job_name_val, "time_slot": slot_time_str_val,"reason": f"模型求解失敗或不可行 ({solver.StatusName(status)})"})
+            report["unfilled_job_slots"] = self._unfilled_entries(f"模型求解失敗或不可行 ({solver.StatusName(status)})")
+        report.update(extras)
+        return solution_grid, report
+
+class WarmUpSolve:
+    """冷啟動預熱任務：建立並用 CP-SAT 求解一個極小的模型 (不經過啟發式捷徑)，使求解子進程的首個真實請求
+    不必承擔 OR-Tools 的首次初始化。solve() 的接口與 ShiftSchedulerWithConstraints.solve 相同，可直接交給求解任務管理器。"""
 
-        return solution_grid, report
\ No newline at end of file
+    def solve(self, num_workers=None, **solve_options):
+        started = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()): # 屏蔽建模時的調試輸出
+            scheduler = ShiftSchedulerWithConstraints(
+                K_employees=2, schedule_period_str="09:00-12:00", job_requirements_raw=("A 09:00-12:00", "B 10:00-11:00"),
+                max_consecutive_work_minutes=60, rest_duration_minutes_after_work=30,
+                enable_mandatory_break=True, designated_global_break_period_str="10:00-11:30", min_mandatory_break_minutes=30)
+            built = scheduler._build_integer_model()
+        solver = cp_model.CpSolver()
+        solver.parameters.num_workers = num_workers or 1; solver.parameters.max_time_in_seconds = 10.0
+        status = solver.Solve(built.model)
+        return {}, {"status": solver.StatusName(status), "elapsed_ms": round((time.perf_counter() - started) * 1000, 2)}
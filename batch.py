@@ -0,0 +1,120 @@
+# batch.py
+# 批量場景求解：同一基礎實例配合多組參數覆蓋 (例如 6/7/8 名員工、不同落場時段)，
+# 去重後經求解任務管理器並行求解，受全局時間預算約束，並用已證明最優的結果提前剪枝其他場景。
+import math
+import time
+import collections
+
+from job_queue import QueueFullError, JOB_DONE
+from heuristic import REST, check_hard_rules
+from presolve import analyze as analyze_instance
+
+MAX_BATCH_SCENARIOS = 32
+DEFAULT_TIME_BUDGET_SECONDS = 110.0
+MAX_TIME_BUDGET_SECONDS = 600.0
+
+
+class BatchScenario:
+    def __init__(self, index, name, overrides):
+        self.index = index
+        self.name = name
+        self.overrides = overrides
+        self.scheduler = None
+        self.solve_options = {}
+        self.key = None
+        self.error = None
+        self.job = None
+        self.duplicate_of = None # 與之前某個場景規範化後完全相同
+        self.pruned_by = None # 直接沿用另一場景已證明最優的排班
+        self.result = None # (solution_grid, report)
+        self.skipped = False # 全局時間預算用盡，未開始求解
+
+    def to_dict(self):
+        data = {"index": self.index, "name": self.name, "overrides": self.overrides}
+        source = self.duplicate_of or self
+        if self.error:
+            data.update(status="ERROR", error=self.error)
+        elif source.result is not None:
+            solution_grid, report = source.result
+            data.update(status=report.get("status"), solution_grid=solution_grid, report=report)
+        elif source.job is not None and source.job.status != JOB_DONE:
+            data.update(status="ERROR", error=source.job.error or source.job.status)
+        else:
+            data.update(status="SKIPPED", error="批量求解的時間預算已用盡，此場景未被求解。")
+        if self.duplicate_of is not None: data["duplicate_of"] = self.duplicate_of.index
+        if source.pruned_by is not None: data["pruned_by"] = source.pruned_by.index
+        return data
+
+
+def _task_values_from_grid(scheduler, solution_grid):
+    # 把另一場景的排班網格換算成本場景的 task_values；員工數、時隙數或崗位代碼不一致時返回 None
+    if len(solution_grid) != scheduler.num_employees: return None
+    task_values = []
+    for e in range(scheduler.num_employees):
+        row = solution_grid.get(f'K{e+1}')
+        if row is None or len(row) != scheduler.num_slots: return None
+        values = []
+        for cell in row:
+            if cell == "R": values.append(REST)
+            elif cell in scheduler.job_code_to_int: values.append(scheduler.job_code_to_int[cell])
+            else: return None
+        task_values.append(values)
+    return task_values
+
+
+def prune_with_result(source, targets):
+    # source 的排班若對 target 同樣滿足全部硬性規則，且未填補數已達 target 的解析下界，則它就是 target 的最優解。
+    # 典型情形：更寬鬆的連續工作上限/休息/落場設定。員工人數不同時因規則 5 (+-1 平衡) 不能直接沿用，不做剪枝。
+    solution_grid, report = source.result
+    if report.get("status") != "OPTIMAL": return
+    for target in targets:
+        sch = target.scheduler
+        if target.pruned_by is not None or sch.model_definitely_infeasible or sch.schedule_start_slot != source.scheduler.schedule_start_slot \
+                or sch.slot_duration_minutes != source.scheduler.slot_duration_minutes: continue
+        task_values = _task_values_from_grid(sch, solution_grid)
+        if task_values is None or check_hard_rules(sch, task_values): continue
+        unfilled = sch._count_unfilled(task_values)
+        if unfilled and unfilled > analyze_instance(sch)["lower_bound"]: continue
+        target_grid, target_report = sch._build_solution_report("OPTIMAL", task_values)
+        target_report["solved_by"] = "batch_pruning"
+        target.pruned_by, target.result = source, (target_grid, target_report)
+
+
+def run_batch(scenarios, submit, accept, max_parallel, time_budget_seconds, default_time_limit):
+    """submit(scenario) 返回 SolveJob (可能拋出 QueueFullError)；accept(job_id) 讓運行中的任務交回目前最佳解。"""
+    unique = []; first_by_key = {}
+    for scenario in scenarios:
+        if scenario.error: continue
+        if scenario.key in first_by_key: scenario.duplicate_of = first_by_key[scenario.key]
+        else: first_by_key[scenario.key] = scenario; unique.append(scenario)
+    if not unique: return
+    # 每個場景的 CP-SAT 時限：按並行度分波，保證全部波次在預算內完成
+    waves = math.ceil(len(unique) / max_parallel)
+    time_limit = max(1.0, min(default_time_limit, time_budget_seconds / waves))
+    for scenario in unique: scenario.solve_options = dict(scenario.solve_options, time_limit_seconds=time_limit)
+
+    deadline = time.monotonic() + time_budget_seconds
+    pending = collections.deque(unique); running = []; stopping = False
+    while pending or running:
+        if not stopping and time.monotonic() >= deadline:
+            stopping = True
+            for scenario in running: accept(scenario.job.job_id)
+            for scenario in pending: scenario.skipped = True
+            pending.clear()
+        while pending and len(running) < max_parallel:
+            scenario = pending.popleft()
+            if scenario.pruned_by is not None: continue
+            try:
+                scenario.job = submit(scenario)
+            except QueueFullError:
+                pending.appendleft(scenario); break # 其他請求佔滿了隊列，稍後再試
+            running.append(scenario)
+        finished = [scenario for scenario in running if scenario.job.wait(0)]
+        for scenario in finished:
+            running.remove(scenario)
+            if scenario.job.status == JOB_DONE:
+                scenario.result = (scenario.job.solution_grid, scenario.job.report)
+                prune_with_result(scenario, pending)
+        if not finished:
+            if running: running[0].job.wait(0.1)
+            else: time.sleep(0.1)
@@ -0,0 +1,2 @@
+# benchmarks/
+# 排班求解性能基準測試腳本，以 `python -m benchmarks.<模塊名>` 在項目根目錄運行。
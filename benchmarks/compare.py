@@ -0,0 +1,64 @@
+# benchmarks/compare.py
+# 對比兩次 benchmarks.runner 的結果：按實例 id 配對，報告耗時比、狀態變化和未填補數變化。
+# 耗時以幾何平均匯總；單個實例的耗時低於 MIN_TIME_SECONDS 時按該值計，避免毫秒級實例的噪聲主導比值。
+# 用法: python -m benchmarks.compare baseline.jsonl current.jsonl --max-slowdown 1.25
+# 出現質量回歸 (未填補數變多、由可行變為無解) 或幾何平均耗時比超過 --max-slowdown 時退出碼為 1，可直接用於 CI。
+import argparse
+import json
+import math
+import sys
+
+MIN_TIME_SECONDS = 0.05
+SOLVED_STATUSES = ("OPTIMAL", "FEASIBLE")
+
+
+def load_results(path):
+    with open(path, encoding="utf-8") as f:
+        return {record["id"]: record for record in map(json.loads, filter(str.strip, f))}
+
+
+def compare(baseline, current):
+    """返回 (逐實例對比行, 匯總)。只對比兩邊都有的實例。"""
+    rows = []
+    for instance_id in sorted(set(baseline) & set(current)):
+        old, new = baseline[instance_id], current[instance_id]
+        ratio = max(new["wall_s"], MIN_TIME_SECONDS) / max(old["wall_s"], MIN_TIME_SECONDS)
+        regression = None
+        if old["status"] in SOLVED_STATUSES and new["status"] not in SOLVED_STATUSES: regression = "status"
+        elif old.get("unfilled") is not None and new.get("unfilled") is not None and new["unfilled"] > old["unfilled"]: regression = "unfilled"
+        rows.append({"id": instance_id, "baseline_s": old["wall_s"], "current_s": new["wall_s"], "ratio": round(ratio, 3),
+                     "baseline_status": old["status"], "current_status": new["status"],
+                     "baseline_unfilled": old.get("unfilled"), "current_unfilled": new.get("unfilled"), "regression": regression})
+    summary = {
+        "compared": len(rows), "only_in_baseline": len(set(baseline) - set(current)), "only_in_current": len(set(current) - set(baseline)),
+        "geomean_ratio": round(math.exp(sum(math.log(row["ratio"]) for row in rows) / len(rows)), 3) if rows else None,
+        "regressions": sum(1 for row in rows if row["regression"]),
+        "improved_unfilled": sum(1 for row in rows if row["baseline_unfilled"] is not None and row["current_unfilled"] is not None and row["current_unfilled"] < row["baseline_unfilled"]),
+        "newly_optimal": sum(1 for row in rows if row["current_status"] == "OPTIMAL" and row["baseline_status"] != "OPTIMAL"),
+    }
+    return rows, summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="對比兩次基準測試結果")
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--max-slowdown", type=float, default=None, help="幾何平均耗時比的上限，超過即視為回歸")
+    parser.add_argument("--json", action="store_true", help="以 JSON 輸出完整對比")
+    args = parser.parse_args()
+
+    rows, summary = compare(load_results(args.baseline), load_results(args.current))
+    if args.json:
+        print(json.dumps({"rows": rows, "summary": summary}, ensure_ascii=False, indent=2))
+    else:
+        print(f"{'實例':>16} | {'基準':>8} | {'當前':>8} | {'比值':>6} | {'狀態':>21} | {'未填補':>9} | 回歸")
+        for row in rows:
+            print(f"{row['id']:>16} | {row['baseline_s']:7.3f}s | {row['current_s']:7.3f}s | {row['ratio']:6.2f} | "
+                  f"{row['baseline_status']:>10}>{row['current_status']:<10} | {row['baseline_unfilled']!s:>4}>{row['current_unfilled']!s:<4} | {row['regression'] or ''}")
+        print(" ".join(f"{key}={value}" for key, value in summary.items()))
+    slow = args.max_slowdown is not None and summary["geomean_ratio"] is not None and summary["geomean_ratio"] > args.max_slowdown
+    sys.exit(1 if summary["regressions"] or slow else 0)
+
+
+if __name__ == "__main__":
+    main()
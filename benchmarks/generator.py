@@ -0,0 +1,93 @@
+# benchmarks/generator.py
+# 可重現的合成排班實例：給定分級 (tier) 和種子，總是生成相同的一組 /schedule 請求體。
+# 變化的維度：員工人數、排班時段長度、崗位數、需求密度 (每個崗位有需求的時間比例及分段數) 及每時隙需求人數、
+# 人手充裕程度、連續工作上限與強制休息、強制落場、時隙長度。
+# 用法: python -m benchmarks.generator --tier ci --seed 0 > instances.jsonl
+import argparse
+import collections
+import json
+import random
+
+from backend_api import slot_to_time_str
+
+# count: 實例數；time_limit: 每個實例的 CP-SAT 時間上限 (秒)；其餘為 (最小, 最大) 範圍或候選值
+Tier = collections.namedtuple("Tier", ["count", "time_limit", "employees", "hours", "jobs", "density", "staffing", "slot_durations", "break_probability"])
+
+TIERS = {
+    # CI: 幾十秒內跑完，只覆蓋小實例，用於發現明顯的回歸
+    "ci": Tier(count=12, time_limit=5.0, employees=(2, 6), hours=(6, 10), jobs=(1, 3), density=(0.4, 1.0), staffing=(0.8, 1.6),
+               slot_durations=(30,), break_probability=0.5),
+    # 中等: 典型的單日門店排班
+    "medium": Tier(count=20, time_limit=20.0, employees=(4, 12), hours=(8, 16), jobs=(2, 5), density=(0.3, 1.0), staffing=(0.8, 1.6),
+                   slot_durations=(30, 30, 15), break_probability=0.6),
+    # 大: 人數多、時隙細，用於暴露規模增長時的性能斷崖
+    "large": Tier(count=10, time_limit=60.0, employees=(10, 30), hours=(12, 24), jobs=(4, 10), density=(0.3, 1.0), staffing=(0.8, 1.5),
+                  slot_durations=(30, 15, 10), break_probability=0.7),
+}
+
+
+def _random_ranges(rng, start, end, slot, density):
+    # 在 [start, end) 分鐘內生成 1-3 段需求時段，總長約為 density * (end - start)，端點對齊時隙
+    total = max(slot, int((end - start) * density) // slot * slot)
+    pieces = rng.randint(1, 3) if total >= 3 * slot else 1
+    lengths = [total // pieces // slot * slot] * pieces; lengths[-1] += total - sum(lengths)
+    gaps = (end - start - total) // slot
+    cuts = sorted(rng.randint(0, gaps) for _ in range(pieces))
+    ranges, cursor, used_gap = [], start, 0
+    for length, cut in zip(lengths, cuts):
+        cursor += (cut - used_gap) * slot; used_gap = cut
+        ranges.append(f"{slot_to_time_str(cursor, 1)}-{slot_to_time_str(cursor + length, 1)}")
+        cursor += length
+    return ranges
+
+
+def generate_instance(rng, tier):
+    """生成一個 /schedule 請求體 (dict)。"""
+    slot = rng.choice(tier.slot_durations)
+    start = rng.randrange(5 * 60, 10 * 60 + 1, 30)
+    end = start + rng.randint(*tier.hours) * 60
+    employees = rng.randint(*tier.employees)
+    job_count = rng.randint(*tier.jobs)
+    densities = [rng.uniform(*tier.density) for _ in range(job_count)]
+    # 需求由人數反推：平均同時需求約為 人數 / (充裕系數 * 1.5)；系數小於 1 時需求不可能全部覆蓋，求解器須證明下界。
+    # 崗位數有限，同時需求不夠時用 "*N" 讓每個崗位每時隙需要多人
+    target_demand = employees / (rng.uniform(*tier.staffing) * 1.5)
+    headcount = max(1, round(target_demand / sum(densities)))
+    count_suffix = f"*{headcount}" if headcount > 1 else ""
+    job_requirements = [f"J{j}{count_suffix} {','.join(_random_ranges(rng, start, end, slot, density))}" for j, density in enumerate(densities)]
+    payload = {
+        "k_employees": employees,
+        "schedule_period": f"{slot_to_time_str(start, 1)}-{slot_to_time_str(end, 1)}",
+        "job_requirements": job_requirements,
+        "max_consecutive_work_minutes": rng.choice([90, 120, 150, 180, 240]),
+        "rest_duration_minutes_after_work": rng.choice([30, 60]),
+        "slot_duration_minutes": slot,
+        "enable_mandatory_break": False,
+    }
+    if rng.random() < tier.break_probability:
+        break_start = rng.randrange(start + 120, max(start + 150, end - 180), 30)
+        break_minutes = rng.choice([30, 60])
+        payload.update(enable_mandatory_break=True, min_mandatory_break_minutes=break_minutes,
+                       designated_global_break_period=f"{slot_to_time_str(break_start, 1)}-{slot_to_time_str(break_start + break_minutes + rng.choice([30, 60, 120]), 1)}")
+    return payload
+
+
+def generate(tier_name, seed=0, count=None):
+    """返回 [(實例 id, 請求體), ...]；相同的 (tier_name, seed) 總是得到相同的實例。"""
+    tier = TIERS[tier_name]
+    rng = random.Random(f"{tier_name}:{seed}")
+    return [(f"{tier_name}-{seed}-{index}", generate_instance(rng, tier)) for index in range(count or tier.count)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="生成合成排班實例 (每行一個 JSON 請求體)")
+    parser.add_argument("--tier", choices=sorted(TIERS), default="ci")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--count", type=int, default=None)
+    args = parser.parse_args()
+    for instance_id, payload in generate(args.tier, args.seed, args.count):
+        print(json.dumps({"id": instance_id, "payload": payload}, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+# benchmarks/loadtest.py
+# 回放錄製的 /schedule 請求 (request_capture.py 的輸出，或 benchmarks.generator 的輸出) 對本地運行的服務做壓測，
+# 報告時延 p50/p95/p99、超時、狀態碼分佈，以及壓測期間服務端的 CPU 用量 (讀取 /metrics 的累計 CPU 秒數)。
+# 到達模式: --rate R 為開環 (每秒 R 個請求，--arrival 選固定間隔或泊松)，--rate 0 為閉環 (並發數個客戶端連續發送)，
+# --original-timing 按錄製時的請求間隔 (除以 --speedup)。開環時時延從計劃到達時刻起算，客戶端排隊的時間同樣計入。
+# 用法: python -m benchmarks.loadtest captured.jsonl --url http://127.0.0.1:8080 --concurrency 8 --rate 2 --duration 120
+import argparse
+import concurrent.futures
+import json
+import math
+import random
+import socket
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+
+from benchmarks.runner import iter_records
+
+CPU_METRICS = ("scheduler_process_cpu_seconds_total", "scheduler_solve_cpu_seconds_total")
+
+
+def percentile(sorted_values, fraction):
+    # 最近秩法 (nearest-rank)
+    if not sorted_values: return None
+    return sorted_values[max(0, math.ceil(fraction * len(sorted_values)) - 1)]
+
+
+def scrape_cpu_seconds(base_url, timeout=5.0):
+    """讀取服務端的累計 CPU 秒數；/metrics 不可用時返回 None。"""
+    try:
+        with urllib.request.urlopen(f"{base_url}/metrics", timeout=timeout) as response:
+            text = response.read().decode("utf-8")
+    except (OSError, urllib.error.URLError):
+        return None
+    values = {}
+    for line in text.splitlines():
+        name, _, value = line.partition(" ")
+        if name in CPU_METRICS: values[name] = float(value)
+    return values
+
+
+def send(url, payload, timeout):
+    # 返回 (HTTP 狀態碼 或 None, 是否超時, 錯誤信息)
+    request = urllib.request.Request(url, data=json.dumps(payload).encode("utf-8"), headers={"Content-Type": "application/json"}, method="POST")
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            response.read()
+            return response.status, False, None
+    except urllib.error.HTTPError as e:
+        return e.code, False, None
+    except (socket.timeout, TimeoutError):
+        return None, True, "timeout"
+    except urllib.error.URLError as e:
+        timed_out = isinstance(e.reason, (socket.timeout, TimeoutError))
+        return None, timed_out, "timeout" if timed_out else str(e.reason)
+
+
+def arrival_offsets(records, args):
+    # 每個請求相對於壓測開始的計劃發送時刻 (秒)；閉環模式返回 None
+    if args.original_timing:
+        timestamps = [record.get("ts") for record in records]
+        if None in timestamps: raise SystemExit("--original-timing 需要錄製文件中的 ts 字段")
+        offsets, shift = [], 0.0
+        for index, ts in enumerate(timestamps):
+            if index and ts < timestamps[index - 1]: shift += timestamps[index - 1] - ts # --repeat 的下一輪緊接上一輪
+            offsets.append((ts - timestamps[0] + shift) / args.speedup)
+        return offsets
+    if not args.rate: return None
+    rng = random.Random(args.seed); offsets = []; offset = 0.0
+    for _ in records:
+        offsets.append(offset)
+        offset += rng.expovariate(args.rate) if args.arrival == "poisson" else 1.0 / args.rate
+    return offsets
+
+
+def run(records, args):
+    url = args.url.rstrip("/") + args.endpoint
+    offsets = arrival_offsets(records, args)
+    results = []; results_lock = threading.Lock()
+    started = time.monotonic()
+
+    def fire(payload, scheduled=None):
+        scheduled = scheduled or time.monotonic()
+        status, timed_out, error = send(url, payload, args.timeout)
+        with results_lock:
+            results.append({"status": status, "timeout": timed_out, "error": error, "latency_s": time.monotonic() - scheduled})
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        if offsets is None: # 閉環：並發數個請求同時在途
+            for record in records: pool.submit(fire, record["payload"])
+        else:
+            for record, offset in zip(records, offsets):
+                if args.duration and offset > args.duration: break
+                delay = started + offset - time.monotonic()
+                if delay > 0: time.sleep(delay)
+                pool.submit(fire, record["payload"], started + offset)
+    return results, time.monotonic() - started
+
+
+def summarize(results, elapsed_s, cpu_before, cpu_after):
+    latencies = sorted(r["latency_s"] for r in results if r["status"] is not None and 200 <= r["status"] < 300)
+    status_counts = {}
+    for r in results:
+        key = str(r["status"]) if r["status"] is not None else ("timeout" if r["timeout"] else "error")
+        status_counts[key] = status_counts.get(key, 0) + 1
+    summary = {
+        "requests": len(results), "elapsed_s": round(elapsed_s, 2), "throughput_rps": round(len(results) / elapsed_s, 3) if elapsed_s else None,
+        "ok": len(latencies), "timeouts": sum(1 for r in results if r["timeout"]), "status_counts": status_counts,
+        "latency_s": {name: (round(value, 3) if value is not None else None) for name, value in
+                      (("p50", percentile(latencies, 0.50)), ("p95", percentile(latencies, 0.95)), ("p99", percentile(latencies, 0.99)),
+                       ("max", latencies[-1] if latencies else None))},
+    }
+    if cpu_before is not None and cpu_after is not None:
+        cpu = {name: round(cpu_after.get(name, 0.0) - cpu_before.get(name, 0.0), 3) for name in CPU_METRICS}
+        total = sum(cpu.values())
+        # 平均佔用的核數；同一 Web 進程內按 /metrics 統計，多進程部署時只反映被抓取到的那個進程
+        summary["server_cpu"] = {"web_s": cpu[CPU_METRICS[0]], "solve_s": cpu[CPU_METRICS[1]], "cores_used": round(total / elapsed_s, 3) if elapsed_s else None}
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="回放錄製的排班請求做壓測")
+    parser.add_argument("capture", help="錄製的請求 JSONL 文件")
+    parser.add_argument("--url", default="http://127.0.0.1:8080")
+    parser.add_argument("--endpoint", default="/schedule")
+    parser.add_argument("--concurrency", type=int, default=4, help="客戶端最多同時在途的請求數")
+    parser.add_argument("--rate", type=float, default=0.0, help="開環到達率 (請求/秒)；0 為閉環")
+    parser.add_argument("--arrival", choices=("fixed", "poisson"), default="poisson")
+    parser.add_argument("--original-timing", action="store_true", help="按錄製時的請求間隔發送")
+    parser.add_argument("--speedup", type=float, default=1.0, help="與 --original-timing 一起使用，把間隔縮短為 1/speedup")
+    parser.add_argument("--repeat", type=int, default=1, help="把錄製的請求重複多輪")
+    parser.add_argument("--duration", type=float, default=None, help="開環模式下最長的發送時間 (秒)")
+    parser.add_argument("--timeout", type=float, default=130.0, help="單個請求的客戶端超時 (秒)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="以 JSON 輸出匯總")
+    args = parser.parse_args()
+
+    # 按原樣回放請求體 (包括時延預算和會話)，以重現生產流量的特徵
+    records = [{"payload": payload, "ts": record.get("ts")} for _, record, payload in iter_records(args.capture)] * args.repeat
+    if not records: raise SystemExit("錄製文件中沒有可回放的請求")
+
+    base_url = args.url.rstrip("/")
+    cpu_before = scrape_cpu_seconds(base_url)
+    results, elapsed_s = run(records, args)
+    summary = summarize(results, elapsed_s, cpu_before, scrape_cpu_seconds(base_url))
+    if args.json:
+        print(json.dumps(summary, ensure_ascii=False, indent=2))
+    else:
+        latency = summary["latency_s"]
+        print(f"請求 {summary['requests']} 個，成功 {summary['ok']}，超時 {summary['timeouts']}，耗時 {summary['elapsed_s']}s，吞吐 {summary['throughput_rps']} 請求/秒")
+        print(f"時延 p50={latency['p50']}s p95={latency['p95']}s p99={latency['p99']}s max={latency['max']}s")
+        print(f"狀態碼: {summary['status_counts']}")
+        if "server_cpu" in summary: print(f"服務端 CPU: {summary['server_cpu']}")
+        else: print("服務端 CPU: /metrics 不可用", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
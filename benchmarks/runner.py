@@ -0,0 +1,104 @@
+# benchmarks/runner.py
+# 運行一組排班實例並逐行輸出 JSON 結果 (各階段耗時、模型規模、狀態、目標值)，供 benchmarks.compare 對比。
+# 實例來自合成生成器 (--tier/--seed) 或錄製的生產請求體 (--replay，每行一個請求體或 {"id", "payload"})；
+# 請求體經過與 /schedule 相同的參數驗證，並在本進程內直接求解 (不經過求解任務隊列和結果緩存)。
+# 用法: python -m benchmarks.runner --tier ci --out baseline.jsonl
+#       python -m benchmarks.runner --replay captured.jsonl --engine exact --time-limit 30
+import argparse
+import contextlib
+import io
+import json
+import logging
+import sys
+import time
+
+from benchmarks.generator import TIERS, generate
+
+# 回放時只保留決定實例和求解方式的字段；時延預算、會話等與單次求解性能無關
+REPLAY_IGNORED_KEYS = ("latency_budget_seconds", "session_id", "minimal_change", "format")
+
+
+def iter_records(path):
+    """逐行讀取錄製文件，產生 (行號, 記錄, 請求體)。無法解析的行會被跳過並在 stderr 提示。"""
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip(): continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                print(f"跳過第 {line_number} 行: 不是有效的 JSON", file=sys.stderr); continue
+            payload = record.get("payload", record) if isinstance(record, dict) else None
+            if not isinstance(payload, dict) or "k_employees" not in payload:
+                print(f"跳過第 {line_number} 行: 不是排班請求體", file=sys.stderr); continue
+            yield line_number, record, payload
+
+
+def load_replay(path):
+    """讀取錄製的請求，返回 [(實例 id, 請求體), ...]。"""
+    return [(str(record.get("id") or f"replay-{line_number}"), {k: v for k, v in payload.items() if k not in REPLAY_IGNORED_KEYS})
+            for line_number, record, payload in iter_records(path)]
+
+
+def run_instance(instance_id, payload, time_limit, num_workers=None, overrides=None):
+    """求解一個請求體，返回一條結果記錄。"""
+    with contextlib.redirect_stdout(io.StringIO()): # main 在導入時會打印啟動信息，不能混入 stdout 上的結果
+        import main as api # 延遲導入：複用 /schedule 的參數驗證
+        api.load_solver_modules() # main 的求解模塊在首個 /schedule 請求時才導入，這裡不經過請求鉤子
+    payload = dict(payload, **(overrides or {}))
+    record = {"id": instance_id, "engine": payload.get("engine", "exact"), "model_builder": payload.get("model_builder", "integer")}
+    started = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()): # 屏蔽建模時的調試輸出
+            scheduler = api._build_scheduler_from_request(payload)
+            solve_options = api._solve_options_from_request(payload)
+            solution_grid, report = scheduler.solve(time_limit_seconds=time_limit, num_workers=num_workers, **solve_options)
+    except (api.ScheduleRequestError, ValueError) as e:
+        record.update(status="ERROR", error=str(e), wall_s=round(time.perf_counter() - started, 4))
+        return record
+    stats = report.get("stats") or {}
+    solver = stats.get("solver") or {}
+    record.update(
+        status=report["status"], solved_by=report.get("solved_by"), wall_s=round(time.perf_counter() - started, 4),
+        employees=scheduler.num_employees, slots=scheduler.num_slots, jobs=len(scheduler.all_job_ints),
+        demand=scheduler.total_demand(), unfilled=len(report["unfilled_job_slots"]),
+        lower_bound=(report.get("presolve") or {}).get("lower_bound"), objective=solver.get("objective"), best_bound=solver.get("best_bound"),
+        timings_ms=stats.get("timings_ms"), model=stats.get("model"), num_workers=solver.get("num_workers"),
+    )
+    return record
+
+
+def main():
+    parser = argparse.ArgumentParser(description="排班求解基準測試")
+    parser.add_argument("--tier", choices=sorted(TIERS), default="ci")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--count", type=int, default=None, help="只運行前 N 個實例")
+    parser.add_argument("--replay", help="錄製的請求 JSONL 文件 (代替合成實例)")
+    parser.add_argument("--engine", default=None, help="覆蓋所有實例的求解引擎 (exact/fast/interval)")
+    parser.add_argument("--model-builder", default=None, help="覆蓋所有實例的建模方式 (integer/boolean)")
+    parser.add_argument("--time-limit", type=float, default=None, help="每個實例的時間上限，默認取分級的設定 (回放時為 30 秒)")
+    parser.add_argument("--workers", type=int, default=None, help="CP-SAT 線程數，默認按可用核數")
+    parser.add_argument("--out", help="結果 JSONL 文件，默認輸出到 stdout")
+    args = parser.parse_args()
+    logging.disable(logging.INFO) # main 在導入時把日誌級別設為 DEBUG
+
+    if args.replay:
+        instances, time_limit = load_replay(args.replay)[:args.count], args.time_limit or 30.0
+    else:
+        instances, time_limit = generate(args.tier, args.seed, args.count), args.time_limit or TIERS[args.tier].time_limit
+    overrides = {key: value for key, value in (("engine", args.engine), ("model_builder", args.model_builder)) if value}
+
+    out = open(args.out, "w", encoding="utf-8") if args.out else sys.stdout
+    started = time.perf_counter()
+    try:
+        for instance_id, payload in instances:
+            record = run_instance(instance_id, payload, time_limit, args.workers, overrides)
+            out.write(json.dumps(record, ensure_ascii=False) + "\n"); out.flush()
+            print(f"{instance_id:>16} {record['status']:>10} {record['wall_s']:8.3f}s unfilled={record.get('unfilled')} lb={record.get('lower_bound')} "
+                  f"vars={(record.get('model') or {}).get('variables')}", file=sys.stderr)
+    finally:
+        if out is not sys.stdout: out.close()
+    print(f"{len(instances)} 個實例，總耗時 {time.perf_counter() - started:.2f}s", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
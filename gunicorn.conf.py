@@ -0,0 +1,14 @@
+# gunicorn.conf.py
+# Procfile 使用的 gunicorn 鉤子。--preload 時 master 進程導入 main，when_ready 再提前加載 OR-Tools 等求解模塊，
+# worker fork 後直接共用 (copy-on-write)，不必各自導入；每個 worker 在 post_fork 中啟動求解預熱，完成前 /healthz 返回 503。
+
+
+def when_ready(server):
+    if not server.cfg.preload_app: return # 未預加載時 master 不導入應用，由各 worker 在首個請求或預熱時導入
+    import main
+    main.load_solver_modules()
+
+
+def post_fork(server, worker):
+    import main
+    main.start_warm_up()
@@ -0,0 +1,185 @@
+# heuristic.py
+# 毫秒級構造式排班啟發式：按時隙貪心分配工作段 (stint)，再以局部搜索修復工作量平衡並補填未覆蓋需求。
+# 結果既可直接作為快速模式 (engine="fast") 的答案，也可作為 CP-SAT 的 AddHint 初始解。
+# 只依賴 ShiftSchedulerWithConstraints 已解析好的屬性，不導入 ortools。
+import collections
+
+import numpy as np
+
+from presolve import unfilled_units
+
+REST = 0 # 與 backend_api.REST_R_CODE 相同
+
+
+class _HeuristicContext:
+    def __init__(self, scheduler):
+        self.num_employees = scheduler.num_employees
+        self.num_slots = scheduler.num_slots
+        self.max_work = scheduler.max_consecutive_work_slots
+        self.rest_after = scheduler.rest_slots_after_consecutive_work
+        # 規則 1B 只對休息窗口完整落在排班表內的連續工作段生效 (與 CP-SAT 模型一致)
+        self.rest_rule_last_start = self.num_slots - self.max_work - self.rest_after
+        self.break_enabled = scheduler.enable_mandatory_break and not scheduler.model_definitely_infeasible
+        self.break_windows = scheduler.break_windows if self.break_enabled else []
+        self.break_len = scheduler.min_consecutive_rest_slots
+        self.jobs_at_slot = scheduler.jobs_at_slot()
+        self.required = {(job_int, s): count for job_int, s, count in scheduler.demanded_cells()} # (崗位, 時隙) -> 需求人數
+        self.fixed = scheduler.fixed_assignments # {(e, s): 值}，這些格子不可改動
+        self.counted = scheduler.counted_slots() # 計入規則 5 的時隙
+        self.prior_work = scheduler.prior_work_counts
+
+    def run_bounds(self, row, s):
+        start = s
+        while start > 0 and row[start - 1] != REST: start -= 1
+        end = s + 1
+        while end < self.num_slots and row[end] != REST: end += 1
+        return start, end
+
+    def can_work(self, row, s, job_int, e=None):
+        # 檢查把員工 e 的 row[s] 設為 job_int 後，包含 s 的工作段及其前後休息要求是否仍然合法。
+        # 把某格改為休息永遠不會破壞規則 1-3，因此只有「設為工作」需要檢查；固定安排的格子只能是固定的值。
+        pinned = self.fixed.get((e, s))
+        if row[s] != REST or (pinned is not None and pinned != job_int) or (job_int not in self.jobs_at_slot[s] and pinned is None):
+            return False
+        row[s] = job_int
+        try:
+            start, end = self.run_bounds(row, s)
+            if end - start > self.max_work: return False
+            if any(row[t] != job_int for t in range(start, end)): return False # 規則 2: 同一段必須是同一崗位
+            if end - start == self.max_work and start <= self.rest_rule_last_start:
+                if any(row[t] != REST for t in range(end, min(self.num_slots, end + self.rest_after))): return False
+            # 前一工作段若是滿段，本段不能落在其強制休息期內 (start-1 必為休息，只需看之前 rest_after 格)
+            prev_end = next((t for t in range(start - 2, start - 1 - self.rest_after, -1) if t >= 0 and row[t] != REST), None)
+            if prev_end is not None:
+                prev_start, _ = self.run_bounds(row, prev_end)
+                if prev_end + 1 - prev_start == self.max_work and prev_start <= self.rest_rule_last_start: return False
+            if any(start <= s < end and not self.has_break(row, start, end) for start, end in self.break_windows): return False
+            return True
+        finally:
+            row[s] = REST
+
+    def has_break(self, row, break_start, break_end):
+        run = 0
+        for t in range(break_start, break_end):
+            run = run + 1 if row[t] == REST else 0
+            if run >= self.break_len: return True
+        return False
+
+    def is_short(self, coverage, job_int, s):
+        # (崗位, 時隙) 有需求且在崗人數未達需求人數
+        return coverage.get((job_int, s), 0) < self.required.get((job_int, s), 0)
+
+    def work_count(self, e, row):
+        # 規則 5 比較的累計工作格數
+        return self.prior_work[e] + sum(1 for s in self.counted if row[s] != REST)
+
+
+def build_heuristic_schedule(scheduler, max_repair_rounds=None):
+    """返回 (task_values, unfilled_count, is_valid)。task_values[e][s] 為 REST 或崗位整數編碼。"""
+    ctx = _HeuristicContext(scheduler)
+    E, N = ctx.num_employees, ctx.num_slots
+    rows = [[REST] * N for _ in range(E)]
+    for (e, s), value in ctx.fixed.items(): rows[e][s] = value
+    coverage = {key: 0 for key in ctx.required}
+    for row in rows:
+        for s, value in enumerate(row):
+            if (value, s) in coverage: coverage[value, s] += 1
+    work = [ctx.work_count(e, rows[e]) for e in range(E)]
+
+    # 1. 預留落場：把員工輪流分散到各個可能的連續休息起點 (避開固定的工作格)，避免所有人同時落場
+    reserved = [[False] * N for _ in range(E)]
+    for window_start, window_end in ctx.break_windows:
+        for e in range(E):
+            break_starts = [t for t in range(window_start, window_end - ctx.break_len + 1)
+                            if all(rows[e][u] == REST for u in range(t, t + ctx.break_len))] or [window_start]
+            start = break_starts[e % len(break_starts)]
+            for t in range(start, start + ctx.break_len): reserved[e][t] = True
+
+    # 2. 貪心構造：逐格處理未覆蓋的需求 (需求多人時逐人處理)，交給目前工作量最少且可開始新工作段的員工
+    for s in range(N):
+        for job_int in ctx.jobs_at_slot[s]:
+            while coverage[job_int, s] < ctx.required[job_int, s]:
+                candidates = [e for e in range(E) if not reserved[e][s] and ctx.can_work(rows[e], s, job_int, e)]
+                if not candidates: break
+                e = min(candidates, key=lambda c: (work[c], c))
+                t = s
+                while t < N and t - s < ctx.max_work and not reserved[e][t] and ctx.is_short(coverage, job_int, t) and ctx.can_work(rows[e], t, job_int, e):
+                    rows[e][t] = job_int; coverage[job_int, t] += 1; work[e] += t in ctx.counted; t += 1
+
+    # 3. 局部搜索修復
+    if max_repair_rounds is None: max_repair_rounds = 4 * E * N
+    for _ in range(max_repair_rounds):
+        if max(work) - min(work) <= 1: break
+        if not _rebalance_step(ctx, rows, coverage, work): break
+    if max(work) - min(work) <= 1:
+        _fill_uncovered(ctx, rows, coverage, work)
+
+    unfilled = int(unfilled_units(np.array([ctx.required[key] for key in coverage]), np.array(list(coverage.values()))).sum()) if coverage else 0
+    return rows, unfilled, max(work) - min(work) <= 1
+
+
+def _rebalance_step(ctx, rows, coverage, work):
+    # 依次嘗試：(a) 最輕員工補填未覆蓋需求 (b) 把最重員工段首/段尾的一格轉給最輕員工 (c) 削減最重員工一格
+    heavy = max(range(ctx.num_employees), key=lambda e: work[e])
+    light = min(range(ctx.num_employees), key=lambda e: work[e])
+    for s in ctx.counted:
+        for job_int in ctx.jobs_at_slot[s]:
+            if ctx.is_short(coverage, job_int, s) and ctx.can_work(rows[light], s, job_int, light):
+                rows[light][s] = job_int; coverage[job_int, s] += 1; work[light] += 1
+                return True
+    boundary = [s for s in ctx.counted if rows[heavy][s] != REST and (heavy, s) not in ctx.fixed and
+                (s == 0 or rows[heavy][s - 1] == REST or s == ctx.num_slots - 1 or rows[heavy][s + 1] == REST)]
+    for s in boundary:
+        job_int = rows[heavy][s]
+        rows[heavy][s] = REST
+        if ctx.can_work(rows[light], s, job_int, light):
+            rows[light][s] = job_int; work[heavy] -= 1; work[light] += 1
+            return True
+        rows[heavy][s] = job_int
+    if boundary:
+        s = boundary[-1]
+        if (rows[heavy][s], s) in coverage: coverage[rows[heavy][s], s] -= 1
+        rows[heavy][s] = REST; work[heavy] -= 1
+        return True
+    return False
+
+
+def _fill_uncovered(ctx, rows, coverage, work):
+    # 在不破壞 +-1 平衡的前提下，把仍未覆蓋的需求交給可以接手的員工，直到沒有改進為止
+    improved = True
+    while improved:
+        improved = False
+        for job_int, s in sorted(coverage, key=lambda key: (key[1], key[0])):
+            if not ctx.is_short(coverage, job_int, s): continue
+            for e in sorted(range(ctx.num_employees), key=lambda c: work[c]):
+                others = [w for i, w in enumerate(work) if i != e]
+                new_work = work[e] + (s in ctx.counted)
+                if max(others + [new_work]) - min(others + [new_work]) > 1: continue
+                if ctx.can_work(rows[e], s, job_int, e):
+                    rows[e][s] = job_int; coverage[job_int, s] += 1; work[e] = new_work; improved = True
+                    break
+
+
+def check_hard_rules(scheduler, task_values):
+    """返回違反硬性規則 1-3、固定安排、多人崗位人數上限及規則 5 的描述列表 (空列表表示全部滿足)。"""
+    ctx = _HeuristicContext(scheduler)
+    violations = []
+    for e, row in enumerate(task_values):
+        for s in range(ctx.num_slots):
+            if row[s] == REST: continue
+            job_int = row[s]; row[s] = REST
+            ok = ctx.can_work(row, s, job_int, e)
+            row[s] = job_int
+            if not ok: violations.append(f"員工 K{e+1} 在第 {s} 格的安排違反連續工作/休息/同崗規則"); break
+        if any(not ctx.has_break(row, start, end) for start, end in ctx.break_windows):
+            violations.append(f"員工 K{e+1} 沒有足夠的連續落場休息")
+    violations.extend(f"員工 K{e+1} 在第 {s} 格的安排與固定安排不符" for (e, s), value in sorted(ctx.fixed.items()) if task_values[e][s] != value)
+    # 需求多人的格子在模型中以 max(需求, 固定人數) 為在崗人數上限 (見 _add_shortfall)；重用的舊排班或裁剪後的結果可能超出
+    staffed = collections.Counter((job_int, s) for row in task_values for s, job_int in enumerate(row) if job_int != REST)
+    pinned = collections.Counter((value, s) for (e, s), value in ctx.fixed.items() if value != REST)
+    violations.extend(f"第 {s} 格崗位 {scheduler.int_to_job_code.get(job_int, job_int)} 安排了 {staffed[job_int, s]} 人，超過需求 {required} 人"
+                      for (job_int, s), required in sorted(ctx.required.items()) if required > 1 and staffed[job_int, s] > max(required, pinned[job_int, s]))
+    work = [ctx.work_count(e, row) for e, row in enumerate(task_values)]
+    if work and max(work) - min(work) > 1:
+        violations.append(f"工作量不平衡 (最多 {max(work)} 格，最少 {min(work)} 格)")
+    return violations
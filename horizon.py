@@ -0,0 +1,140 @@
+# horizon.py
+# 多日 (例如一週) 排班：把較長的排班時段切成按天提交的滾動窗口依次求解。每個窗口 =
+# 歷史時隙 (前一窗口已提交排班的結尾，全部固定) + 本窗口要提交的一天 + 前瞻時隙 (只求解不提交)。
+# 歷史時隙把連續工作、強制休息、同崗和落場的狀態帶過窗口邊界；規則 5 按窗口之前的累計工作格數平衡，
+# 每個窗口提交後各員工的累計工作格數都在 +-1 內，因此整個排班時段的工作量同樣平衡。
+# 後一窗口依賴前一窗口提交的排班，窗口只能依次求解；每個窗口本身仍由 CP-SAT 多線程搜索。
+import copy
+import math
+import time
+
+from backend_api import REST_R_CODE, slot_to_time_str, time_to_slot
+from heuristic import check_hard_rules
+from presolve import analyze as analyze_instance
+import solver_policy
+
+DEFAULT_WINDOW_HOURS = 24
+DEFAULT_LOOKAHEAD_HOURS = 4
+MAX_HORIZON_DAYS = 14
+DEFAULT_TIME_BUDGET_SECONDS = 110.0 # 全部窗口共用，須小於求解任務的超時
+# 窗口默認的建模方式 (請求可覆蓋)：帶前瞻和固定歷史的窗口上，整數模型常在時限內停在可行解，布爾模型通常很快證明最優
+DEFAULT_WINDOW_MODEL_BUILDER = "boolean"
+
+
+def repeat_daily(job_requirements, days):
+    """把單日的崗位需求行 (例如 "A 08:00-12:00,13:00-17:00") 擴展為連續 days 天，第 k 天的時段加上 24*k 小時。"""
+    repeated = []
+    for line in job_requirements:
+        parts = line.strip().split(" ", 1)
+        if len(parts) < 2: repeated.append(line); continue # 格式錯誤交給 parse_job_requirements 報告
+        ranges = []
+        for time_range in parts[1].split(','):
+            separator = '–' if '–' in time_range else '-'
+            if separator not in time_range: ranges.append(time_range.strip()); continue
+            start_str, end_str = time_range.split(separator, 1)
+            start, end = time_to_slot(start_str.strip(), 1), time_to_slot(end_str.strip(), 1)
+            if start is None or end is None: ranges.append(time_range.strip()); continue
+            ranges.extend(f"{slot_to_time_str(start + day * 1440, 1)}-{slot_to_time_str(end + day * 1440, 1)}" for day in range(days))
+        repeated.append(f"{parts[0]} {','.join(ranges)}")
+    return repeated
+
+
+class HorizonScheduler:
+    """包裝一個覆蓋整個多日時段的 ShiftSchedulerWithConstraints；solve() 的接口與其相同，可直接交給求解任務管理器。
+    on_solution 收到的是每個已提交窗口的結果 {"day", "solution_grid", "report"}。"""
+
+    def __init__(self, scheduler, window_hours=DEFAULT_WINDOW_HOURS, lookahead_hours=DEFAULT_LOOKAHEAD_HOURS):
+        self.scheduler = scheduler
+        slot_minutes = scheduler.slot_duration_minutes
+        self.window_slots = max(1, int(window_hours * 60) // slot_minutes)
+        # 歷史須容納一整段連續工作及其強制休息 (規則 1) 和一個落場窗口 (規則 3)；
+        # 前瞻同樣至少這麼長，使跨越提交邊界的工作段和落場窗口都由同一窗口完整求解
+        state_slots = max([scheduler.max_consecutive_work_slots + scheduler.rest_slots_after_consecutive_work] +
+                          [end - start for start, end in scheduler.break_windows])
+        self.history_slots = state_slots
+        self.lookahead_slots = max(state_slots, int(lookahead_hours * 60) // slot_minutes)
+
+    def windows(self):
+        # 提交範圍 [(開始, 結束)]，相對於整個排班時段
+        N = self.scheduler.num_slots
+        return [(start, min(N, start + self.window_slots)) for start in range(0, N, self.window_slots)]
+
+    def solve(self, on_solution=None, stop_event=None, time_limit_seconds=None, **solve_options):
+        # time_limit_seconds 為全部窗口的總時間預算，每個窗口分得剩餘預算除以剩餘窗口數
+        sch = self.scheduler
+        solve_options = dict({"model_builder": DEFAULT_WINDOW_MODEL_BUILDER}, **solve_options)
+        if solve_options.get("engine") == "interval":
+            raise ValueError("多日排班需要固定歷史時隙，不支持區間引擎 (engine=\"interval\")，請改用 exact 或 fast。")
+        relaxed_rules = None
+        if sch.model_definitely_infeasible:
+            if not solve_options.get("relax"): return sch.solve(**solve_options)
+            sch = copy.copy(sch) # 與單日排班相同，放寬即取消規則 3
+            sch.enable_mandatory_break = False; sch.break_windows = []; sch.model_definitely_infeasible = False
+            relaxed_rules = [self.scheduler._describe_rule("rule3_mandatory_break", None)]
+        started = time.monotonic()
+        budget = time_limit_seconds or DEFAULT_TIME_BUDGET_SECONDS
+        remaining = solver_policy.remaining_seconds(solve_options.get("deadline")) # 請求的截止時間 (包括排隊等待) 更早時以其為準
+        deadline = started + (budget if remaining is None else max(1.0, min(budget, remaining)))
+        windows = self.windows()
+        rows = [[REST_R_CODE] * sch.num_slots for _ in range(sch.num_employees)]
+        prior = list(sch.prior_work_counts)
+        days = []; timings = {}
+        for index, (commit_start, commit_end) in enumerate(windows):
+            history = min(self.history_slots, commit_start); lookahead = min(self.lookahead_slots, sch.num_slots - commit_end)
+            window = sch.window(commit_start - history, commit_end + lookahead, history, lookahead,
+                                [row[commit_start - history:commit_start] for row in rows], prior)
+            window_started = time.monotonic()
+            time_limit = max(1.0, (deadline - window_started) / (len(windows) - index))
+            solution_grid, report = window.solve(stop_event=stop_event, time_limit_seconds=time_limit, **solve_options)
+            for phase, elapsed_ms in report.get("stats", {}).get("timings_ms", {}).items():
+                timings[phase] = round(timings.get(phase, 0) + elapsed_ms, 2)
+            status, solved_by = report["status"], report.get("solved_by")
+            if status in ("OPTIMAL", "FEASIBLE"):
+                values = [[REST_R_CODE if cell == "R" else sch.job_code_to_int[cell] for cell in solution_grid[f'K{e+1}']] for e in range(sch.num_employees)]
+            elif not check_hard_rules(window, window.pinned_rows()):
+                # 時限內沒有找到解 (例如已提前接受)：歷史時隙之後全部休息永遠合法，保證後續窗口仍可繼續
+                values, status, solved_by = window.pinned_rows(), "FEASIBLE", "rest_fallback"
+            else:
+                return {}, self._failure_report(report, index, days)
+            for e, row in enumerate(rows):
+                row[commit_start:commit_end] = values[e][history:history + commit_end - commit_start]
+                prior[e] += sum(1 for v in row[commit_start:commit_end] if v != REST_R_CODE)
+
+            day_grid, day_report = sch.window(commit_start, commit_end)._build_solution_report(status, [row[commit_start:commit_end] for row in rows])
+            day_report.update(schedule_start_slot=sch.schedule_start_slot + commit_start, slot_duration_minutes=sch.slot_duration_minutes,
+                              engine=report.get("engine"), solved_by=solved_by, stats=report.get("stats"),
+                              window={"start": slot_to_time_str(window.schedule_start_slot, sch.slot_duration_minutes),
+                                      "end": slot_to_time_str(window.schedule_end_slot, sch.slot_duration_minutes),
+                                      "history_slots": history, "lookahead_slots": lookahead, "time_limit_seconds": round(time_limit, 2)})
+            days.append({"day": index, "status": status, "solved_by": solved_by, "unfilled": len(day_report["unfilled_job_slots"]),
+                         "elapsed_s": round(time.monotonic() - window_started, 3)})
+            if on_solution is not None:
+                try:
+                    on_solution({"day": index, "solution_grid": day_grid, "report": day_report})
+                except Exception as e: # 推送失敗 (例如客戶端已斷開) 不影響求解
+                    print(f"推送多日排班結果失敗: {e}")
+
+        # 滾動窗口只保證每個窗口內最優；總未填補數達到整個時段的解析下界時才是全局最優
+        analysis = analyze_instance(sch)
+        unfilled = sum(day["unfilled"] for day in days)
+        status = "OPTIMAL" if unfilled <= analysis["lower_bound"] else "FEASIBLE"
+        solution_grid, report = sch._build_solution_report(status, rows)
+        violations = check_hard_rules(sch, rows)
+        if violations: report["violations"] = violations[:5]
+        report.update(engine=solve_options.get("engine", "exact"), presolve=analysis, days=days,
+                      schedule_start_slot=sch.schedule_start_slot, slot_duration_minutes=sch.slot_duration_minutes,
+                      horizon={"windows": len(windows), "window_slots": self.window_slots, "history_slots": self.history_slots,
+                               "lookahead_slots": self.lookahead_slots, "elapsed_s": round(time.monotonic() - started, 3)},
+                      stats={"timings_ms": dict(timings, parse=sch.parse_ms), "model": None, "solver": None})
+        if relaxed_rules: report.update(relaxed=True, relaxed_rules=relaxed_rules, original_infeasible_reason=self.scheduler.infeasible_reason)
+        if stop_event is not None and stop_event.is_set(): report["stopped_early"] = True
+        return solution_grid, report
+
+    def _failure_report(self, report, index, days):
+        report = dict(report, days=days)
+        report["infeasible_reason"] = f"第 {index + 1} 個窗口求解失敗: {report.get('infeasible_reason') or report['status']}"
+        return report
+
+    @staticmethod
+    def num_days(scheduler, window_hours=DEFAULT_WINDOW_HOURS):
+        return math.ceil(scheduler.num_slots * scheduler.slot_duration_minutes / (window_hours * 60))
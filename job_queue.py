@@ -0,0 +1,276 @@
+# job_queue.py
+# 排班求解任務隊列：以有上限的子進程池執行 CP-SAT 求解，避免 Web worker 被長時間佔用。
+import os
+import time
+import uuid
+import logging
+import threading
+import collections
+import multiprocessing
+from multiprocessing.connection import wait as wait_for_connections
+
+import solver_policy
+
+logger = logging.getLogger(__name__)
+
+# --- 任務狀態 ---
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+JOB_CANCELLED = "cancelled"
+FINISHED_JOB_STATES = (JOB_DONE, JOB_FAILED, JOB_CANCELLED)
+
+
+class QueueFullError(Exception):
+    """等待隊列已滿，拒絕接收新任務 (admission control)。"""
+
+
+def _run_solve_job(scheduler, solve_kwargs, conn, stop_event=None, stream=False):
+    # 子進程入口：scheduler 已在 Web 進程中解析完成，這裡只負責求解並回傳結果。
+    # stream 為 True 時把每個中間解以 ("progress", event, None) 發回；stop_event 用於「接受目前最佳解」
+    try:
+        if stream: solve_kwargs = dict(solve_kwargs, on_solution=lambda event: conn.send(("progress", event, None)))
+        if stop_event is not None: solve_kwargs = dict(solve_kwargs, stop_event=stop_event)
+        cpu_started = time.process_time() # 整個子進程 (包括 CP-SAT 的全部搜索線程) 的 CPU 時間
+        solution_grid, report = scheduler.solve(**solve_kwargs)
+        report = dict(report, stats=dict(report.get("stats") or {}, cpu_s=round(time.process_time() - cpu_started, 3)))
+        conn.send(("result", solution_grid, report))
+    except Exception as e:
+        conn.send(("error", f"{type(e).__name__}: {e}", None))
+    finally:
+        conn.close()
+
+
+class SolveJob:
+    def __init__(self, scheduler, solve_kwargs, on_done=None, stream=False):
+        self.job_id = uuid.uuid4().hex
+        self.scheduler = scheduler
+        self.solve_kwargs = solve_kwargs or {}
+        self.on_done = on_done # 成功完成後在調度線程中調用 on_done(job)
+        self.status = JOB_QUEUED
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.solution_grid = None
+        self.report = None
+        self.error = None
+        self.process = None
+        self.conn = None
+        self.stream = stream
+        self.stop_event = None # 運行時由管理器創建 (multiprocessing.Event)
+        self.events = [] # 流式任務的中間解事件
+        self._done = threading.Event()
+        self._events_changed = threading.Condition()
+
+    def wait(self, timeout=None):
+        return self._done.wait(timeout)
+
+    def wait_for_events(self, start_index, timeout=None):
+        # 返回 (events[start_index:], 任務是否已結束)；沒有新事件時最多等待 timeout 秒
+        with self._events_changed:
+            if len(self.events) <= start_index and not self._done.is_set():
+                self._events_changed.wait(timeout)
+            return self.events[start_index:], self._done.is_set()
+
+    def _notify(self, event=None):
+        with self._events_changed:
+            if event is not None: self.events.append(event)
+            self._events_changed.notify_all()
+
+    def to_dict(self, include_result=True):
+        data = {"job_id": self.job_id, "status": self.status, "created_at": self.created_at,
+                "started_at": self.started_at, "finished_at": self.finished_at}
+        if self.error: data["error"] = self.error
+        if include_result and self.status == JOB_DONE:
+            data["result"] = {"solution_grid": self.solution_grid, "report": self.report}
+        return data
+
+
+class SolveJobManager:
+    def __init__(self, max_workers=None, max_queue=8, result_ttl_seconds=600.0, job_timeout_seconds=150.0, start_method=None, preload_modules=()):
+        self.max_workers = max_workers or max(1, (os.cpu_count() or 2) - 1)
+        self.max_queue = max_queue
+        self.result_ttl_seconds = result_ttl_seconds
+        self.job_timeout_seconds = job_timeout_seconds
+        if start_method is None:
+            # forkserver 避免在多線程的 Web 進程中直接 fork
+            start_method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        self._mp_context = multiprocessing.get_context(start_method)
+        # forkserver 進程預先導入求解模塊，每個求解子進程從它 fork 出來時已加載 OR-Tools，無需在反序列化任務時重新導入
+        # (forkserver 按自身的 sys.path 導入，預加載失敗時靜默忽略；須在應用目錄下啟動服務，與 Procfile 一致)
+        if start_method == "forkserver" and preload_modules: self._mp_context.set_forkserver_preload(list(preload_modules))
+        self._jobs = {}
+        self._pending = collections.deque()
+        self._running = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._dispatcher = threading.Thread(target=self._dispatch_loop, name="solve-job-dispatcher", daemon=True)
+        self._dispatcher.start()
+
+    # --- 公開接口 ---
+    def submit(self, scheduler, solve_kwargs=None, on_done=None, stream=False):
+        with self._lock:
+            if len(self._pending) >= self.max_queue:
+                raise QueueFullError(f"求解隊列已滿 (等待中 {len(self._pending)} 個任務)，請稍後再試。")
+            job = SolveJob(scheduler, solve_kwargs, on_done, stream)
+            job.stop_event = self._mp_context.Event()
+            self._jobs[job.job_id] = job
+            self._pending.append(job)
+        logger.info(f"排班任務 {job.job_id} 已加入隊列")
+        self._wakeup.set()
+        return job
+
+    def add_finished(self, solution_grid, report):
+        # 登記一個無需求解的已完成任務 (例如緩存命中)，使輪詢接口行為保持一致
+        job = SolveJob(None, None)
+        job.solution_grid, job.report = solution_grid, report
+        with self._lock:
+            self._jobs[job.job_id] = job
+            self._finish(job, JOB_DONE)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def queue_position(self, job):
+        with self._lock:
+            try:
+                return self._pending.index(job) + 1
+            except ValueError:
+                return 0
+
+    def cancel(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.status in FINISHED_JOB_STATES:
+                return False
+            if job.status == JOB_QUEUED:
+                self._pending.remove(job)
+            else:
+                self._running.pop(job.job_id, None)
+                self._stop_process(job)
+            self._finish(job, JOB_CANCELLED)
+        logger.info(f"排班任務 {job_id} 已取消")
+        self._wakeup.set()
+        return True
+
+    def accept(self, job_id):
+        # 接受目前最佳解：通知子進程停止搜索，子進程仍會正常回傳結果 (而不是像 cancel 那樣直接終止)
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.status in FINISHED_JOB_STATES or job.stop_event is None:
+                return False
+            job.stop_event.set()
+        logger.info(f"排班任務 {job_id} 已接受目前最佳解，停止搜索")
+        return True
+
+    def stats(self):
+        with self._lock:
+            return {"max_workers": self.max_workers, "max_queue": self.max_queue,
+                    "queued": len(self._pending), "running": len(self._running), "stored_jobs": len(self._jobs)}
+
+    # --- 內部調度 ---
+    def _dispatch_loop(self):
+        while True:
+            with self._lock:
+                self._expire_finished_jobs()
+                self._check_timeouts()
+                while self._pending and len(self._running) < self.max_workers:
+                    self._start_job(self._pending.popleft())
+                conns = {job.conn: job for job in self._running.values()}
+            if not conns:
+                self._wakeup.wait(1.0)
+                self._wakeup.clear()
+                continue
+            try:
+                ready = wait_for_connections(list(conns), timeout=0.2)
+            except OSError:
+                continue # 連接已在取消時關閉
+            for conn in ready:
+                self._collect(conns[conn])
+
+    def _start_job(self, job):
+        # CP-SAT 線程數按即將同時運行的任務數 (包括隨後可立即啟動的排隊任務) 平分可用核數
+        concurrency = min(self.max_workers, len(self._running) + 1 + len(self._pending))
+        job.solve_kwargs = dict(job.solve_kwargs, num_workers=job.solve_kwargs.get("num_workers") or solver_policy.workers_for(concurrency))
+        parent_conn, child_conn = self._mp_context.Pipe(duplex=False)
+        try:
+            job.process = self._mp_context.Process(target=_run_solve_job, args=(job.scheduler, job.solve_kwargs, child_conn, job.stop_event, job.stream), daemon=True)
+            job.process.start()
+        except Exception as e:
+            # 序列化失敗、文件描述符或內存耗盡、forkserver 啟動失敗等：只讓這個任務失敗，調度線程繼續處理後續任務
+            logger.error(f"排班任務 {job.job_id} 無法啟動求解子進程: {e}", exc_info=True)
+            parent_conn.close(); child_conn.close()
+            job.process = None
+            job.error = f"無法啟動求解子進程: {type(e).__name__}: {e}"
+            self._finish(job, JOB_FAILED)
+            return
+        child_conn.close()
+        job.conn = parent_conn
+        job.status = JOB_RUNNING
+        job.started_at = time.time()
+        self._running[job.job_id] = job
+        logger.info(f"排班任務 {job.job_id} 開始求解 (pid={job.process.pid}, num_workers={job.solve_kwargs['num_workers']})")
+
+    def _collect(self, job):
+        try:
+            kind, payload, report = job.conn.recv()
+        except (EOFError, OSError):
+            kind, payload, report = "error", "求解子進程意外結束。", None
+        if kind == "progress":
+            job._notify(payload)
+            return
+        with self._lock:
+            if self._running.pop(job.job_id, None) is None:
+                return # 已被取消
+            if kind == "result":
+                job.solution_grid, job.report = payload, report
+                if job.on_done is not None:
+                    # 在喚醒等待者之前調用，保證等待者返回後回調 (如寫入緩存) 已生效
+                    try:
+                        job.on_done(job)
+                    except Exception as e:
+                        logger.error(f"排班任務 {job.job_id} 完成回調出錯: {e}", exc_info=True)
+                self._finish(job, JOB_DONE)
+            else:
+                job.error = payload
+                self._finish(job, JOB_FAILED)
+            job.process.join(timeout=1.0)
+        logger.info(f"排班任務 {job.job_id} 結束，狀態: {job.status}")
+        self._wakeup.set()
+
+    def _check_timeouts(self):
+        now = time.time()
+        for job in list(self._running.values()):
+            if job.process.exitcode is not None and not job.conn.poll():
+                # 子進程已退出卻未回傳任何結果 (例如啟動失敗或被系統終止)
+                del self._running[job.job_id]
+                job.error = f"求解子進程意外結束 (exitcode={job.process.exitcode})。"
+                self._finish(job, JOB_FAILED)
+            elif now - job.started_at > self.job_timeout_seconds:
+                logger.warning(f"排班任務 {job.job_id} 超時，強制終止")
+                del self._running[job.job_id]
+                self._stop_process(job)
+                job.error = f"求解超過 {self.job_timeout_seconds:.0f} 秒仍未結束，已終止。"
+                self._finish(job, JOB_FAILED)
+
+    def _expire_finished_jobs(self):
+        expire_before = time.time() - self.result_ttl_seconds
+        for job_id in [jid for jid, job in self._jobs.items() if job.finished_at and job.finished_at < expire_before]:
+            del self._jobs[job_id]
+
+    def _stop_process(self, job):
+        if job.process is not None and job.process.is_alive():
+            job.process.terminate()
+            job.process.join(timeout=1.0)
+        if job.conn is not None:
+            job.conn.close()
+
+    def _finish(self, job, status):
+        job.status = status
+        job.finished_at = time.time()
+        job.scheduler = None # 釋放已解析的實例
+        job._done.set()
+        job._notify()
@@ -1,16 +1,46 @@
 # main.py
 print("Starting main.py...")
 import os
+import json
+import time
+import collections
 import logging
-from flask import Flask, request, jsonify, send_from_directory
+import threading
+from flask import Flask, request, jsonify, send_from_directory, url_for, Response, g
 
-# 嘗試導入排班核心邏輯
-try:
-    from backend_api import ShiftSchedulerWithConstraints
-except ImportError:
-    ShiftSchedulerWithConstraints = None
-    logging.error("關鍵錯誤：無法從 backend_api.py 導入 ShiftSchedulerWithConstraints。")
-    logging.error("請確保 backend_api.py 文件存在於同級目錄，且包含 ShiftSchedulerWithConstraints 類。")
+_MAIN_IMPORT_STARTED = time.monotonic()
+
+from job_queue import SolveJobManager, QueueFullError, JOB_QUEUED, JOB_DONE, JOB_CANCELLED
+from result_cache import ScheduleResultCache
+import metrics
+import response_format
+import request_capture
+
+# 排班核心邏輯 (backend_api 及依賴它的 batch/horizon/session) 會導入 OR-Tools 和 numpy，佔冷啟動的大部分時間。
+# 延遲到第一個 /schedule* 請求時才導入 (見 load_solver_modules)，靜態頁面和 /healthz 不受影響；
+# gunicorn --preload 時由 gunicorn.conf.py 在 master 進程中提前導入，worker fork 後直接共用
+SOLVER_MODULES = ("backend_api", "horizon", "session") # 求解子進程需要反序列化的模塊，由 forkserver 預先導入
+ShiftSchedulerWithConstraints = WarmUpSolve = batch = horizon = session = None
+DEFAULT_TIME_LIMIT_SECONDS = 115.0
+MODEL_BUILDERS = SYMMETRY_BREAKING_MODES = ENGINES = SLOT_DURATIONS = ()
+_solver_modules_loaded = False
+_solver_modules_lock = threading.Lock()
+
+def load_solver_modules():
+    global ShiftSchedulerWithConstraints, WarmUpSolve, MODEL_BUILDERS, SYMMETRY_BREAKING_MODES, ENGINES, DEFAULT_TIME_LIMIT_SECONDS, SLOT_DURATIONS
+    global batch, horizon, session, _solver_modules_loaded
+    with _solver_modules_lock:
+        if _solver_modules_loaded: return
+        started = time.monotonic()
+        # 嘗試導入排班核心邏輯
+        try:
+            from backend_api import ShiftSchedulerWithConstraints, WarmUpSolve, MODEL_BUILDERS, SYMMETRY_BREAKING_MODES, ENGINES, DEFAULT_TIME_LIMIT_SECONDS, SLOT_DURATIONS
+            import batch, horizon, session
+        except ImportError:
+            logging.error("關鍵錯誤：無法從 backend_api.py 導入 ShiftSchedulerWithConstraints。")
+            logging.error("請確保 backend_api.py 文件存在於同級目錄，且包含 ShiftSchedulerWithConstraints 類。")
+        _solver_modules_loaded = True
+        STARTUP_SECONDS.set(round(time.monotonic() - started, 3), phase="import")
 
 logging.basicConfig(level=logging.DEBUG) # 開發時 DEBUG，部署到 Render 時可改為 INFO
 logger = logging.getLogger(__name__)
@@ -31,107 +61,650 @@ def index():
          logger.error(f"提供 index.html 時發生錯誤: {e}", exc_info=True)
          return "加載主頁時出錯。", 500
 
-@app.route('/schedule', methods=['POST'])
-def create_schedule_api():
-    logger.info(f"收到 /schedule 的 POST 請求")
+class ScheduleRequestError(ValueError):
+    # 請求參數錯誤，攜帶返回給客戶端的 HTTP 狀態碼
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+def _build_scheduler_from_request(data):
+    """驗證 /schedule 請求參數並建立 (已解析的) ShiftSchedulerWithConstraints 實例。"""
+    if not data or not isinstance(data, dict):
+        raise ScheduleRequestError("請求體為空或非JSON格式" if not data else "請求體必須是 JSON 對象。")
+    logger.debug(f"接收到的請求數據: {data}")
+
+    # 提取參數
+    k_employees_raw = data.get('k_employees')
+    schedule_period = data.get('schedule_period')
+    job_reqs_raw = data.get('job_requirements')
+    max_consecutive_minutes_raw = data.get('max_consecutive_work_minutes')
+    rest_duration_minutes_after_work_raw = data.get('rest_duration_minutes_after_work')
+    enable_mandatory_break = data.get('enable_mandatory_break', False)
+    designated_global_break_period = data.get('designated_global_break_period')
+    min_mandatory_break_minutes_raw = data.get('min_mandatory_break_minutes')
+    slot_duration_minutes_raw = data.get('slot_duration_minutes', 30)
+    fixed_assignments = data.get('fixed_assignments')
+    prior_work_counts = data.get('prior_work_counts')
+
+    # --- 參數驗證 ---
+    required_keys = [
+        "k_employees", "schedule_period", "job_requirements",
+        "max_consecutive_work_minutes", "rest_duration_minutes_after_work"
+    ]
+    missing_params = [key for key in required_keys if data.get(key) is None]
+    if missing_params:
+        raise ScheduleRequestError(f"缺少必要的參數: {', '.join(missing_params)}")
+
     try:
-        data = request.get_json()
-        if not data:
-            logger.warning("請求體為空或非 JSON 格式")
-            return jsonify({"error": "請求體為空或非JSON格式"}), 400
-        logger.debug(f"接收到的請求數據: {data}")
-
-        # 提取參數
-        k_employees_raw = data.get('k_employees')
-        schedule_period = data.get('schedule_period')
-        job_reqs_raw = data.get('job_requirements')
-        max_consecutive_minutes_raw = data.get('max_consecutive_work_minutes')
-        rest_duration_minutes_after_work_raw = data.get('rest_duration_minutes_after_work')
-        enable_mandatory_break = data.get('enable_mandatory_break', False)
-        designated_global_break_period = data.get('designated_global_break_period')
-        min_mandatory_break_minutes_raw = data.get('min_mandatory_break_minutes')
-
-        # --- 參數驗證 ---
-        required_keys = [
-            "k_employees", "schedule_period", "job_requirements",
-            "max_consecutive_work_minutes", "rest_duration_minutes_after_work"
-        ]
-        missing_params = [key for key in required_keys if data.get(key) is None]
-        if missing_params:
-            msg = f"缺少必要的參數: {', '.join(missing_params)}"
-            logger.warning(msg)
-            return jsonify({"error": msg}), 400
+        k_employees = int(k_employees_raw)
+        if k_employees <= 0: raise ValueError("員工人數必須大於0")
+    except (ValueError, TypeError):
+        raise ScheduleRequestError(f"參數類型或數值錯誤: k_employees ('{k_employees_raw}') 必須是有效的正整數。")
+    try:
+        max_consecutive_minutes = int(max_consecutive_minutes_raw)
+        if max_consecutive_minutes <= 0: raise ValueError("最大連續工作時間必須大於0")
+    except (ValueError, TypeError):
+        raise ScheduleRequestError(f"參數類型或數值錯誤: max_consecutive_work_minutes ('{max_consecutive_minutes_raw}') 必須是有效的正整數。")
+    try:
+        rest_duration_minutes_after_work = int(rest_duration_minutes_after_work_raw)
+        if rest_duration_minutes_after_work not in [30, 60]: raise ValueError("rest_duration_minutes_after_work 參數值必須是 30 或 60。")
+    except (ValueError, TypeError):
+        raise ScheduleRequestError(f"參數類型或數值錯誤: rest_duration_minutes_after_work ('{rest_duration_minutes_after_work_raw}') 必須是有效的整數 (30 或 60)。")
+    try:
+        slot_duration_minutes = int(slot_duration_minutes_raw)
+        if slot_duration_minutes not in SLOT_DURATIONS: raise ValueError("時隙長度不在可選範圍內")
+    except (ValueError, TypeError):
+        raise ScheduleRequestError(f"參數類型或數值錯誤: slot_duration_minutes ('{slot_duration_minutes_raw}') 必須是 {', '.join(map(str, SLOT_DURATIONS))} 之一。")
+    if not isinstance(job_reqs_raw, list) or not all(isinstance(req, str) for req in job_reqs_raw):
+        raise ScheduleRequestError("job_requirements 參數必須是一個包含字符串的列表。")
+    if fixed_assignments is not None and not (isinstance(fixed_assignments, dict) and all(isinstance(cells, dict) for cells in fixed_assignments.values())):
+        raise ScheduleRequestError("fixed_assignments 參數必須是 {員工: {時間: 崗位代碼或 \"R\"}} 形式的對象。")
+    if prior_work_counts is not None and not (isinstance(prior_work_counts, list) and all(isinstance(count, int) and count >= 0 for count in prior_work_counts)):
+        raise ScheduleRequestError("prior_work_counts 參數必須是非負整數列表 (每位員工一個)。")
+    if data.get('engine') == 'interval' and (fixed_assignments or prior_work_counts):
+        raise ScheduleRequestError("區間引擎 (engine=\"interval\") 不支持 fixed_assignments 和 prior_work_counts，請改用 exact 引擎。")
 
+    min_mandatory_break_minutes = 0
+    if enable_mandatory_break:
+        if not designated_global_break_period:
+            raise ScheduleRequestError("啟用強制落場時，必須提供全局落場時段 (designated_global_break_period)。")
+        if min_mandatory_break_minutes_raw is None:
+            raise ScheduleRequestError("啟用強制落場時，必須提供最小落場休息時間 (min_mandatory_break_minutes)。")
         try:
-            k_employees = int(k_employees_raw)
-            if k_employees <= 0: raise ValueError("員工人數必須大於0")
+            min_mandatory_break_minutes = int(min_mandatory_break_minutes_raw)
+            if min_mandatory_break_minutes <= 0: raise ValueError("最小落場休息時間必須大於0")
         except (ValueError, TypeError):
-            msg = f"參數類型或數值錯誤: k_employees ('{k_employees_raw}') 必須是有效的正整數。"
-            logger.warning(msg); return jsonify({"error": msg}), 400
-        try:
-            max_consecutive_minutes = int(max_consecutive_minutes_raw)
-            if max_consecutive_minutes <= 0: raise ValueError("最大連續工作時間必須大於0")
-        except (ValueError, TypeError):
-            msg = f"參數類型或數值錯誤: max_consecutive_work_minutes ('{max_consecutive_minutes_raw}') 必須是有效的正整數。"
-            logger.warning(msg); return jsonify({"error": msg}), 400
-        try:
-            rest_duration_minutes_after_work = int(rest_duration_minutes_after_work_raw)
-            if rest_duration_minutes_after_work not in [30, 60]: raise ValueError("rest_duration_minutes_after_work 參數值必須是 30 或 60。")
-        except (ValueError, TypeError):
-            msg = f"參數類型或數值錯誤: rest_duration_minutes_after_work ('{rest_duration_minutes_after_work_raw}') 必須是有效的整數 (30 或 60)。"
-            logger.warning(msg); return jsonify({"error": msg}), 400
-        if not isinstance(job_reqs_raw, list):
-            msg = "job_requirements 參數必須是一個包含字符串的列表。"
-            logger.warning(msg); return jsonify({"error": msg}), 400
-        
-        min_mandatory_break_minutes = 0
-        if enable_mandatory_break:
-            if not designated_global_break_period:
-                msg = "啟用強制落場時，必須提供全局落場時段 (designated_global_break_period)。"
-                logger.warning(msg); return jsonify({"error": msg}), 400
-            if min_mandatory_break_minutes_raw is None:
-                msg = "啟用強制落場時，必須提供最小落場休息時間 (min_mandatory_break_minutes)。"
-                logger.warning(msg); return jsonify({"error": msg}), 400
-            try:
-                min_mandatory_break_minutes = int(min_mandatory_break_minutes_raw)
-                if min_mandatory_break_minutes <= 0: raise ValueError("最小落場休息時間必須大於0")
-            except (ValueError, TypeError):
-                msg = f"參數類型或數值錯誤: min_mandatory_break_minutes ('{min_mandatory_break_minutes_raw}') 必須是有效的正整數。"
-                logger.warning(msg); return jsonify({"error": msg}), 400
-        else:
-            designated_global_break_period = ""
-
-        if ShiftSchedulerWithConstraints is None:
-            logger.error("ShiftSchedulerWithConstraints 類未成功導入")
-            return jsonify({"error": "排班核心組件加載失敗。"}), 500
-        try:
-            logger.debug("實例化 ShiftSchedulerWithConstraints...")
-            scheduler = ShiftSchedulerWithConstraints(
-                K_employees=k_employees,
-                schedule_period_str=schedule_period,
-                job_requirements_raw=job_reqs_raw,
-                max_consecutive_work_minutes=max_consecutive_minutes,
-                rest_duration_minutes_after_work=rest_duration_minutes_after_work,
-                enable_mandatory_break=enable_mandatory_break,
-                designated_global_break_period_str=designated_global_break_period,
-                min_mandatory_break_minutes=min_mandatory_break_minutes
+            raise ScheduleRequestError(f"參數類型或數值錯誤: min_mandatory_break_minutes ('{min_mandatory_break_minutes_raw}') 必須是有效的正整數。")
+    else:
+        designated_global_break_period = ""
+
+    if ShiftSchedulerWithConstraints is None:
+        logger.error("ShiftSchedulerWithConstraints 類未成功導入")
+        raise ScheduleRequestError("排班核心組件加載失敗。", 500)
+    try:
+        logger.debug("實例化 ShiftSchedulerWithConstraints...")
+        return ShiftSchedulerWithConstraints(
+            K_employees=k_employees,
+            schedule_period_str=schedule_period,
+            job_requirements_raw=job_reqs_raw,
+            max_consecutive_work_minutes=max_consecutive_minutes,
+            rest_duration_minutes_after_work=rest_duration_minutes_after_work,
+            enable_mandatory_break=enable_mandatory_break,
+            designated_global_break_period_str=designated_global_break_period,
+            min_mandatory_break_minutes=min_mandatory_break_minutes,
+            slot_duration_minutes=slot_duration_minutes,
+            fixed_assignments=fixed_assignments,
+            prior_work_counts=prior_work_counts
+        )
+    except ValueError as ve:
+        logger.error(f"排班器初始化或數據解析時出錯: {ve}", exc_info=True)
+        raise ScheduleRequestError(f"輸入數據處理錯誤: {ve}")
+
+def _solve_options_from_request(data):
+    # 可選的求解選項 (傳給 ShiftSchedulerWithConstraints.solve)
+    options = {}
+    model_builder = data.get('model_builder')
+    if model_builder is not None:
+        if model_builder not in MODEL_BUILDERS:
+            raise ScheduleRequestError(f"參數錯誤: model_builder ('{model_builder}') 必須是 {', '.join(MODEL_BUILDERS)} 之一。")
+        options['model_builder'] = model_builder
+    symmetry_breaking = data.get('symmetry_breaking')
+    if symmetry_breaking is not None:
+        if symmetry_breaking not in SYMMETRY_BREAKING_MODES:
+            raise ScheduleRequestError(f"參數錯誤: symmetry_breaking ('{symmetry_breaking}') 必須是 {', '.join(SYMMETRY_BREAKING_MODES)} 之一。")
+        options['symmetry_breaking'] = symmetry_breaking
+    engine = data.get('engine')
+    if engine is not None:
+        if engine not in ENGINES:
+            raise ScheduleRequestError(f"參數錯誤: engine ('{engine}') 必須是 {', '.join(ENGINES)} 之一。")
+        options['engine'] = engine
+    relax = data.get('relax')
+    if relax is not None:
+        if not isinstance(relax, bool):
+            raise ScheduleRequestError(f"參數錯誤: relax ('{relax}') 必須是布爾值。")
+        options['relax'] = relax
+    # 請求自身的時延預算 (秒，從收到請求起計，包括排隊等待)：CP-SAT 的時間上限不超過剩餘的預算 (見 solver_policy.py)
+    latency_budget = data.get('latency_budget_seconds')
+    if latency_budget is not None:
+        job_timeout = get_job_manager().job_timeout_seconds
+        if isinstance(latency_budget, bool) or not isinstance(latency_budget, (int, float)) or not 0 < latency_budget < job_timeout:
+            raise ScheduleRequestError(f"參數錯誤: latency_budget_seconds ('{latency_budget}') 必須是 0 到 {job_timeout:.0f} (求解任務超時) 之間的數值。")
+        options['deadline'] = time.time() + latency_budget
+    relative_gap_limit = data.get('relative_gap_limit')
+    if relative_gap_limit is not None:
+        if isinstance(relative_gap_limit, bool) or not isinstance(relative_gap_limit, (int, float)) or not 0 <= relative_gap_limit < 1:
+            raise ScheduleRequestError(f"參數錯誤: relative_gap_limit ('{relative_gap_limit}') 必須是 0 到 1 之間的數值。")
+        options['relative_gap_limit'] = relative_gap_limit
+    return options
+
+def _session_from_request(data):
+    # 增量求解會話：session_id 相同的請求沿用上一次的排班作為起點；minimal_change 要求新排班盡量接近上一次
+    session_id = data.get('session_id')
+    if session_id is not None and (not isinstance(session_id, str) or not 0 < len(session_id) <= session.MAX_SESSION_ID_LENGTH):
+        raise ScheduleRequestError(f"參數錯誤: session_id 必須是長度 1 到 {session.MAX_SESSION_ID_LENGTH} 的字符串。")
+    minimal_change = data.get('minimal_change', False)
+    if not isinstance(minimal_change, bool):
+        raise ScheduleRequestError(f"參數錯誤: minimal_change ('{minimal_change}') 必須是布爾值。")
+    if minimal_change and session_id is None:
+        raise ScheduleRequestError("參數錯誤: minimal_change 需要同時提供 session_id。")
+    return session_id, minimal_change
+
+def _response_format_from_request(value):
+    # 響應格式: grid (默認，逐格) 或 intervals (工作段 + 合併後的未填補區間)
+    response_format_name = value or "grid"
+    if response_format_name not in response_format.RESPONSE_FORMATS:
+        raise ScheduleRequestError(f"參數錯誤: format ('{value}') 必須是 {', '.join(response_format.RESPONSE_FORMATS)} 之一。")
+    return response_format_name
+
+@app.before_request
+def _load_solver_modules_for_api():
+    if request.path.startswith('/schedule'): load_solver_modules()
+
+@app.after_request
+def _compress_response(response):
+    return response_format.compress_response(response, request.headers.get("Accept-Encoding"))
+
+# --- 求解任務管理器 (每個 Web 進程一個，首次使用時才創建，兼容 gunicorn fork) ---
+_job_manager = None
+_job_manager_lock = threading.Lock()
+
+def get_job_manager():
+    global _job_manager
+    with _job_manager_lock:
+        if _job_manager is None:
+            max_workers = int(os.environ.get("SCHEDULER_MAX_WORKERS", "0")) or None
+            _job_manager = SolveJobManager(
+                max_workers=max_workers,
+                max_queue=int(os.environ.get("SCHEDULER_MAX_QUEUE", "8")),
+                result_ttl_seconds=float(os.environ.get("SCHEDULER_RESULT_TTL_SECONDS", "600")),
+                job_timeout_seconds=float(os.environ.get("SCHEDULER_JOB_TIMEOUT_SECONDS", "150")),
+                preload_modules=SOLVER_MODULES,
+            )
+            logger.info(f"求解任務管理器已啟動: {_job_manager.stats()}")
+        return _job_manager
+
+CACHE_BUDGET_TOLERANCE_SECONDS = 2.0 # 沿用非最優緩存結果時，其時間上限可比本次預算少的秒數 (排隊等待等造成的差異)
+SYNC_WAIT_MARGIN_SECONDS = 30.0 # 同步接口等待結果的上限 = 求解任務超時 + 此餘量
+# 快速引擎在請求線程中直接運行的規模上限 (員工數 x 時隙數)；約 2000 格時耗時在 50 毫秒左右
+FAST_INLINE_MAX_CELLS = int(os.environ.get("SCHEDULER_FAST_INLINE_MAX_CELLS", "2000"))
+
+# --- 求解結果緩存 (規範化實例鍵，LRU + TTL，可選磁盤層) ---
+_result_cache = None
+
+def get_result_cache():
+    global _result_cache
+    with _job_manager_lock:
+        if _result_cache is None:
+            _result_cache = ScheduleResultCache(
+                max_entries=int(os.environ.get("SCHEDULE_CACHE_MAX_ENTRIES", "256")),
+                max_bytes=int(float(os.environ.get("SCHEDULE_CACHE_MAX_MB", "64")) * 1024 * 1024),
+                ttl_seconds=float(os.environ.get("SCHEDULE_CACHE_TTL_SECONDS", "3600")),
+                short_ttl_seconds=float(os.environ.get("SCHEDULE_CACHE_SHORT_TTL_SECONDS", "60")),
+                disk_dir=os.environ.get("SCHEDULE_CACHE_DIR") or None,
+                disk_max_bytes=int(float(os.environ.get("SCHEDULE_CACHE_DISK_MAX_MB", os.environ.get("SCHEDULE_CACHE_MAX_MB", "64"))) * 1024 * 1024),
+            )
+        return _result_cache
+
+# --- 增量求解會話 (session_id -> 上一次的實例和排班，LRU + TTL) ---
+_session_store = None
+
+def get_session_store():
+    global _session_store
+    with _job_manager_lock:
+        if _session_store is None:
+            _session_store = session.ScheduleSessionStore(
+                max_sessions=int(os.environ.get("SCHEDULER_SESSION_MAX", "256")),
+                ttl_seconds=float(os.environ.get("SCHEDULER_SESSION_TTL_SECONDS", "1800")),
             )
-            logger.info("開始求解排班...")
-            solution_grid, report = scheduler.solve()
-            logger.info(f"排班求解完成，狀態: {report.get('status', '未知')}")
-        except ValueError as ve:
-            logger.error(f"排班器初始化或數據解析時出錯: {ve}", exc_info=True)
-            return jsonify({"error": f"輸入數據處理錯誤: {ve}"}), 400
-        except Exception as e: # 捕獲其他所有可能的求解錯誤
-            logger.error(f"排班求解過程中發生未知錯誤: {type(e).__name__} - {e}", exc_info=True)
-            return jsonify({"error": f"排班求解過程中發生意外錯誤: {type(e).__name__}"}), 500
-        
+        return _session_store
+
+# --- 可選的請求錄製 (設置 SCHEDULE_CAPTURE_PATH 時啟用，見 request_capture.py)；只錄製同步的 /schedule，其耗時即完整求解時延 ---
+_request_capture = None
+_request_capture_loaded = False
+
+def get_request_capture():
+    global _request_capture, _request_capture_loaded
+    with _job_manager_lock:
+        if not _request_capture_loaded:
+            _request_capture = request_capture.from_environ(); _request_capture_loaded = True
+            if _request_capture is not None: logger.info(f"請求錄製已啟用: {_request_capture.path}")
+        return _request_capture
+
+@app.before_request
+def _mark_request_started():
+    g.request_started = time.monotonic()
+
+@app.after_request
+def _capture_request(response):
+    if request.path == '/schedule' and request.method == 'POST':
+        capture = get_request_capture()
+        if capture is not None:
+            capture.record(request.path, request.get_json(silent=True), time.monotonic() - g.request_started, response.status_code, g.get('schedule_report'))
+    return response
+
+# --- Prometheus 指標 (由 /metrics 輸出) ---
+SOLVES_TOTAL = metrics.REGISTRY.counter("scheduler_solves_total", "完成的排班求解次數 (不含緩存命中)", ["engine", "status"])
+PHASE_SECONDS = metrics.REGISTRY.histogram("scheduler_phase_seconds", "排班各階段耗時 (parse/presolve/heuristic/build/solve/report/...)", ["phase"])
+QUEUE_WAIT_SECONDS = metrics.REGISTRY.histogram("scheduler_queue_wait_seconds", "求解任務在隊列中等待的時間")
+MODEL_VARIABLES = metrics.REGISTRY.histogram("scheduler_model_variables", "CP-SAT 模型變量數", buckets=metrics.DEFAULT_SIZE_BUCKETS)
+MODEL_CONSTRAINTS = metrics.REGISTRY.histogram("scheduler_model_constraints", "CP-SAT 模型約束數", buckets=metrics.DEFAULT_SIZE_BUCKETS)
+SOLVER_CONFLICTS = metrics.REGISTRY.counter("scheduler_solver_conflicts_total", "CP-SAT 累計衝突數")
+SOLVER_BRANCHES = metrics.REGISTRY.counter("scheduler_solver_branches_total", "CP-SAT 累計分支數")
+SOLVER_GAP = metrics.REGISTRY.histogram("scheduler_solver_gap", "CP-SAT 結束時目標值與最佳下界的相對差距", buckets=(0.0, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0))
+REJECTED_TOTAL = metrics.REGISTRY.counter("scheduler_jobs_rejected_total", "因隊列已滿被拒絕的求解請求數")
+JOBS_GAUGE = metrics.REGISTRY.gauge("scheduler_jobs", "求解任務數", ["state"])
+WORKERS_GAUGE = metrics.REGISTRY.gauge("scheduler_max_workers", "求解進程數上限")
+CACHE_EVENTS = metrics.REGISTRY.counter("scheduler_cache_events_total", "結果緩存事件累計數", ["event"])
+CACHE_ENTRIES = metrics.REGISTRY.gauge("scheduler_cache_entries", "結果緩存條目數")
+CACHE_BYTES = metrics.REGISTRY.gauge("scheduler_cache_bytes", "結果緩存佔用字節數")
+SESSIONS_GAUGE = metrics.REGISTRY.gauge("scheduler_sessions", "增量求解會話數")
+STARTUP_SECONDS = metrics.REGISTRY.gauge("scheduler_startup_seconds", "冷啟動各階段耗時 (import: 導入求解模塊；warm_up: 預熱求解；ready: 從導入 main 到就緒)", ["phase"])
+READY_GAUGE = metrics.REGISTRY.gauge("scheduler_ready", "預熱是否已完成 (1 為就緒)")
+SOLVE_CPU_SECONDS = metrics.REGISTRY.counter("scheduler_solve_cpu_seconds_total", "求解子進程累計 CPU 時間 (秒)")
+PROCESS_CPU_SECONDS = metrics.REGISTRY.counter("scheduler_process_cpu_seconds_total", "Web 進程累計 CPU 時間 (秒，不含求解子進程)")
+
+def _collect_runtime_metrics():
+    # 只讀取已創建的管理器與緩存，抓取指標本身不應觸發創建求解進程
+    cpu_times = os.times()
+    PROCESS_CPU_SECONDS.set_total(round(cpu_times.user + cpu_times.system, 3))
+    if _job_manager is not None:
+        stats = _job_manager.stats()
+        JOBS_GAUGE.set(stats["queued"], state="queued"); JOBS_GAUGE.set(stats["running"], state="running"); JOBS_GAUGE.set(stats["stored_jobs"], state="stored")
+        WORKERS_GAUGE.set(stats["max_workers"])
+    if _result_cache is not None:
+        stats = _result_cache.stats()
+        for event in ("hits", "disk_hits", "misses", "stores", "evictions", "expirations", "disk_evictions"): CACHE_EVENTS.set_total(stats[event], event=event)
+        CACHE_ENTRIES.set(stats["entries"]); CACHE_BYTES.set(stats["bytes"])
+    if _session_store is not None:
+        SESSIONS_GAUGE.set(_session_store.stats()["sessions"])
+
+metrics.REGISTRY.add_collector(_collect_runtime_metrics)
+
+def _record_solve_metrics(report, job=None):
+    SOLVES_TOTAL.inc(engine=report.get("engine", "exact"), status=report.get("status", "UNKNOWN"))
+    stats = report.get("stats") or {}
+    for phase, elapsed_ms in (stats.get("timings_ms") or {}).items(): PHASE_SECONDS.observe(elapsed_ms / 1000.0, phase=phase)
+    if stats.get("model"):
+        MODEL_VARIABLES.observe(stats["model"]["variables"]); MODEL_CONSTRAINTS.observe(stats["model"]["constraints"])
+    if stats.get("cpu_s"): SOLVE_CPU_SECONDS.inc(stats["cpu_s"])
+    if stats.get("solver"):
+        SOLVER_CONFLICTS.inc(stats["solver"]["conflicts"]); SOLVER_BRANCHES.inc(stats["solver"]["branches"])
+        if "gap" in stats["solver"]: SOLVER_GAP.observe(stats["solver"]["gap"])
+    if job is not None and job.started_at:
+        QUEUE_WAIT_SECONDS.observe(job.started_at - job.created_at)
+
+def _on_job_done(cache, cache_key, job, session_id=None, scheduler=None):
+    # 用戶提前接受或按差距目標提前停止的結果不代表完整求解，不寫入緩存
+    if cache_key is not None and not job.report.get("stopped_early") and not job.solve_kwargs.get("relative_gap_limit"):
+        cache.put(cache_key, job.solution_grid, job.report)
+    if session_id is not None: get_session_store().put(session_id, scheduler, job.solution_grid)
+    _record_solve_metrics(job.report, job)
+
+def _cache_key(scheduler, solve_options):
+    # 建模方式只影響 exact 引擎的結果；時間預算不進入鍵 (見 _cached_result_usable)，否則最優結果會按預算被分散
+    engine = solve_options.get('engine', 'exact')
+    variant = [engine] + ([solve_options.get('model_builder', 'integer')] if engine == 'exact' else []) + (['relax'] if solve_options.get('relax') else [])
+    return scheduler.canonical_key(variant=":".join(variant))
+
+def _solve_budget_seconds(solve_options):
+    # 本次請求可用的求解時間：時間上限，截止時間 (latency_budget_seconds) 更早時以剩餘時間為準
+    budget = solve_options.get('time_limit_seconds') or DEFAULT_TIME_LIMIT_SECONDS
+    deadline = solve_options.get('deadline')
+    return budget if deadline is None else min(budget, deadline - time.time())
+
+def _cached_result_usable(cached, solve_options):
+    # 最優結果與時間預算無關；其餘 CP-SAT 結果 (例如時限內只找到可行解) 只在當時的時間上限不少於本次預算時沿用，
+    # 否則預算較短的請求得到的 FEASIBLE 結果會被當作預算較長的請求的答案
+    report = cached["report"]
+    policy = (report.get("stats") or {}).get("policy")
+    if report.get("status") == "OPTIMAL" or not policy: return True
+    return policy["time_limit_s"] + CACHE_BUDGET_TOLERANCE_SECONDS >= _solve_budget_seconds(solve_options)
+
+def _submit_schedule_job(scheduler, solve_options, stream=False, session_id=None, minimal_change=False):
+    # 先查緩存；命中則直接登記為已完成任務，否則排隊求解並在完成後寫入緩存。
+    # 快速引擎在小實例上只需幾毫秒，員工數 x 時隙數不超過 FAST_INLINE_MAX_CELLS 時直接在請求線程中運行，不佔用求解進程；
+    # 更大的實例 (啟發式的修復輪數隨 E*N 增長) 同樣交給求解進程，受任務超時和取消約束。
+    # 帶 session_id 時以會話中上一次的排班為起點增量求解 (見 session.py)，完成後把結果存回會話
+    engine = solve_options.get('engine', 'exact')
+    sessions = get_session_store() if session_id is not None else None
+    target = session.build_incremental(sessions.get(session_id), scheduler, minimal_change) if sessions is not None else None
+    if minimal_change:
+        if target is None: raise ScheduleRequestError(f"會話 {session_id} 沒有可沿用的排班 (不存在、已過期或排班時段不同)，無法使用 minimal_change。")
+        if engine != 'exact': raise ScheduleRequestError("minimal_change 只支持 exact 引擎。")
+    cache = get_result_cache()
+    # 最小改動的結果取決於上一次的排班，不能與同一實例的普通結果共用緩存
+    cache_key = None if minimal_change else _cache_key(scheduler, solve_options)
+    cached = cache.get(cache_key) if cache_key is not None else None
+    if cached is not None and not _cached_result_usable(cached, solve_options):
+        logger.info(f"緩存結果的求解時間少於本次預算，重新求解: {cache_key[:12]}"); cached = None
+    if cached is not None:
+        logger.info(f"排班結果緩存命中: {cache_key[:12]}")
+        cached["report"]["cache_hit"] = True
+        if sessions is not None: sessions.put(session_id, scheduler, cached["solution_grid"])
+        return get_job_manager().add_finished(cached["solution_grid"], cached["report"])
+    if engine == 'fast' and scheduler.num_employees * scheduler.num_slots <= FAST_INLINE_MAX_CELLS:
+        solution_grid, report = scheduler.solve(**solve_options)
+        cache.put(cache_key, solution_grid, report); _record_solve_metrics(report)
+        if sessions is not None: sessions.put(session_id, scheduler, solution_grid)
+        return get_job_manager().add_finished(solution_grid, report)
+    if engine == 'fast': target = None # 快速引擎不使用增量求解的提示
+    return get_job_manager().submit(target or scheduler, solve_options, stream=stream,
+                                    on_done=lambda job: _on_job_done(cache, cache_key, job, session_id, scheduler))
+
+def _queue_full_response(e):
+    logger.warning(f"拒絕排班請求: {e}"); REJECTED_TOTAL.inc()
+    response = jsonify({"error": str(e)})
+    response.headers["Retry-After"] = "10"
+    return response, 503
+
+@app.route('/schedule', methods=['POST'])
+def create_schedule_api():
+    # 同步接口：求解仍在子進程中進行，本線程只等待結果
+    logger.info(f"收到 /schedule 的 POST 請求")
+    try:
+        try:
+            data = request.get_json(silent=True)
+            scheduler = _build_scheduler_from_request(data)
+            solve_options = _solve_options_from_request(data)
+            result_format = _response_format_from_request(data.get('format'))
+            session_id, minimal_change = _session_from_request(data)
+            job = _submit_schedule_job(scheduler, solve_options, session_id=session_id, minimal_change=minimal_change)
+        except ScheduleRequestError as e:
+            logger.warning(str(e))
+            return jsonify({"error": str(e)}), e.status_code
+        except QueueFullError as e:
+            return _queue_full_response(e)
+        logger.info("開始求解排班...")
+        # 子進程超時由管理器終止；這裡的上限只防止調度出錯時請求線程永遠等待
+        if not job.wait(get_job_manager().job_timeout_seconds + SYNC_WAIT_MARGIN_SECONDS):
+            logger.error(f"等待排班任務 {job.job_id} 超時，取消任務")
+            get_job_manager().cancel(job.job_id)
+            return jsonify({"error": "排班求解等待超時，請稍後再試。"}), 504
+        if job.status != JOB_DONE:
+            logger.error(f"排班求解過程中發生錯誤: {job.status} - {job.error}")
+            return jsonify({"error": f"排班求解過程中發生意外錯誤: {job.error or job.status}"}), 500
+        logger.info(f"排班求解完成，狀態: {job.report.get('status', '未知')}")
+        g.schedule_report = job.report
         logger.debug("排班完成，準備返回結果")
-        return jsonify({"solution_grid": solution_grid, "report": report})
+        return jsonify(response_format.format_result(job.solution_grid, job.report, result_format))
     except Exception as e: # 最外層捕獲，處理請求解析等早期錯誤
         logger.error(f"處理 /schedule 請求時發生頂層錯誤: {type(e).__name__} - {e}", exc_info=True)
         return jsonify({"error": "服務器內部錯誤，無法處理您的請求。"}), 500
 
+# --- 異步求解任務接口：提交後立即返回 job_id，客戶端輪詢結果 ---
+@app.route('/schedule/jobs', methods=['POST'])
+def submit_schedule_job():
+    logger.info("收到 /schedule/jobs 的 POST 請求")
+    try:
+        data = request.get_json(silent=True)
+        scheduler = _build_scheduler_from_request(data)
+        solve_options = _solve_options_from_request(data)
+        session_id, minimal_change = _session_from_request(data)
+        job = _submit_schedule_job(scheduler, solve_options, session_id=session_id, minimal_change=minimal_change)
+    except ScheduleRequestError as e:
+        logger.warning(str(e))
+        return jsonify({"error": str(e)}), e.status_code
+    except QueueFullError as e:
+        return _queue_full_response(e)
+    status_url = url_for('get_schedule_job', job_id=job.job_id)
+    response = jsonify({"job_id": job.job_id, "status": job.status, "status_url": status_url})
+    response.headers["Location"] = status_url
+    return response, 202
+
+@app.route('/schedule/jobs/<job_id>', methods=['GET'])
+def get_schedule_job(job_id):
+    manager = get_job_manager()
+    job = manager.get(job_id)
+    if job is None:
+        return jsonify({"error": f"任務 {job_id} 不存在或結果已過期。"}), 404
+    try:
+        result_format = _response_format_from_request(request.args.get('format'))
+    except ScheduleRequestError as e:
+        return jsonify({"error": str(e)}), e.status_code
+    data = job.to_dict(include_result=False)
+    if job.status == JOB_DONE:
+        data["result"] = response_format.format_result(job.solution_grid, job.report, result_format)
+    if job.status == JOB_QUEUED:
+        data["queue_position"] = manager.queue_position(job)
+    return jsonify(data)
+
+@app.route('/schedule/jobs/<job_id>', methods=['DELETE'])
+def cancel_schedule_job(job_id):
+    manager = get_job_manager()
+    if manager.get(job_id) is None:
+        return jsonify({"error": f"任務 {job_id} 不存在或結果已過期。"}), 404
+    if not manager.cancel(job_id):
+        return jsonify({"error": f"任務 {job_id} 已結束，無法取消。"}), 409
+    return jsonify({"job_id": job_id, "status": JOB_CANCELLED})
+
+# --- 批量場景接口：base 為完整請求，scenarios 為參數覆蓋列表，全部場景在同一時間預算內並行求解 ---
+@app.route('/schedule/batch', methods=['POST'])
+def schedule_batch():
+    logger.info("收到 /schedule/batch 的 POST 請求")
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or not isinstance(data.get('base'), dict) or not isinstance(data.get('scenarios'), list):
+        return jsonify({"error": "請求體必須包含 base (對象) 和 scenarios (覆蓋參數對象列表)。"}), 400
+    if not 1 <= len(data['scenarios']) <= batch.MAX_BATCH_SCENARIOS:
+        return jsonify({"error": f"scenarios 的數量必須在 1 到 {batch.MAX_BATCH_SCENARIOS} 之間。"}), 400
+    try:
+        time_budget = float(data.get('time_budget_seconds', batch.DEFAULT_TIME_BUDGET_SECONDS))
+        if not 0 < time_budget <= batch.MAX_TIME_BUDGET_SECONDS: raise ValueError
+    except (TypeError, ValueError):
+        return jsonify({"error": f"time_budget_seconds 必須是 0 到 {batch.MAX_TIME_BUDGET_SECONDS:.0f} 之間的數值。"}), 400
+
+    started = time.monotonic()
+    scenarios = []
+    for index, overrides in enumerate(data['scenarios']):
+        if not isinstance(overrides, dict):
+            return jsonify({"error": f"scenarios[{index}] 必須是對象。"}), 400
+        overrides = dict(overrides); name = overrides.pop('name', None) or f"scenario_{index}"
+        scenario = batch.BatchScenario(index, name, overrides)
+        try:
+            payload = dict(data['base'], **overrides)
+            scenario.scheduler = _build_scheduler_from_request(payload)
+            scenario.solve_options = _solve_options_from_request(payload)
+            scenario.key = _cache_key(scenario.scheduler, scenario.solve_options)
+        except ScheduleRequestError as e:
+            scenario.error = str(e)
+        scenarios.append(scenario)
+
+    manager = get_job_manager()
+    batch.run_batch(scenarios, submit=lambda scenario: _submit_schedule_job(scenario.scheduler, scenario.solve_options),
+                    accept=manager.accept, max_parallel=manager.max_workers, time_budget_seconds=time_budget,
+                    default_time_limit=DEFAULT_TIME_LIMIT_SECONDS)
+    results = [scenario.to_dict() for scenario in scenarios]
+    summary = collections.Counter(result["status"] for result in results)
+    summary.update(scenarios=len(scenarios), unique=len({s.key for s in scenarios if not s.error}),
+                   duplicates=sum(1 for s in scenarios if s.duplicate_of is not None), pruned=sum(1 for s in scenarios if s.pruned_by is not None))
+    logger.info(f"批量求解完成: {dict(summary)}")
+    return jsonify({"results": results, "summary": dict(summary, elapsed_s=round(time.monotonic() - started, 3))})
+
+@app.route('/schedule/jobs/<job_id>/accept', methods=['POST'])
+def accept_schedule_job(job_id):
+    # 接受目前最佳解：停止搜索但保留結果，任務隨後以 stopped_early 的報告正常結束
+    manager = get_job_manager()
+    if manager.get(job_id) is None:
+        return jsonify({"error": f"任務 {job_id} 不存在或結果已過期。"}), 404
+    if not manager.accept(job_id):
+        return jsonify({"error": f"任務 {job_id} 已結束。"}), 409
+    return jsonify({"job_id": job_id, "accepted": True}), 202
+
+# --- 流式求解接口 (Server-Sent Events)：每找到更好的解就推送一次，客戶端斷開時取消求解 ---
+def _sse_message(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.route('/schedule/stream', methods=['POST'])
+def stream_schedule():
+    logger.info("收到 /schedule/stream 的 POST 請求")
+    try:
+        data = request.get_json(silent=True)
+        scheduler = _build_scheduler_from_request(data)
+        solve_options = _solve_options_from_request(data)
+        result_format = _response_format_from_request(data.get('format'))
+        session_id, minimal_change = _session_from_request(data)
+        job = _submit_schedule_job(scheduler, solve_options, stream=True, session_id=session_id, minimal_change=minimal_change)
+    except ScheduleRequestError as e:
+        logger.warning(str(e))
+        return jsonify({"error": str(e)}), e.status_code
+    except QueueFullError as e:
+        return _queue_full_response(e)
+    job_info = {"job_id": job.job_id, "status_url": url_for('get_schedule_job', job_id=job.job_id),
+                "accept_url": url_for('accept_schedule_job', job_id=job.job_id)}
+
+    def generate():
+        completed = False
+        try:
+            yield _sse_message("job", job_info)
+            next_index = 0
+            while True:
+                events, finished = job.wait_for_events(next_index, timeout=15.0)
+                for event in events: yield _sse_message("solution", event)
+                next_index += len(events)
+                if finished: break
+                if not events: yield ": keep-alive\n\n" # 防止代理因長時間無數據而斷開連接
+            completed = True
+            if job.status == JOB_DONE: yield _sse_message("done", response_format.format_result(job.solution_grid, job.report, result_format))
+            else: yield _sse_message("error", {"status": job.status, "error": job.error or job.status})
+        finally:
+            if not completed: # 客戶端中途斷開，終止求解以釋放 CPU
+                logger.info(f"流式請求已斷開，取消排班任務 {job.job_id}")
+                get_job_manager().cancel(job.job_id)
+
+    return Response(generate(), mimetype="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+# --- 多日排班接口 (Server-Sent Events)：按天切成滾動窗口依次求解，每提交一天就推送一次 ---
+@app.route('/schedule/horizon', methods=['POST'])
+def stream_horizon_schedule():
+    # days 指定時，schedule_period 和 job_requirements 按單日填寫，自動重複 days 天 (強制落場時段本身就按天重複)；
+    # 否則 schedule_period 直接覆蓋整個多日時段 (結束時間的小時數可超過 24，例如 "08:00-176:00")
+    logger.info("收到 /schedule/horizon 的 POST 請求")
+    try:
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict): raise ScheduleRequestError("請求體為空或非JSON格式")
+        days = data.get('days')
+        if days is not None:
+            if not isinstance(days, int) or not 1 <= days <= horizon.MAX_HORIZON_DAYS:
+                raise ScheduleRequestError(f"參數錯誤: days ('{days}') 必須是 1 到 {horizon.MAX_HORIZON_DAYS} 之間的整數。")
+            if not isinstance(data.get('schedule_period'), str) or not isinstance(data.get('job_requirements'), list) or not all(isinstance(req, str) for req in data['job_requirements']):
+                raise ScheduleRequestError("缺少必要的參數或格式錯誤: schedule_period, job_requirements")
+            period_start, _, period_end = data['schedule_period'].replace('–', '-').partition('-')
+            end_minutes = horizon.time_to_slot(period_end.strip(), 1)
+            if end_minutes is None: raise ScheduleRequestError(f"排班總時段 '{data['schedule_period']}' 格式錯誤。")
+            data = dict(data, schedule_period=f"{period_start.strip()}-{horizon.slot_to_time_str(end_minutes + (days - 1) * 1440, 1)}",
+                        job_requirements=horizon.repeat_daily(data['job_requirements'], days))
+        scheduler = _build_scheduler_from_request(data)
+        solve_options = _solve_options_from_request(data)
+        result_format = _response_format_from_request(data.get('format'))
+        if solve_options.get('engine') == 'interval':
+            raise ScheduleRequestError("多日排班不支持區間引擎 (engine=\"interval\")，請改用 exact 或 fast。")
+        if horizon.HorizonScheduler.num_days(scheduler) > horizon.MAX_HORIZON_DAYS:
+            raise ScheduleRequestError(f"多日排班最多 {horizon.MAX_HORIZON_DAYS} 天。")
+        try:
+            window_hours = float(data.get('window_hours', horizon.DEFAULT_WINDOW_HOURS)); lookahead_hours = float(data.get('lookahead_hours', horizon.DEFAULT_LOOKAHEAD_HOURS))
+            if not 1 <= window_hours <= 24 * horizon.MAX_HORIZON_DAYS or not 0 <= lookahead_hours <= 24: raise ValueError
+        except (TypeError, ValueError):
+            raise ScheduleRequestError("window_hours 必須在 1 到 336 之間，lookahead_hours 必須在 0 到 24 之間。")
+        job_timeout = get_job_manager().job_timeout_seconds
+        try:
+            time_budget = float(data.get('time_budget_seconds', min(horizon.DEFAULT_TIME_BUDGET_SECONDS, job_timeout - 10)))
+            if not 0 < time_budget < job_timeout: raise ValueError
+        except (TypeError, ValueError):
+            raise ScheduleRequestError(f"time_budget_seconds 必須是 0 到 {job_timeout:.0f} (求解任務超時) 之間的數值。")
+    except ScheduleRequestError as e:
+        logger.warning(str(e))
+        return jsonify({"error": str(e)}), e.status_code
+    horizon_scheduler = horizon.HorizonScheduler(scheduler, window_hours, lookahead_hours)
+    try:
+        # 多日結果不寫入緩存；完成後照常記錄指標
+        job = get_job_manager().submit(horizon_scheduler, dict(solve_options, time_limit_seconds=time_budget),
+                                       on_done=lambda job: _record_solve_metrics(job.report, job), stream=True)
+    except QueueFullError as e:
+        return _queue_full_response(e)
+    job_info = {"job_id": job.job_id, "status_url": url_for('get_schedule_job', job_id=job.job_id),
+                "accept_url": url_for('accept_schedule_job', job_id=job.job_id), "days": len(horizon_scheduler.windows())}
+
+    def generate():
+        completed = False
+        try:
+            yield _sse_message("job", job_info)
+            next_index = 0
+            while True:
+                events, finished = job.wait_for_events(next_index, timeout=15.0)
+                for event in events: yield _sse_message("day", dict(response_format.format_result(event["solution_grid"], event["report"], result_format), day=event["day"]))
+                next_index += len(events)
+                if finished: break
+                if not events: yield ": keep-alive\n\n"
+            completed = True
+            if job.status == JOB_DONE: yield _sse_message("done", response_format.format_result(job.solution_grid, job.report, result_format))
+            else: yield _sse_message("error", {"status": job.status, "error": job.error or job.status})
+        finally:
+            if not completed:
+                logger.info(f"多日排班流式請求已斷開，取消排班任務 {job.job_id}")
+                get_job_manager().cancel(job.job_id)
+
+    return Response(generate(), mimetype="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.route('/metrics')
+def metrics_endpoint():
+    return Response(metrics.REGISTRY.render(), mimetype=None, content_type=metrics.CONTENT_TYPE)
+
+# --- 冷啟動預熱與就緒檢查 ---
+# 每個 Web 進程預熱一次：導入求解模塊，並經求解任務管理器運行一個極小的 CP-SAT 求解 (同時啟動 forkserver 並預先導入求解模塊)，
+# 完成後 /healthz 才返回 200。gunicorn 由 gunicorn.conf.py 的 post_fork 觸發，直接運行 main.py 時在啟動前觸發，其餘情況由第一次 /healthz 觸發
+_warm_up = {"state": "pending", "error": None}
+_warm_up_lock = threading.Lock()
+
+def start_warm_up():
+    with _warm_up_lock:
+        if _warm_up["state"] != "pending": return
+        _warm_up["state"] = "warming"
+    threading.Thread(target=_run_warm_up, name="solver-warm-up", daemon=True).start()
+
+def _run_warm_up():
+    started = time.monotonic()
+    try:
+        load_solver_modules()
+        if WarmUpSolve is None: raise RuntimeError("排班核心組件加載失敗")
+        job = get_job_manager().submit(WarmUpSolve())
+        job.wait()
+        if job.status != JOB_DONE: raise RuntimeError(job.error or job.status)
+    except Exception as e:
+        _warm_up.update(state="failed", error=f"{type(e).__name__}: {e}")
+        logger.error(f"求解預熱失敗: {_warm_up['error']}")
+        return
+    STARTUP_SECONDS.set(round(time.monotonic() - started, 3), phase="warm_up")
+    STARTUP_SECONDS.set(round(time.monotonic() - _MAIN_IMPORT_STARTED, 3), phase="ready")
+    READY_GAUGE.set(1); _warm_up["state"] = "ready"
+    logger.info(f"求解預熱完成: {job.report}，耗時 {time.monotonic() - started:.2f}s")
+
+@app.route('/healthz')
+def healthz():
+    # 就緒檢查：預熱完成前返回 503，平台/負載均衡器據此決定何時把流量切到新進程；預熱失敗時持續返回 503
+    start_warm_up()
+    body = {"status": _warm_up["state"]}
+    if _warm_up["error"]: body["error"] = _warm_up["error"]
+    return jsonify(body), 200 if _warm_up["state"] == "ready" else 503
+
 
 # --- SEO 和驗證文件路由 ---
 @app.route('/sitemap.xml')
@@ -179,4 +752,5 @@ if __name__ == '__main__':
     # 當直接運行 main.py 時 (例如本地開發)，使用 Flask 開發服務器
     # 部署到 Render 等平台時，會使用 Procfile 中的 Gunicorn/Waitress 命令，不會執行到這裡的 app.run()
     logger.info("啟動 Flask 開發服務器 (僅供本地測試)...")
+    start_warm_up()
     app.run(host='0.0.0.0', port=8080, debug=False) # 本地測試時 debug 可以設為 True，部署前務必改回 False
\ No newline at end of file
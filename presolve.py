@@ -0,0 +1,94 @@
+# presolve.py
+# 求解前的解析分析：在需求人數矩陣 (scheduler.demand) 上以 NumPy 向量化計算每格並發需求、未填補需求的下界、
+# 每位員工在規則 1、3 下最多能工作的格數，以及落場窗口的覆蓋能力。全部在毫秒級完成。
+# 注意：全員休息的排班永遠滿足規則 1-3 和規則 5，因此除落場窗口過短外實例不會真正無解，
+# 這裡給出的是目標值 (未填補需求數) 的下界，用於提前證明最優或讓 CP-SAT 提早停止。
+import numpy as np
+
+
+def demand_matrix(scheduler):
+    """返回形狀為 (崗位數, 時隙數) 的需求人數矩陣，行順序與 scheduler.all_job_ints 相同。"""
+    return scheduler.demand
+
+
+def unfilled_units(required, assigned):
+    """每格未填補的需求人數 (可用於 NumPy 數組)：需求 1 人時沿用「恰好一人在崗才算滿足」，需求多人時按缺少的人數計。"""
+    return np.where(required == 1, assigned != 1, np.maximum(required - assigned, 0))
+
+
+def max_work_slots(allowed, max_work, rest_after, rest_rule_last_start, break_windows=(), break_len=0):
+    # 單個員工在 allowed 為 True 的時隙中最多能工作多少格 (放寬規則 2 同崗要求，因此是上界)。
+    # 狀態: (當前連續工作格數, 剩餘強制休息格數, 所在落場窗口內當前連續休息格數；達到 break_len 表示已滿足)
+    window_at = {}
+    for break_start, break_end in break_windows:
+        for t in range(break_start, break_end): window_at[t] = (break_start, break_end)
+    states = {(0, 0, 0): 0}
+    for t, can_work in enumerate(allowed):
+        in_window = t in window_at
+        break_end = window_at[t][1] if in_window else -1
+        if in_window and t == window_at[t][0]: # 進入新的落場窗口，連續休息重新計算
+            states = _merge_states(((run, forced, 0), worked) for (run, forced, _), worked in states.items())
+        next_states = {}
+        for (run, forced, streak), worked in states.items():
+            rest_streak = min(break_len, streak + 1) if in_window else streak
+            candidates = [((0, max(0, forced - 1), rest_streak), worked)]
+            if can_work and not forced and run < max_work:
+                new_run = run + 1
+                new_forced = rest_after if new_run == max_work and t - max_work + 1 <= rest_rule_last_start else 0
+                candidates.append(((new_run, new_forced, streak if streak >= break_len or not in_window else 0), worked + 1))
+            for key, value in candidates:
+                if t == break_end - 1 and key[2] < break_len: continue # 落場窗口結束時必須已有足夠連續休息
+                if next_states.get(key, -1) < value: next_states[key] = value
+        states = next_states
+    return max(states.values()) if states else 0
+
+
+def _merge_states(items):
+    states = {}
+    for key, value in items:
+        if states.get(key, -1) < value: states[key] = value
+    return states
+
+
+def analyze(scheduler):
+    """返回分析結果 dict；lower_bound 為任何合法排班的未填補需求數下界。"""
+    E, N = scheduler.num_employees, scheduler.num_slots
+    demands = demand_matrix(scheduler)
+    concurrency = demands.sum(axis=0)
+    total_demand = int(concurrency.sum())
+    excess = np.maximum(concurrency - E, 0)
+    coverable = np.minimum(concurrency, E)
+
+    rest_rule_last_start = N - scheduler.max_consecutive_work_slots - scheduler.rest_slots_after_consecutive_work
+    break_windows = []
+    if scheduler.enable_mandatory_break and not scheduler.model_definitely_infeasible:
+        break_windows = scheduler.break_windows
+    cap = lambda allowed: max_work_slots(allowed.tolist(), scheduler.max_consecutive_work_slots,
+                                         scheduler.rest_slots_after_consecutive_work, rest_rule_last_start, break_windows, scheduler.min_consecutive_rest_slots)
+
+    # 下界 1: 同一格的需求數超過員工人數
+    concurrency_bound = int(excess.sum())
+    # 下界 2: 每位員工全天最多工作 max_work 格
+    max_work = cap(concurrency > 0) if E > 0 else 0
+    capacity_bound = max(0, total_demand - E * max_work)
+    # 下界 3: 落場窗口內每位員工必須連續休息，窗口內的覆蓋能力有限；窗口外仍按並發下界計算
+    window_bound = 0; window_max_work = None
+    if break_windows:
+        in_window = np.zeros(N, dtype=bool)
+        for break_start, break_end in break_windows: in_window[break_start:break_end] = True
+        window_max_work = cap((concurrency > 0) & in_window) if E > 0 else 0
+        window_bound = max(int(excess[in_window].sum()), int(concurrency[in_window].sum()) - E * window_max_work) + int(excess[~in_window].sum())
+
+    lower_bound = min(total_demand, max(concurrency_bound, capacity_bound, window_bound))
+    return {
+        "total_demand": total_demand,
+        "lower_bound": lower_bound,
+        "max_concurrency": int(concurrency.max()) if N else 0,
+        "overloaded_slots": int((excess > 0).sum()),
+        "max_coverable": int(coverable.sum()),
+        "max_work_slots_per_employee": max_work,
+        "break_window_max_work_slots": window_max_work,
+        # 規則 5 (+-1 平衡) 永遠可滿足；若每人都做滿 max_work 格，平衡後最多覆蓋 E * max_work 格
+        "balanced_capacity": E * max_work,
+        "bounds": {"concurrency": concurrency_bound, "capacity": capacity_bound, "break_window": window_bound},
+    }
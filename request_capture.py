@@ -0,0 +1,64 @@
+# request_capture.py
+# 可選的 /schedule 請求錄製：把清洗後的請求體連同耗時和最終狀態追加到按大小輪轉的 JSONL 文件，
+# 用於重現生產環境中的慢請求 (python -m benchmarks.runner --replay) 和回放壓測 (python -m benchmarks.loadtest)。
+# 只有設置了環境變量 SCHEDULE_CAPTURE_PATH 時才啟用；寫入經由 logging 的 RotatingFileHandler (自帶鎖，多線程安全)，
+# 但直接交給 handler 而不經過 logger，不受應用日誌級別或 logging.disable 的影響，也不會混入應用日誌。
+import os
+import json
+import time
+import random
+import hashlib
+import logging
+import logging.handlers
+
+# 只錄製決定實例和求解方式的字段；其餘字段 (包括將來可能加入的客戶端信息) 一律丟棄
+CAPTURED_KEYS = (
+    "k_employees", "schedule_period", "job_requirements", "max_consecutive_work_minutes", "rest_duration_minutes_after_work",
+    "enable_mandatory_break", "designated_global_break_period", "min_mandatory_break_minutes", "slot_duration_minutes",
+    "fixed_assignments", "prior_work_counts", "engine", "model_builder", "symmetry_breaking", "relax", "format",
+    "latency_budget_seconds", "relative_gap_limit", "minimal_change",
+)
+
+
+def sanitize(payload):
+    """只保留 CAPTURED_KEYS；session_id 只保留其哈希 (回放時仍可把同一會話的請求歸在一起)。"""
+    if not isinstance(payload, dict): return None
+    sanitized = {key: payload[key] for key in CAPTURED_KEYS if key in payload}
+    if isinstance(payload.get("session_id"), str):
+        sanitized["session_id"] = hashlib.sha256(payload["session_id"].encode("utf-8")).hexdigest()[:16]
+    return sanitized
+
+
+class RequestCapture:
+    def __init__(self, path, max_bytes=50 * 1024 * 1024, backup_count=5, sample_rate=1.0):
+        self.path = path
+        self.sample_rate = sample_rate
+        self._handler = logging.handlers.RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8")
+        self._handler.setFormatter(logging.Formatter("%(message)s"))
+
+    def record(self, endpoint, payload, elapsed_s, status_code, report=None):
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate: return
+        sanitized = sanitize(payload)
+        if sanitized is None: return
+        entry = {"ts": round(time.time(), 3), "endpoint": endpoint, "payload": sanitized,
+                 "elapsed_ms": round(elapsed_s * 1000, 1), "status_code": status_code}
+        if report:
+            entry.update(status=report.get("status"), solved_by=report.get("solved_by"), cache_hit=bool(report.get("cache_hit")),
+                         unfilled=len(report.get("unfilled_job_slots") or ()))
+        try:
+            line = json.dumps(entry, ensure_ascii=False, separators=(",", ":"))
+        except (TypeError, ValueError): # 請求體含有無法序列化的值時放棄錄製，不影響請求本身
+            return
+        self._handler.handle(logging.makeLogRecord({"msg": line, "levelno": logging.INFO, "levelname": "INFO"}))
+
+
+def from_environ():
+    """按環境變量創建 RequestCapture；未設置 SCHEDULE_CAPTURE_PATH 時返回 None。"""
+    path = os.environ.get("SCHEDULE_CAPTURE_PATH")
+    if not path: return None
+    return RequestCapture(
+        path,
+        max_bytes=int(float(os.environ.get("SCHEDULE_CAPTURE_MAX_MB", "50")) * 1024 * 1024),
+        backup_count=int(os.environ.get("SCHEDULE_CAPTURE_BACKUPS", "5")),
+        sample_rate=float(os.environ.get("SCHEDULE_CAPTURE_SAMPLE_RATE", "1.0")),
+    )
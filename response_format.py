@@ -0,0 +1,95 @@
+# response_format.py
+# 排班結果的響應格式與壓縮。默認 "grid" 格式每位員工每格一個字符串，且 report 的 schedule_details 再重複一遍；
+# "intervals" 格式把每位員工的一天壓縮為工作段 [start, end, job] (相對時隙索引，end 不含，未列出的時隙即休息)，
+# 未填補需求合併為同崗位、同缺少人數的連續區間，JSON 體積通常只有 grid 格式的一小部分。
+import collections
+import gzip
+
+try:
+    import brotli # 可選依賴：未安裝時只協商 gzip
+except ImportError:
+    brotli = None
+
+RESPONSE_FORMATS = ("grid", "intervals")
+MIN_COMPRESS_BYTES = 1024 # 小於此大小的響應壓縮得不償失
+
+
+def grid_row_to_segments(row):
+    """["R", "A", "A", "R", "B"] -> [[1, 3, "A"], [4, 5, "B"]]"""
+    segments = []
+    for s, cell in enumerate(row):
+        if cell in ("R", ""): continue
+        if segments and segments[-1][1] == s and segments[-1][2] == cell: segments[-1][1] = s + 1
+        else: segments.append([s, s + 1, cell])
+    return segments
+
+
+def merge_unfilled(unfilled_job_slots, schedule_start_slot, slot_minutes=30):
+    # 把逐格的 unfilled_job_slots 合併為 {"job_code", "start", "end", "time_range"}，start/end 為相對時隙索引。
+    # 需求多人的崗位每缺一人有一條逐格條目；每格缺少超過 1 人時區間附帶 "missing" (每格缺少人數)，只合併缺少人數相同的相鄰時隙
+    from backend_api import time_to_slot, slot_to_time_str # 延遲導入：本模塊的壓縮處理每個響應都會用到，不應因此加載 OR-Tools
+    missing_by_job = {}
+    for item in unfilled_job_slots:
+        slot = time_to_slot(item["time_slot"], slot_minutes)
+        if slot is None: continue
+        missing = missing_by_job.setdefault(item["job_code"], collections.Counter())
+        missing[slot - schedule_start_slot] += 1
+    ranges = []
+    for job_code in sorted(missing_by_job):
+        for s, count in sorted(missing_by_job[job_code].items()):
+            if ranges and ranges[-1]["job_code"] == job_code and ranges[-1]["end"] == s and ranges[-1].get("missing", 1) == count: ranges[-1]["end"] = s + 1
+            else: ranges.append({"job_code": job_code, "start": s, "end": s + 1, **({"missing": count} if count > 1 else {})})
+    for r in ranges:
+        r["time_range"] = f"{slot_to_time_str(r['start'] + schedule_start_slot, slot_minutes)}-{slot_to_time_str(r['end'] + schedule_start_slot, slot_minutes)}"
+    ranges.sort(key=lambda r: (r["start"], r["job_code"]))
+    return ranges
+
+
+def to_intervals(solution_grid, report):
+    """返回 intervals 格式的響應體；report 去掉與排班重複的 schedule_details 和逐格 unfilled_job_slots。"""
+    schedule_start_slot = report.get("schedule_start_slot", 0)
+    compact_report = {key: value for key, value in report.items() if key not in ("employee_stats", "unfilled_job_slots")}
+    compact_report["employee_stats"] = [{key: value for key, value in stats.items() if key != "schedule_details"} for stats in report.get("employee_stats", [])]
+    compact_report["unfilled_count"] = len(report.get("unfilled_job_slots", []))
+    return {
+        "format": "intervals",
+        "num_slots": len(next(iter(solution_grid.values()), [])) if solution_grid else 0,
+        "schedule": {emp: grid_row_to_segments(row) for emp, row in (solution_grid or {}).items()},
+        "unfilled": merge_unfilled(report.get("unfilled_job_slots", []), schedule_start_slot, report.get("slot_duration_minutes", 30)),
+        "report": compact_report,
+    }
+
+
+def format_result(solution_grid, report, response_format="grid"):
+    if response_format == "intervals": return to_intervals(solution_grid, report)
+    return {"solution_grid": solution_grid, "report": report}
+
+
+def _accepted_encodings(accept_encoding):
+    # 解析 Accept-Encoding，忽略 q=0 的編碼
+    accepted = set()
+    for part in (accept_encoding or "").split(","):
+        name, _, params = part.strip().partition(";")
+        params = params.replace(" ", "")
+        try:
+            if params.startswith("q=") and float(params[2:]) == 0: continue
+        except ValueError:
+            continue
+        if name: accepted.add(name.strip().lower())
+    return accepted
+
+
+def compress_response(response, accept_encoding):
+    """按客戶端 Accept-Encoding 就地壓縮 Flask 響應 (優先 br，其次 gzip)；流式響應和小響應保持原樣。"""
+    if response.direct_passthrough or response.is_streamed or "Content-Encoding" in response.headers: return response
+    if response.status_code < 200 or response.status_code >= 300 or not response.mimetype.startswith(("application/json", "text/")): return response
+    accepted = _accepted_encodings(accept_encoding)
+    response.vary.add("Accept-Encoding")
+    data = response.get_data()
+    if len(data) < MIN_COMPRESS_BYTES: return response
+    if brotli is not None and "br" in accepted: encoding, body = "br", brotli.compress(data, quality=5)
+    elif "gzip" in accepted: encoding, body = "gzip", gzip.compress(data, compresslevel=6)
+    else: return response
+    response.set_data(body)
+    response.headers["Content-Encoding"] = encoding
+    return response
@@ -0,0 +1,168 @@
+# result_cache.py
+# 排班求解結果緩存：以規範化實例鍵 (ShiftSchedulerWithConstraints.canonical_key) 索引，
+# 內存層為 LRU + TTL + 容量上限，可選磁盤層在重啟後仍然有效。
+# 磁盤層在啟動時及之後每次寫入 (至多每 DISK_PRUNE_INTERVAL_SECONDS 一次) 清理過期文件，並按修改時間從舊到新刪除超出容量上限的文件。
+import os
+import json
+import time
+import logging
+import threading
+import collections
+
+logger = logging.getLogger(__name__)
+
+# 只有已證明最優的結果才按完整 TTL 緩存；其他確定性狀態只做短期緩存，UNKNOWN 等不緩存
+FULL_TTL_STATUSES = ("OPTIMAL",)
+SHORT_TTL_STATUSES = ("FEASIBLE", "INFEASIBLE", "INFEASIBLE_PRE_SOLVE")
+DISK_PRUNE_INTERVAL_SECONDS = 60.0
+STALE_TMP_SECONDS = 600.0 # 寫入中途崩潰留下的臨時文件
+
+
+class ScheduleResultCache:
+    def __init__(self, max_entries=256, max_bytes=64 * 1024 * 1024, ttl_seconds=3600.0, short_ttl_seconds=60.0, disk_dir=None, disk_max_bytes=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.short_ttl_seconds = short_ttl_seconds
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes if disk_max_bytes is not None else max_bytes # 默認與內存層的容量上限相同
+        self._entries = collections.OrderedDict() # key -> (expires_at, payload_bytes)
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self._disk_lock = threading.Lock()
+        self._next_disk_prune = 0.0
+        self.counters = {"hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "evictions": 0, "expirations": 0, "disk_evictions": 0}
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            self._disk_prune(time.time())
+
+    def ttl_for_status(self, status):
+        if status in FULL_TTL_STATUSES: return self.ttl_seconds
+        if status in SHORT_TTL_STATUSES: return self.short_ttl_seconds
+        return 0
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, payload = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.counters["hits"] += 1
+                    return json.loads(payload)
+                self._remove(key)
+                self.counters["expirations"] += 1
+        disk_entry = self._disk_read(key, now)
+        with self._lock:
+            if disk_entry is None:
+                self.counters["misses"] += 1
+                return None
+            self.counters["disk_hits"] += 1
+            self._insert(key, *disk_entry)
+        return json.loads(disk_entry[1])
+
+    def put(self, key, solution_grid, report):
+        ttl = self.ttl_for_status(report.get("status"))
+        if ttl <= 0:
+            return False
+        payload = json.dumps({"solution_grid": solution_grid, "report": report}, ensure_ascii=False).encode("utf-8")
+        if len(payload) > self.max_bytes:
+            return False
+        expires_at = time.time() + ttl
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._insert(key, expires_at, payload)
+            self.counters["stores"] += 1
+        self._disk_write(key, expires_at, payload)
+        return True
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counters, entries=len(self._entries), bytes=self._total_bytes,
+                        max_entries=self.max_entries, max_bytes=self.max_bytes, disk=bool(self.disk_dir), disk_max_bytes=self.disk_max_bytes if self.disk_dir else None)
+
+    # --- 內存層 (調用方持有鎖) ---
+    def _insert(self, key, expires_at, payload):
+        self._entries[key] = (expires_at, payload)
+        self._total_bytes += len(payload)
+        while self._entries and (len(self._entries) > self.max_entries or self._total_bytes > self.max_bytes):
+            oldest_key = next(iter(self._entries))
+            self._remove(oldest_key)
+            self.counters["evictions"] += 1
+
+    def _remove(self, key):
+        _, payload = self._entries.pop(key)
+        self._total_bytes -= len(payload)
+
+    # --- 磁盤層 ---
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, f"{key}.json")
+
+    def _disk_read(self, key, now):
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, "rb") as f:
+                expires_line, payload = f.read().split(b"\n", 1)
+            expires_at = float(expires_line)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"讀取磁盤緩存 {path} 失敗: {e}")
+            return None
+        if expires_at <= now:
+            try: os.remove(path)
+            except OSError: pass
+            return None
+        return expires_at, payload
+
+    def _disk_write(self, key, expires_at, payload):
+        if not self.disk_dir:
+            return
+        path = self._disk_path(key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(f"{expires_at}\n".encode("ascii") + payload)
+            os.replace(tmp_path, path) # 原子替換，避免並發讀到半個文件
+        except OSError as e:
+            logger.warning(f"寫入磁盤緩存 {path} 失敗: {e}")
+        now = time.time()
+        if now >= self._next_disk_prune: self._disk_prune(now)
+
+    def _disk_prune(self, now):
+        # 同一目錄可能被多個 worker 進程共用，文件隨時可能被別人刪除，刪除失敗一律忽略
+        if not self._disk_lock.acquire(blocking=False): return # 另一線程正在清理
+        try:
+            self._next_disk_prune = now + DISK_PRUNE_INTERVAL_SECONDS
+            files = [] # (修改時間, 大小, 路徑)
+            with os.scandir(self.disk_dir) as it:
+                for dir_entry in it:
+                    try:
+                        stat = dir_entry.stat()
+                        if dir_entry.name.endswith(".tmp"):
+                            if stat.st_mtime < now - STALE_TMP_SECONDS: os.remove(dir_entry.path)
+                            continue
+                        if not dir_entry.name.endswith(".json"): continue
+                        with open(dir_entry.path, "rb") as f:
+                            expires_at = float(f.readline())
+                        if expires_at <= now: os.remove(dir_entry.path); continue
+                        files.append((stat.st_mtime, stat.st_size, dir_entry.path))
+                    except (OSError, ValueError):
+                        continue
+            total_bytes = sum(size for _, size, _ in files)
+            evicted = 0
+            for _, size, path in sorted(files):
+                if total_bytes <= self.disk_max_bytes: break
+                try: os.remove(path)
+                except OSError: pass
+                total_bytes -= size; evicted += 1
+            if evicted:
+                with self._lock: self.counters["disk_evictions"] += evicted
+        except OSError as e:
+            logger.warning(f"清理磁盤緩存 {self.disk_dir} 失敗: {e}")
+        finally:
+            self._disk_lock.release()
@@ -0,0 +1,158 @@
+# session.py
+# 增量求解會話：規劃員通常是「求解 → 改一行崗位需求或員工人數 → 再求解」。服務器按 session_id 保存上一次的
+# 已解析實例和排班，新請求與之比較：上一次的排班換算到新實例後作為初始解/提示；只改了崗位需求時，
+# 先把改動時段附近以外的格子固定為上一次的安排做局部求解 (固定部分在 CP-SAT 預處理階段即被消去)，
+# 達到解析下界即返回，否則以局部結果為提示再做完整求解。可選的最小改動目標讓新排班盡量接近上一次。
+import copy
+import time
+import threading
+import collections
+
+import numpy as np
+
+from backend_api import REST_R_CODE, FIRST_JOB_CODE, DEFAULT_TIME_LIMIT_SECONDS
+import solver_policy
+
+LOCAL_TIME_FRACTION = 0.25 # 局部求解最多用掉的時間比例，其餘留給完整求解
+MAX_SESSION_ID_LENGTH = 64
+
+
+class ScheduleSessionStore:
+    """session_id -> (已解析實例, solution_grid)，LRU + TTL。只存在於當前 Web 進程的內存中。"""
+
+    def __init__(self, max_sessions=256, ttl_seconds=1800.0):
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self._sessions = collections.OrderedDict() # session_id -> (expires_at, scheduler, solution_grid)
+        self._lock = threading.Lock()
+
+    def get(self, session_id):
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None: return None
+            if entry[0] <= time.time():
+                del self._sessions[session_id]
+                return None
+            self._sessions.move_to_end(session_id)
+            return entry[1], entry[2]
+
+    def put(self, session_id, scheduler, solution_grid):
+        if not solution_grid: return # 無解的結果不能作為下一次的起點
+        with self._lock:
+            self._sessions.pop(session_id, None)
+            self._sessions[session_id] = (time.time() + self.ttl_seconds, scheduler, solution_grid)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return {"sessions": len(self._sessions), "max_sessions": self.max_sessions}
+
+
+def _rule_signature(sch):
+    return (sch.max_consecutive_work_slots, sch.rest_slots_after_consecutive_work, sch.enable_mandatory_break, sch.min_consecutive_rest_slots,
+            tuple(sch.break_windows), sorted(sch.fixed_assignments.items()))
+
+
+def diff_instances(old, new):
+    """比較兩個已解析實例。kind: "identical" 完全相同；"demand" 只有崗位需求不同；
+    "structural" 員工人數或規則不同 (排班時段和時隙長度相同時仍可沿用上一次的排班作提示)；"incompatible" 時隙網格不同。"""
+    if (old.schedule_start_slot, old.num_slots, old.slot_duration_minutes) != (new.schedule_start_slot, new.num_slots, new.slot_duration_minutes):
+        return {"kind": "incompatible", "changes": ["schedule_period"]}
+    changes = []
+    if old.num_employees != new.num_employees: changes.append("employees")
+    if _rule_signature(old) != _rule_signature(new): changes.append("rules")
+    # 累計工作格數按員工比較，新增員工的默認 0 不算改動
+    width = max(old.num_employees, new.num_employees)
+    if [*old.prior_work_counts, *[0] * (width - old.num_employees)] != [*new.prior_work_counts, *[0] * (width - new.num_employees)]: changes.append("prior_work_counts")
+    changed_jobs = []; changed_slots = set()
+    no_demand = np.zeros(new.num_slots, dtype=new.demand.dtype)
+    for code in sorted(set(old.job_code_to_int) | set(new.job_code_to_int)):
+        old_row = old.demand[old.job_code_to_int[code] - FIRST_JOB_CODE] if code in old.job_code_to_int else no_demand
+        new_row = new.demand[new.job_code_to_int[code] - FIRST_JOB_CODE] if code in new.job_code_to_int else no_demand
+        slots = np.flatnonzero(old_row != new_row).tolist()
+        if slots: changed_jobs.append(code); changed_slots.update(slots)
+    if changed_jobs: changes.append("demand")
+    kind = "identical" if not changes else "demand" if changes == ["demand"] else "structural"
+    return {"kind": kind, "changes": changes, "changed_jobs": changed_jobs, "changed_slots": sorted(changed_slots)}
+
+
+def previous_values(new, solution_grid):
+    # 把上一次的 solution_grid 換算為新實例的 task_values：按員工編號和崗位代碼對應，
+    # 新實例中不存在的崗位、沒有需求 (且未固定) 的格子改為休息，新增的員工全部休息
+    rows = []
+    for e in range(new.num_employees):
+        row = solution_grid.get(f'K{e+1}') or []
+        values = []
+        for s in range(new.num_slots):
+            job_int = new.job_code_to_int.get(row[s]) if s < len(row) else None
+            keep = job_int is not None and (new.demand[job_int - FIRST_JOB_CODE, s] > 0 or new.fixed_assignments.get((e, s)) == job_int)
+            values.append(job_int if keep else REST_R_CODE)
+        rows.append(values)
+    return rows
+
+
+class IncrementalSolve:
+    """包裝新實例及上一次的排班；solve() 的接口與 ShiftSchedulerWithConstraints.solve 相同，可直接交給求解任務管理器。"""
+
+    def __init__(self, scheduler, previous, diff, minimal_change=False):
+        self.scheduler = scheduler
+        self.previous = previous # 已換算為新實例的 task_values
+        self.diff = diff
+        self.minimal_change = minimal_change
+
+    def local_instance(self):
+        # 只放開改動時段前後各「一段連續工作 + 強制休息 / 一個落場窗口」的範圍 (以及與之相交的落場窗口)，
+        # 其餘格子固定為上一次的安排；放開的範圍覆蓋整個排班時段時返回 (None, 0)
+        sch = self.scheduler
+        margin = max([sch.max_consecutive_work_slots + sch.rest_slots_after_consecutive_work] + [end - start for start, end in sch.break_windows])
+        free = set()
+        for s in self.diff["changed_slots"]: free.update(range(max(0, s - margin), min(sch.num_slots, s + margin + 1)))
+        for start, end in sch.break_windows:
+            if any(start <= s < end for s in free): free.update(range(start, end))
+        if not free or len(free) >= sch.num_slots: return None, 0
+        local = copy.copy(sch)
+        local.fixed_assignments = {(e, s): self.previous[e][s] for e in range(sch.num_employees) for s in range(sch.num_slots) if s not in free}
+        local.fixed_assignments.update(sch.fixed_assignments)
+        return local, len(free)
+
+    def solve(self, on_solution=None, stop_event=None, time_limit_seconds=None, **solve_options):
+        sch = self.scheduler
+        started = time.monotonic()
+        time_limit = time_limit_seconds or DEFAULT_TIME_LIMIT_SECONDS
+        remaining = solver_policy.remaining_seconds(solve_options.get("deadline"))
+        if remaining is not None: time_limit = max(1.0, min(time_limit, remaining))
+        incremental = {"kind": self.diff["kind"], "changes": self.diff["changes"], "changed_jobs": self.diff["changed_jobs"],
+                       "changed_slots": len(self.diff["changed_slots"]), "minimal_change": self.minimal_change}
+        hint = self.previous
+        if self.diff["kind"] == "demand" and solve_options.get("engine", "exact") == "exact" and not sch.model_definitely_infeasible:
+            local, free_slots = self.local_instance()
+            if local is not None:
+                local_limit = max(1.0, time_limit * LOCAL_TIME_FRACTION)
+                solution_grid, report = local.solve(on_solution=on_solution, stop_event=stop_event, time_limit_seconds=local_limit,
+                                                    previous_values=self.previous, minimal_change=self.minimal_change, **solve_options)
+                incremental["local"] = {"status": report["status"], "free_slots": free_slots, "unfilled": len(report["unfilled_job_slots"]),
+                                        "elapsed_s": round(time.monotonic() - started, 3)}
+                if report["status"] in ("OPTIMAL", "FEASIBLE"):
+                    local_values = [[REST_R_CODE if cell == "R" else sch.job_code_to_int[cell] for cell in solution_grid[f'K{e+1}']] for e in range(sch.num_employees)]
+                    if len(report["unfilled_job_slots"]) <= report["presolve"]["lower_bound"]:
+                        # 未填補數已達整個實例的解析下界 (下界與固定安排無關)。最小改動模式下放開範圍以外的改動數為 0，
+                        # 但未證明全局最少改動，因此報告 FEASIBLE
+                        report["status"] = "FEASIBLE" if self.minimal_change else "OPTIMAL"
+                        report.update(solved_by="local", incremental=incremental)
+                        return solution_grid, report
+                    if not self.minimal_change: hint = local_values # 最小改動模式的比較基準必須仍是上一次的排班
+        remaining = max(1.0, time_limit - (time.monotonic() - started))
+        solution_grid, report = sch.solve(on_solution=on_solution, stop_event=stop_event, time_limit_seconds=remaining,
+                                          previous_values=hint, minimal_change=self.minimal_change, **solve_options)
+        report["incremental"] = incremental
+        return solution_grid, report
+
+
+def build_incremental(session_entry, scheduler, minimal_change=False):
+    """根據會話中上一次的 (實例, solution_grid) 為新實例建立 IncrementalSolve；無法沿用時返回 None。"""
+    if session_entry is None: return None
+    old_scheduler, solution_grid = session_entry
+    diff = diff_instances(old_scheduler, scheduler)
+    if diff["kind"] == "incompatible": return None
+    return IncrementalSolve(scheduler, previous_values(scheduler, solution_grid), diff, minimal_change)
@@ -0,0 +1,53 @@
+# solver_policy.py
+# 求解資源策略：CP-SAT 的搜索線程數按主機核數和同時運行的求解任務數分配，避免多個任務搶佔同一批核；
+# 時間上限為調用方給出的上限 (默認 DEFAULT_TIME_LIMIT_SECONDS)，並且不超過請求剩餘的時限；小模型證明最優後即停止，不會用滿上限；
+# 目標值達到解析下界 (模型中已加入下界約束，CP-SAT 找到即證明最優) 或相對差距目標時提前停止。
+# deadline 使用 time.time() 的絕對時間，可跨進程傳遞 (請求線程 -> 求解子進程)，排隊等待的時間同樣計入。
+import os
+import time
+
+MIN_TIME_LIMIT_SECONDS = 1.0
+DEADLINE_MARGIN_SECONDS = 1.0 # 留給生成報告和回傳結果的時間
+MAX_WORKERS_PER_SOLVE = 8 # CP-SAT 超過 8 個線程後收益很小
+
+
+def available_cores():
+    """本進程可用的 CPU 核數；可用環境變量 SCHEDULER_SOLVER_CORES 覆蓋 (例如容器的 CPU 配額小於可見核數時)。"""
+    configured = int(os.environ.get("SCHEDULER_SOLVER_CORES", "0"))
+    if configured > 0: return configured
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError: # 非 Linux 平台
+        return os.cpu_count() or 1
+
+
+def workers_for(concurrency, cores=None):
+    # concurrency: 包括本任務在內同時運行 (及排隊等待) 的求解任務數；已在運行的任務不會重新分配線程
+    cores = cores or available_cores()
+    return max(1, min(MAX_WORKERS_PER_SOLVE, cores // max(1, concurrency)))
+
+
+def remaining_seconds(deadline):
+    return None if deadline is None else deadline - time.time() - DEADLINE_MARGIN_SECONDS
+
+
+def time_limit_for(time_limit_seconds, deadline=None):
+    """返回 (時間上限, 起作用的上限)：不超過 time_limit_seconds 及 deadline 剩餘的時間，至少 MIN_TIME_LIMIT_SECONDS。
+    起作用的上限為 "time_limit"、"deadline" 或 "minimum"，寫入 stats.policy 的 time_limit_cap。"""
+    limit, cap = time_limit_seconds, "time_limit"
+    remaining = remaining_seconds(deadline)
+    if remaining is not None and remaining < limit: limit, cap = remaining, "deadline"
+    if limit < MIN_TIME_LIMIT_SECONDS: limit, cap = MIN_TIME_LIMIT_SECONDS, "minimum"
+    return limit, cap
+
+
+def configure(solver, time_limit_seconds, num_workers=None, deadline=None, relative_gap_limit=None):
+    """設置 CP-SAT 參數，返回寫入報告 stats.policy 的摘要。num_workers 為 None 時按可用核數決定 (單任務)。"""
+    solver.parameters.num_workers = num_workers or workers_for(1)
+    time_limit, cap = time_limit_for(time_limit_seconds, deadline)
+    solver.parameters.max_time_in_seconds = time_limit
+    if relative_gap_limit: solver.parameters.relative_gap_limit = relative_gap_limit
+    policy = {"num_workers": solver.parameters.num_workers, "time_limit_s": round(time_limit, 2), "time_limit_cap": cap}
+    if relative_gap_limit: policy["relative_gap_limit"] = relative_gap_limit
+    if deadline is not None: policy["deadline_remaining_s"] = round(deadline - time.time(), 2)
+    return policy
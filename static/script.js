@@ -59,7 +59,7 @@ function generateHtmlTable(dataArray, columns, headers = {}) {
     tableHtml += "</tbody></table>";
     return tableHtml;
 }
-function jsTimeToSlot(timeStr) {
+function jsTimeToSlot(timeStr, slotMinutes = 30) {
     if (!timeStr || typeof timeStr !== 'string') return null;
     const parts = timeStr.split(':');
     if (parts.length !== 2) return null;
@@ -67,24 +67,24 @@ function jsTimeToSlot(timeStr) {
         const h = parseInt(parts[0], 10);
         const m = parseInt(parts[1], 10);
         if (isNaN(h) || isNaN(m) || m < 0 || m > 59 || h < 0) return null;
-        return h * 2 + Math.floor(m / 30);
+        return Math.floor((h * 60 + m) / slotMinutes);
     } catch { return null; }
 }
-function jsSlotToTimeStr(slotIndex) {
+function jsSlotToTimeStr(slotIndex, slotMinutes = 30) {
      if (typeof slotIndex !== 'number' || slotIndex < 0 || !Number.isInteger(slotIndex) ) return "??:??";
-     const h = Math.floor(slotIndex / 2);
-     const m = (slotIndex % 2) * 30;
+     const h = Math.floor(slotIndex * slotMinutes / 60);
+     const m = (slotIndex * slotMinutes) % 60;
      return `${String(h).padStart(2, '0')}:${String(m).padStart(2, '0')}`;
 }
- function jsParseTimeRange(rangeStr) {
+ function jsParseTimeRange(rangeStr, slotMinutes = 30) {
     if (!rangeStr || typeof rangeStr !== 'string') return [null, null];
     let parts;
     if (rangeStr.includes('–')) parts = rangeStr.split('–'); // EN DASH
     else if (rangeStr.includes('-')) parts = rangeStr.split('-'); // HYPHEN
     else return [null, null];
     if (parts.length !== 2) return [null, null];
-    const startSlot = jsTimeToSlot(parts[0].trim());
-    const endSlot = jsTimeToSlot(parts[1].trim());
+    const startSlot = jsTimeToSlot(parts[0].trim(), slotMinutes);
+    const endSlot = jsTimeToSlot(parts[1].trim(), slotMinutes);
     if (startSlot === null || endSlot === null) {
          console.warn(`Invalid time string in range for parsing: ${rangeStr}`);
          return [null, null];
@@ -95,11 +95,19 @@ function jsSlotToTimeStr(slotIndex) {
 /**
  * 格式化排班結果為 HTML 表格
  */
-function formatGridAsTable(gridData, unfilledSlots, schedulePeriodStr, status) {
+// intervals 響應格式：工作段 [start, end, job] (相對時隙，end 不含) 展開為逐格數組，未列出的時隙即休息
+function segmentsToRow(segments, numSlots) {
+    const row = Array(numSlots).fill('R');
+    (segments || []).forEach(([start, end, job]) => { for (let s = start; s < end && s < numSlots; s++) row[s] = job; });
+    return row;
+}
+
+// format 為 'intervals' 時，gridData 為 {員工: 工作段列表}，unfilledSlots 為合併後的 {job_code, start, end, missing} 區間 (missing 省略時為 1)
+function formatGridAsTable(gridData, unfilledSlots, schedulePeriodStr, status, format = 'grid', slotMinutes = 30) {
     if (!gridData && status !== "OPTIMAL" && status !== "FEASIBLE") {
         return "<p>無有效的排班網格可顯示。</p>";
     }
-    const [startSlotAbs, endSlotAbs] = jsParseTimeRange(schedulePeriodStr);
+    const [startSlotAbs, endSlotAbs] = jsParseTimeRange(schedulePeriodStr, slotMinutes);
     if (startSlotAbs === null || endSlotAbs === null || endSlotAbs <= startSlotAbs) {
         console.error("無法解析排班時段:", schedulePeriodStr);
         return "<p>無法解析排班時段以生成網格。</p>";
@@ -120,10 +128,7 @@ function formatGridAsTable(gridData, unfilledSlots, schedulePeriodStr, status) {
     headerRow.appendChild(thEmpName);
 
     for (let i = 0; i < numSlots; i++) {
-        const sAbs = i + startSlotAbs;
-        const h = Math.floor(sAbs / 2);
-        const m = (sAbs % 2) * 30;
-        const timeHeader = `${String(h).padStart(2, '0')}${String(m).padStart(2, '0')}`;
+        const timeHeader = jsSlotToTimeStr(i + startSlotAbs, slotMinutes).replace(':', '');
         const thTime = document.createElement('th');
         thTime.textContent = timeHeader;
         headerRow.appendChild(thTime);
@@ -140,7 +145,8 @@ function formatGridAsTable(gridData, unfilledSlots, schedulePeriodStr, status) {
         cellEmpName.textContent = empKey;
         cellEmpName.className = 'employee-name-cell';
 
-        const schedule = gridData && gridData[empKey] ? gridData[empKey] : Array(numSlots).fill('');
+        let schedule = gridData && gridData[empKey] ? gridData[empKey] : Array(numSlots).fill('');
+        if (format === 'intervals' && gridData && gridData[empKey]) schedule = segmentsToRow(gridData[empKey], numSlots);
         for (let i = 0; i < numSlots; i++) {
             const cell = row.insertCell();
             let task = schedule[i] || '';
@@ -163,14 +169,17 @@ function formatGridAsTable(gridData, unfilledSlots, schedulePeriodStr, status) {
     cellSDLabel.className = 'employee-name-cell';
 
     const unfilledJobsAtSlot = {};
+    const markUnfilled = (slot, jobCode) => {
+        if (!unfilledJobsAtSlot[slot]) unfilledJobsAtSlot[slot] = [];
+        if (!unfilledJobsAtSlot[slot].includes(jobCode)) unfilledJobsAtSlot[slot].push(jobCode);
+    };
     (unfilledSlots || []).forEach(unfilled => {
-        const slot = jsTimeToSlot(unfilled.time_slot);
-        if (slot !== null) {
-            if (!unfilledJobsAtSlot[slot]) unfilledJobsAtSlot[slot] = [];
-            if (!unfilledJobsAtSlot[slot].includes(unfilled.job_code)) {
-               unfilledJobsAtSlot[slot].push(unfilled.job_code);
-            }
+        if (format === 'intervals') {
+            for (let s = unfilled.start; s < unfilled.end; s++) markUnfilled(startSlotAbs + s, unfilled.job_code);
+            return;
         }
+        const slot = jsTimeToSlot(unfilled.time_slot, slotMinutes);
+        if (slot !== null) markUnfilled(slot, unfilled.job_code);
     });
     for (let i = 0; i < numSlots; i++) {
         const cellSD = sdRow.insertCell();
@@ -202,6 +211,7 @@ document.addEventListener('DOMContentLoaded', () => {
     const scheduleEndSelect = document.getElementById('schedule-end');
     const maxWorkMinutesSelect = document.getElementById('max-work-minutes');
     const restAfterWorkMinutesSelect = document.getElementById('rest-after-work-minutes');
+    const slotDurationSelect = document.getElementById('slot-duration-minutes');
     const enableMandatoryBreakCheckbox = document.getElementById('enable-mandatory-break');
     const mandatoryBreakSettingsDiv = document.getElementById('mandatory-break-settings');
     const breakPeriodStartSelect = document.getElementById('break-period-start');
@@ -217,6 +227,7 @@ document.addEventListener('DOMContentLoaded', () => {
     const clearJobsButton = document.getElementById('clear-jobs-button');
     const generateScheduleButton = document.getElementById('generate-schedule-button');
     const loadingIndicator = document.getElementById('loading-indicator');
+    const acceptSolutionButton = document.getElementById('accept-solution-button');
     const errorMessageDiv = document.getElementById('error-message');
     const scheduleResultsSection = document.getElementById('schedule-results');
     const resultStatusDiv = document.getElementById('result-status');
@@ -246,12 +257,19 @@ document.addEventListener('DOMContentLoaded', () => {
     }
     renderAllJobDefinitions();
 
-    populateTimeSelectWithOptions('schedule-start', 0, 24, '09:00');
-    populateTimeSelectWithOptions('schedule-end', 0, 48, '18:00');
-    populateTimeSelectWithOptions('break-period-start', 0, 48, '12:00');
-    populateTimeSelectWithOptions('break-period-end', 0, 48, '13:00');
-    populateTimeSelectWithOptions('job-time-start', 0, 48, '09:00');
-    populateTimeSelectWithOptions('job-time-end', 0, 48, '10:00');
+    const getSlotMinutes = () => (slotDurationSelect ? parseInt(slotDurationSelect.value) : 30) || 30;
+    // 時間下拉選單的間隔跟隨排班時間粒度，切換粒度時保留已選的時間 (新間隔下不存在時退回默認值)
+    function populateAllTimeSelects() {
+        const interval = getSlotMinutes();
+        [['schedule-start', 24, '09:00'], ['schedule-end', 48, '18:00'], ['break-period-start', 48, '12:00'],
+         ['break-period-end', 48, '13:00'], ['job-time-start', 48, '09:00'], ['job-time-end', 48, '10:00']].forEach(([id, endHour, fallback]) => {
+            const current = document.getElementById(id) ? document.getElementById(id).value : '';
+            const keep = current && parseInt(current.split(':')[1], 10) % interval === 0;
+            populateTimeSelectWithOptions(id, 0, endHour, keep ? current : fallback, interval);
+        });
+    }
+    populateAllTimeSelects();
+    if (slotDurationSelect) slotDurationSelect.addEventListener('change', populateAllTimeSelects);
 
     if (addJobTimeButton) addJobTimeButton.addEventListener('click', handleAddJobTime);
     if (addJobDefinitionButton) addJobDefinitionButton.addEventListener('click', handleAddJobDefinition);
@@ -309,7 +327,7 @@ document.addEventListener('DOMContentLoaded', () => {
     function handleAddJobTime() {
         const start = jobTimeStartSelect.value; const end = jobTimeEndSelect.value;
         if (!start || !end) { alert('請選擇崗位需求的開始和結束時間。'); return; }
-        const startSlot = jsTimeToSlot(start); const endSlot = jsTimeToSlot(end);
+        const startSlot = jsTimeToSlot(start, getSlotMinutes()); const endSlot = jsTimeToSlot(end, getSlotMinutes());
         if (startSlot === null || endSlot === null || endSlot <= startSlot) { alert('崗位需求的結束時間必須晚於開始時間。'); return; }
         const timeRange = `${start}–${end}`;
         if (!currentJobTimeRanges.includes(timeRange)) { currentJobTimeRanges.push(timeRange); currentJobTimeRanges.sort(); renderCurrentJobTimes(); }
@@ -360,12 +378,13 @@ document.addEventListener('DOMContentLoaded', () => {
         const jobRequirementsArray = jobDefinitionsText.split('\n').map(line => line.trim()).filter(line => line && line.includes(' '));
 
         if (isNaN(k) || k <= 0) { showError('員工人數必須是有效的正整數。'); return; }
-        const startSlotVal = jsTimeToSlot(scheduleStart); const endSlotVal = jsTimeToSlot(scheduleEnd);
+        const slotMinutes = getSlotMinutes();
+        const startSlotVal = jsTimeToSlot(scheduleStart, slotMinutes); const endSlotVal = jsTimeToSlot(scheduleEnd, slotMinutes);
         if (startSlotVal === null || endSlotVal === null || endSlotVal <= startSlotVal) { showError('排班總時段的結束時間必須晚於開始時間。'); return; }
         if (isNaN(maxConsecutiveMinutes) || maxConsecutiveMinutes <= 0) { showError('最大連續工作時間選擇無效。'); return; }
         if (isNaN(restDurationAfterWork) || (restDurationAfterWork !== 30 && restDurationAfterWork !== 60)) { showError('連續工作後的休息時間選擇無效。'); return; }
         if (enableBreak) {
-            const breakStartSlot = jsTimeToSlot(breakPeriodStartSelect.value); const breakEndSlot = jsTimeToSlot(breakPeriodEndSelect.value);
+            const breakStartSlot = jsTimeToSlot(breakPeriodStartSelect.value, slotMinutes); const breakEndSlot = jsTimeToSlot(breakPeriodEndSelect.value, slotMinutes);
             if (breakStartSlot === null || breakEndSlot === null || breakEndSlot <= breakStartSlot) { showError('全局落場時段的結束時間必須晚於開始時間。'); return; }
             if (isNaN(minBreakMinutesVal) || minBreakMinutesVal <= 0) { showError('最小落場休息時間選擇無效。'); return; }
         }
@@ -375,8 +394,9 @@ document.addEventListener('DOMContentLoaded', () => {
             k_employees: k, schedule_period: schedulePeriod, max_consecutive_work_minutes: maxConsecutiveMinutes,
             rest_duration_minutes_after_work: restDurationAfterWork, enable_mandatory_break: enableBreak,
             designated_global_break_period: designatedBreakPeriod, min_mandatory_break_minutes: minBreakMinutesVal,
-            job_requirements: jobRequirementsArray
+            job_requirements: jobRequirementsArray, format: 'intervals', slot_duration_minutes: slotMinutes
         };
+        if (slotMinutes < 30) requestData.engine = 'interval'; // 細粒度時隙下逐格模型變量數成倍增加，改用工作段建模
 
         if (errorMessageDiv) { errorMessageDiv.textContent = ''; errorMessageDiv.style.display = 'none'; }
         if (scheduleResultsSection) scheduleResultsSection.style.display = 'none';
@@ -392,36 +412,106 @@ document.addEventListener('DOMContentLoaded', () => {
             loadingIndicator.style.display = 'block';
         }
 
-        scheduleTimer = setTimeout(() => {
-            clearInterval(timerDisplayInterval);
+        // 中斷請求即會令後端取消求解，釋放服務器 CPU
+        const abortController = new AbortController();
+        const finishLoading = () => {
+            clearTimeout(scheduleTimer); scheduleTimer = null; clearInterval(timerDisplayInterval);
             if (loadingIndicator) loadingIndicator.style.display = 'none';
+            if (acceptSolutionButton) { acceptSolutionButton.style.display = 'none'; acceptSolutionButton.onclick = null; }
+        };
+
+        scheduleTimer = setTimeout(() => {
+            finishLoading();
+            abortController.abort();
             showError(`排班計算超時 (${MAX_SOLVE_TIME_SECONDS}秒)。請嘗試簡化需求或放寬約束條件後重試。`);
         }, MAX_SOLVE_TIME_SECONDS * 1000);
 
         try {
-            console.log("Sending payload to /schedule:", JSON.stringify(requestData, null, 2));
-            const response = await fetch('/schedule', { method: 'POST', headers: { 'Content-Type': 'application/json' }, body: JSON.stringify(requestData) });
-            clearTimeout(scheduleTimer); scheduleTimer = null; clearInterval(timerDisplayInterval);
-            if (loadingIndicator) loadingIndicator.style.display = 'none';
-
-            const result = await response.json();
-            window.lastGeneratedReport = result.report;
-
-            if (!response.ok) {
+            console.log("Sending payload to /schedule/stream:", JSON.stringify(requestData, null, 2));
+            const response = await fetch('/schedule/stream', { method: 'POST', headers: { 'Content-Type': 'application/json' }, body: JSON.stringify(requestData), signal: abortController.signal });
+            if (!response.ok || !response.body) {
+                finishLoading();
+                const result = await response.json().catch(() => ({}));
+                window.lastGeneratedReport = result.report;
                 showError(`API 請求失敗 (${response.status}): ${result.error || response.statusText || '未知後端錯誤'}`);
                 if (result.report && scheduleResultsSection) { scheduleResultsSection.style.display = 'block'; displayReportOnly(result.report); }
-            } else {
-                if (scheduleResultsSection) scheduleResultsSection.style.display = 'block';
-                displayResults(result.solution_grid, result.report, schedulePeriod);
+                return;
             }
+
+            let bestGrid = null;
+            await readScheduleStream(response, {
+                job: (info) => {
+                    if (!acceptSolutionButton) return;
+                    acceptSolutionButton.disabled = false;
+                    acceptSolutionButton.onclick = async () => {
+                        acceptSolutionButton.disabled = true;
+                        try { await fetch(info.accept_url, { method: 'POST' }); } catch (e) { console.error("Accept error:", e); }
+                    };
+                },
+                solution: (event) => {
+                    // 中間解：首個事件帶完整網格，之後只帶變化的格子
+                    if (event.solution_grid) bestGrid = event.solution_grid;
+                    else if (bestGrid) (event.changes || []).forEach(([emp, slotIdx, value]) => { bestGrid[emp][slotIdx] = value; });
+                    if (!bestGrid) return;
+                    if (scheduleResultsSection) scheduleResultsSection.style.display = 'block';
+                    if (resultStatusDiv) { resultStatusDiv.textContent = `目前最佳結果: 未填補 ${event.unfilled} 格 (理論下界 ${event.best_bound})，已用時 ${event.elapsed_s} 秒，仍在優化中...`; resultStatusDiv.className = ''; }
+                    if (gridContainer) gridContainer.innerHTML = formatGridAsTable(bestGrid, [], schedulePeriod, "FEASIBLE", 'grid', slotMinutes);
+                    if (acceptSolutionButton) acceptSolutionButton.style.display = 'inline-block';
+                },
+                done: (result) => {
+                    finishLoading();
+                    if (scheduleResultsSection) scheduleResultsSection.style.display = 'block';
+                    if (result.format === 'intervals') {
+                        // 統計表和未填補明細仍按逐格列表顯示，從合併區間還原
+                        const [startSlotAbs] = jsParseTimeRange(schedulePeriod, slotMinutes);
+                        const unfilledJobSlots = [];
+                        (result.unfilled || []).forEach(r => { for (let s = r.start; s < r.end; s++) for (let k = 0; k < (r.missing || 1); k++) unfilledJobSlots.push({ job_code: r.job_code, time_slot: jsSlotToTimeStr(startSlotAbs + s, slotMinutes) }); });
+                        const report = Object.assign({}, result.report, { unfilled_job_slots: unfilledJobSlots });
+                        window.lastGeneratedReport = report;
+                        displayResults(result.schedule, report, schedulePeriod, 'intervals', result.unfilled);
+                    } else {
+                        window.lastGeneratedReport = result.report;
+                        displayResults(result.solution_grid, result.report, schedulePeriod);
+                    }
+                },
+                error: (result) => {
+                    finishLoading();
+                    showError(`排班求解過程中發生錯誤: ${result.error || result.status || '未知後端錯誤'}`);
+                }
+            });
+            finishLoading();
         } catch (error) {
-            clearTimeout(scheduleTimer); scheduleTimer = null; clearInterval(timerDisplayInterval);
-            if (loadingIndicator) loadingIndicator.style.display = 'none';
+            finishLoading();
+            if (error.name === 'AbortError') return; // 超時處理已顯示錯誤
             showError(`網絡或請求錯誤: ${error.message}。如果問題持續，請嘗試放寬約束條件。`);
             console.error("Fetch error:", error);
         }
     }
 
+    // 逐塊讀取 Server-Sent Events 響應 (fetch 支持 POST 請求體，EventSource 不支持)，按事件名調用 handlers
+    async function readScheduleStream(response, handlers) {
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const message = buffer.slice(0, boundary); buffer = buffer.slice(boundary + 2);
+                let eventName = 'message'; const dataLines = [];
+                message.split('\n').forEach(line => {
+                    if (line.startsWith('event:')) eventName = line.slice(6).trim();
+                    else if (line.startsWith('data:')) dataLines.push(line.slice(5).trim());
+                });
+                if (dataLines.length === 0 || !handlers[eventName]) continue; // 註釋行 (keep-alive) 等
+                try { handlers[eventName](JSON.parse(dataLines.join('\n'))); }
+                catch (e) { console.error(`處理 ${eventName} 事件出錯:`, e); }
+            }
+        }
+    }
+
     function clearResultContainers() {
         if (resultStatusDiv) resultStatusDiv.textContent = '';
         if (gridContainer) gridContainer.innerHTML = '';
@@ -431,15 +521,18 @@ document.addEventListener('DOMContentLoaded', () => {
         if (unfilledSection) unfilledSection.style.display = 'none';
     }
 
-    function displayResults(solutionGrid, report, schedulePeriodStr) {
+    function displayResults(solutionGrid, report, schedulePeriodStr, format = 'grid', unfilledRanges = null) {
          const status = report.status || "未知";
+         const slotMinutes = report.slot_duration_minutes || 30;
          if (resultStatusDiv) {
             resultStatusDiv.textContent = `求解狀態: ${status}`; resultStatusDiv.className = '';
             if (status === "OPTIMAL" || status === "FEASIBLE") resultStatusDiv.classList.add('optimal');
             else if (status.includes("INFEASIBLE")) resultStatusDiv.classList.add('infeasible');
          }
          const isSuccess = status === "OPTIMAL" || status === "FEASIBLE";
-         const gridHtml = formatGridAsTable(solutionGrid, report.unfilled_job_slots || [], schedulePeriodStr, status);
+         const gridHtml = format === 'intervals'
+             ? formatGridAsTable(solutionGrid, unfilledRanges || [], schedulePeriodStr, status, 'intervals', slotMinutes)
+             : formatGridAsTable(solutionGrid, report.unfilled_job_slots || [], schedulePeriodStr, status, 'grid', slotMinutes);
          if (gridContainer) gridContainer.innerHTML = gridHtml;
 
          if (report.employee_stats && report.employee_stats.length > 0 && employeeStatsContainer) {
@@ -451,7 +544,7 @@ document.addEventListener('DOMContentLoaded', () => {
          if (unfilledDetailsContainer && unfilledSection) {
             if (report.unfilled_job_slots && report.unfilled_job_slots.length > 0) {
                 const sortedUnfilledSlots = [...report.unfilled_job_slots].sort((a, b) => {
-                    const slotA = jsTimeToSlot(a.time_slot); const slotB = jsTimeToSlot(b.time_slot);
+                    const slotA = jsTimeToSlot(a.time_slot, slotMinutes); const slotB = jsTimeToSlot(b.time_slot, slotMinutes);
                     if (slotA === null && slotB === null) return 0; if (slotA === null) return 1; if (slotB === null) return -1;
                     if (slotA === slotB) return a.job_code.localeCompare(b.job_code);
                     return slotA - slotB;
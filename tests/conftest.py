@@ -0,0 +1,5 @@
+# 項目模塊放在倉庫根目錄，測試從任何目錄運行時都要能導入
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,17 @@
+import contextlib
+import io
+
+from backend_api import ShiftSchedulerWithConstraints
+
+
+def _scheduler(schedule_period, break_period):
+    with contextlib.redirect_stdout(io.StringIO()): # 屏蔽建模時的調試輸出
+        return ShiftSchedulerWithConstraints(3, schedule_period, ["A 06:00-12:00"], 240, 30, True, break_period, 60)
+
+
+def test_period_crossing_midnight_within_a_day_has_one_break_window():
+    assert _scheduler("06:00-30:00", "05:00-07:00").break_windows == [(0, 2)]
+
+
+def test_multi_day_period_repeats_break_window_each_day():
+    assert _scheduler("06:00-54:00", "05:00-07:00").break_windows == [(0, 2), (46, 50), (94, 96)]
@@ -0,0 +1,16 @@
+import contextlib
+import io
+
+from backend_api import ShiftSchedulerWithConstraints
+from horizon import HorizonScheduler, repeat_daily
+
+
+def test_horizon_is_no_worse_than_monolithic_solve():
+    # 三天、人手剛好夠的實例：滾動窗口的未填補數不應多於一次性求解整個時段
+    args = (4, "07:00-70:00", repeat_daily(["A 07:00-21:00", "B 09:00-18:00"], 3), 240, 60, True, "12:00-15:00", 60)
+    with contextlib.redirect_stdout(io.StringIO()): # 屏蔽建模時的調試輸出
+        _, monolithic = ShiftSchedulerWithConstraints(*args).solve(time_limit_seconds=10)
+        _, rolling = HorizonScheduler(ShiftSchedulerWithConstraints(*args)).solve(time_limit_seconds=10)
+    assert monolithic["status"] == "OPTIMAL" and rolling["status"] in ("OPTIMAL", "FEASIBLE")
+    assert "violations" not in rolling
+    assert len(rolling["unfilled_job_slots"]) <= len(monolithic["unfilled_job_slots"])
@@ -0,0 +1,16 @@
+import time
+
+import solver_policy
+
+
+def test_time_limit_is_not_reduced_by_model_size():
+    assert solver_policy.time_limit_for(115.0) == (115.0, "time_limit")
+
+
+def test_deadline_caps_time_limit():
+    limit, cap = solver_policy.time_limit_for(115.0, time.time() + 10)
+    assert cap == "deadline" and limit < 10
+
+
+def test_time_limit_has_a_minimum():
+    assert solver_policy.time_limit_for(115.0, time.time()) == (solver_policy.MIN_TIME_LIMIT_SECONDS, "minimum")